@@ -0,0 +1,72 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.telegram_parser.models import KeywordGroup
+from apps.users.models import User
+
+
+class KeywordGroupFormTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='secret')
+        self.client.force_login(self.user)
+
+    def test_create_keeps_posted_values_on_keyword_error(self):
+        response = self.client.post(reverse('dashboard:create_keyword_group'), {
+            'name': 'Ремонт кухни',
+            'keywords': 'ремонт AND (кухня',
+            'use_query_syntax': 'on',
+            'use_stemming': 'on',
+            'fuzzy_max_distance': '2',
+            'notification_chat_id': '-100123',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(KeywordGroup.objects.exists())
+        self.assertContains(response, 'value="Ремонт кухни"')
+        self.assertContains(response, 'ремонт AND (кухня</textarea>')
+        self.assertContains(response, 'name="use_query_syntax" checked')
+        self.assertContains(response, 'name="use_stemming" checked')
+        self.assertContains(response, '<option value="2" selected>')
+        self.assertContains(response, 'value="-100123"')
+
+    def test_create_keeps_posted_values_without_keywords(self):
+        response = self.client.post(reverse('dashboard:create_keyword_group'), {'name': 'Ремонт кухни'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'value="Ремонт кухни"')
+        self.assertNotContains(response, 'name="is_active" checked')
+
+    def test_create_form_defaults(self):
+        response = self.client.get(reverse('dashboard:create_keyword_group'))
+
+        self.assertContains(response, 'name="is_active" checked')
+        self.assertContains(response, '<option value="0" selected>')
+        self.assertNotContains(response, 'name="use_query_syntax" checked')
+
+    def test_create_plain_group_accepts_operator_characters(self):
+        response = self.client.post(reverse('dashboard:create_keyword_group'), {
+            'name': 'Москва',
+            'keywords': 'Москва (центр)',
+            'is_active': 'on',
+        })
+
+        self.assertRedirects(response, reverse('dashboard:keyword_groups'), fetch_redirect_response=False)
+        group = KeywordGroup.objects.get()
+        self.assertEqual(group.keywords, ['Москва (центр)'])
+        self.assertFalse(group.use_query_syntax)
+
+    def test_edit_shows_posted_values_on_keyword_error(self):
+        group = KeywordGroup.objects.create(user=self.user, name='Ремонт', keywords=['ремонт'])
+
+        response = self.client.post(reverse('dashboard:edit_keyword_group', args=[group.id]), {
+            'name': 'Ремонт кухни',
+            'keywords': 'ремонт AND (кухня',
+            'use_query_syntax': 'on',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'value="Ремонт кухни"')
+        self.assertContains(response, 'ремонт AND (кухня</textarea>')
+        group.refresh_from_db()
+        self.assertEqual(group.name, 'Ремонт')
+        self.assertEqual(group.keywords, ['ремонт'])
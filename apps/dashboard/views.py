@@ -11,10 +11,46 @@ import json
 import logging
 
 from apps.telegram_parser.models import KeywordGroup, MonitoredChat, ProcessedMessage, BotStatus, GlobalChat, UserChatSettings, RawMessage, MessageTemplate, RejectedMessage, SentMessageHistory
+from apps.telegram_parser.keyword_query import KeywordQueryError, validate_keyword
+from apps.telegram_parser.keyword_regex import REGEX_PREFIX
 from apps.users.models import User
 logger = logging.getLogger(__name__)
 
 
+def _parse_keywords(keywords):
+    """Ключевые слова из формы: через запятую или с новой строки
+    
+    Строка с регулярным выражением (re:...) берется целиком - в ней могут быть запятые.
+    """
+    keywords_list = []
+    for line in keywords.splitlines():
+        line = line.strip()
+        if line.startswith(REGEX_PREFIX):
+            keywords_list.append(line)
+        else:
+            keywords_list.extend(kw.strip() for kw in line.split(',') if kw.strip())
+    return keywords_list
+
+
+def _parse_fuzzy_distance(value):
+    """Допустимые опечатки из формы (0-2)"""
+    try:
+        return min(max(int(value or 0), 0), 2)
+    except ValueError:
+        return 0
+
+
+def _keyword_errors(keywords_list, query_syntax):
+    """Синтаксические ошибки в выражениях ключевых слов"""
+    errors = []
+    for keyword in keywords_list:
+        try:
+            validate_keyword(keyword, query_syntax)
+        except KeywordQueryError as e:
+            errors.append(str(e))
+    return errors
+
+
 @login_required
 def statistics(request):
     """
@@ -149,9 +185,28 @@ def create_keyword_group(request):
         keywords = request.POST.get('keywords')
         ai_prompt = request.POST.get('ai_prompt', '')
         use_ai_filter = request.POST.get('use_ai_filter') == 'on'
+        use_stemming = request.POST.get('use_stemming') == 'on'
+        use_query_syntax = request.POST.get('use_query_syntax') == 'on'
+        fuzzy_max_distance = _parse_fuzzy_distance(request.POST.get('fuzzy_max_distance'))
         is_active = request.POST.get('is_active') == 'on'
         notification_chat_id = request.POST.get('notification_chat_id', '').strip()
         
+        # Введенные значения возвращаются в форму, если в них ошибка
+        context = {
+            'group': KeywordGroup(
+                user=request.user,
+                name=name or '',
+                use_stemming=use_stemming,
+                use_query_syntax=use_query_syntax,
+                fuzzy_max_distance=fuzzy_max_distance,
+                ai_prompt=ai_prompt,
+                use_ai_filter=use_ai_filter,
+                is_active=is_active,
+                notification_chat_id=notification_chat_id,
+            ),
+            'keywords_text': keywords or '',
+        }
+        
         if not name or not keywords:
             error_msg = 'Название и ключевые слова обязательны для заполнения.'
             
@@ -160,7 +215,7 @@ def create_keyword_group(request):
                 return JsonResponse({'success': False, 'message': error_msg})
             
             messages.error(request, error_msg)
-            return render(request, 'dashboard/create_keyword_group.html')
+            return render(request, 'dashboard/create_keyword_group.html', context)
         
         # Проверяем лимиты подписки - ВРЕМЕННО ОТКЛЮЧЕНО
         # current_groups = KeywordGroup.objects.filter(user=request.user).count()
@@ -177,13 +232,27 @@ def create_keyword_group(request):
         #     return redirect('dashboard:keyword_groups')
         
         # Парсим ключевые слова (разделенные запятыми или переносами строк)
-        keywords_list = [kw.strip() for kw in keywords.replace('\n', ',').split(',') if kw.strip()]
+        keywords_list = _parse_keywords(keywords)
+        
+        keyword_errors = _keyword_errors(keywords_list, use_query_syntax)
+        if keyword_errors:
+            error_msg = 'Ошибка в ключевых словах: ' + '; '.join(keyword_errors)
+            
+            # AJAX запрос
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({'success': False, 'message': error_msg})
+            
+            messages.error(request, error_msg)
+            return render(request, 'dashboard/create_keyword_group.html', context)
         
         # Создаем группу
         keyword_group = KeywordGroup.objects.create(
             user=request.user,
             name=name,
             keywords=keywords_list,
+            use_stemming=use_stemming,
+            use_query_syntax=use_query_syntax,
+            fuzzy_max_distance=fuzzy_max_distance,
             ai_prompt=ai_prompt,
             use_ai_filter=use_ai_filter,
             is_active=is_active,
@@ -199,7 +268,7 @@ def create_keyword_group(request):
         messages.success(request, success_msg)
         return redirect('dashboard:keyword_groups')
     
-    return render(request, 'dashboard/create_keyword_group.html')
+    return render(request, 'dashboard/create_keyword_group.html', {'group': KeywordGroup(), 'keywords_text': ''})
 
 
 @login_required
@@ -215,22 +284,40 @@ def edit_keyword_group(request, group_id):
         keywords = request.POST.get('keywords', '')
         ai_prompt = request.POST.get('ai_prompt', group.ai_prompt)
         use_ai_filter = request.POST.get('use_ai_filter') == 'on'
+        use_stemming = request.POST.get('use_stemming') == 'on'
+        use_query_syntax = request.POST.get('use_query_syntax') == 'on'
+        fuzzy_max_distance = _parse_fuzzy_distance(request.POST.get('fuzzy_max_distance'))
         is_active = request.POST.get('is_active') == 'on'
         notification_chat_id = request.POST.get('notification_chat_id', '').strip()
         
         # Парсим ключевые слова так же как при создании
         if keywords:
-            keywords_list = [kw.strip() for kw in keywords.replace('\n', ',').split(',') if kw.strip()]
+            keywords_list = _parse_keywords(keywords)
         else:
             keywords_list = group.keywords
         
+        # Введенные значения сразу в объект: при ошибке форма покажет их, а не сохраненные
         group.name = name
         group.keywords = keywords_list
+        group.use_stemming = use_stemming
+        group.use_query_syntax = use_query_syntax
+        group.fuzzy_max_distance = fuzzy_max_distance
         group.ai_prompt = ai_prompt
         group.use_ai_filter = use_ai_filter
         group.is_active = is_active
-        group.notification_chat_id = int(notification_chat_id) if notification_chat_id else None
+        group.notification_chat_id = notification_chat_id
         
+        keyword_errors = _keyword_errors(keywords_list, use_query_syntax)
+        if keyword_errors:
+            error_msg = 'Ошибка в ключевых словах: ' + '; '.join(keyword_errors)
+            
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({'success': False, 'message': error_msg})
+            
+            messages.error(request, error_msg)
+            return render(request, 'dashboard/edit_keyword_group.html', {'group': group})
+        
+        group.notification_chat_id = int(notification_chat_id) if notification_chat_id else None
         group.save()
         
         # Проверяем, является ли это AJAX запросом
@@ -5,7 +5,7 @@ from django.db.models import Count, Q
 from .models import (
     KeywordGroup, MonitoredChat, ProcessedMessage, BotStatus,
     GlobalChat, UserChatSettings, ChatRequest, MessageTemplate, RejectedMessage, SentMessageHistory,
-    ChatTag
+    ChatTag, ParserAccount, LeadClassifier
 )
 
 
@@ -17,13 +17,13 @@ class KeywordGroupAdmin(admin.ModelAdmin):
         'name', 'user', 'keywords_count', 'use_ai_filter', 
         'messages_count', 'is_active', 'created_at'
     ]
-    list_filter = ['use_ai_filter', 'is_active', 'created_at', 'user__subscription_plan']
+    list_filter = ['use_ai_filter', 'use_stemming', 'use_query_syntax', 'is_active', 'created_at', 'user__subscription_plan']
     search_fields = ['name', 'user__username', 'keywords']
     list_select_related = ['user']
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('user', 'name', 'keywords', 'is_active')
+            'fields': ('user', 'name', 'keywords', 'use_query_syntax', 'use_stemming', 'fuzzy_max_distance', 'is_active')
         }),
         ('AI настройки', {
             'fields': ('use_ai_filter', 'ai_prompt'),
@@ -118,7 +118,7 @@ class ProcessedMessageAdmin(admin.ModelAdmin):
     ]
     list_filter = [
         'notification_sent', 'quality_status', 
-        'dialog_started', 'sale_made', 'processed_at',
+        'dialog_started', 'sale_made', 'ai_cached', 'processed_at',
         'user__subscription_plan'
     ]
     search_fields = [
@@ -142,7 +142,7 @@ class ProcessedMessageAdmin(admin.ModelAdmin):
             'fields': ('message_text',)
         }),
         ('Результаты анализа', {
-            'fields': ('matched_keywords', 'ai_result', 'ai_score')
+            'fields': ('matched_keywords', 'ai_result', 'ai_score', 'ai_cached', 'duplicate_of')
         }),
         ('Статусы', {
             'fields': (
@@ -161,6 +161,8 @@ class ProcessedMessageAdmin(admin.ModelAdmin):
     )
     
     readonly_fields = ['processed_at', 'updated_at']
+    # Выпадающий список по всем сообщениям был бы огромным
+    raw_id_fields = ['duplicate_of']
     
     # Действия
     actions = ['mark_as_qualified', 'mark_as_unqualified', 'mark_dialog_started']
@@ -222,6 +224,38 @@ class ProcessedMessageAdmin(admin.ModelAdmin):
     mark_dialog_started.short_description = "Отметить что диалог начат"
 
 
+@admin.register(ParserAccount)
+class ParserAccountAdmin(admin.ModelAdmin):
+    """Админка для аккаунтов (шардов) мастер-парсера"""
+    
+    list_display = ['name', 'phone', 'is_active', 'connected_display', 'updated_at']
+    list_filter = ['is_active']
+    search_fields = ['name', 'phone']
+    
+    def connected_display(self, obj):
+        """Есть ли сохраненная сессия"""
+        return "🟢 Подключен" if obj.is_connected else "🔴 Нет сессии"
+    connected_display.short_description = 'Сессия'
+
+
+@admin.register(LeadClassifier)
+class LeadClassifierAdmin(admin.ModelAdmin):
+    """Админка для локальных классификаторов лидов (обучаются задачей train_lead_classifiers)"""
+    
+    list_display = [
+        'keyword_group', 'positive_samples', 'negative_samples',
+        'holdout_accuracy', 'holdout_coverage', 'is_active', 'trained_at'
+    ]
+    list_filter = ['is_active']
+    search_fields = ['keyword_group__name', 'keyword_group__user__username']
+    list_select_related = ['keyword_group', 'keyword_group__user']
+    exclude = ['feature_counts']
+    readonly_fields = [
+        'keyword_group', 'positive_samples', 'negative_samples',
+        'holdout_accuracy', 'holdout_coverage', 'trained_at'
+    ]
+
+
 @admin.register(BotStatus)
 class BotStatusAdmin(admin.ModelAdmin):
     """Админка для статуса бота"""
@@ -246,9 +280,13 @@ class BotStatusAdmin(admin.ModelAdmin):
             'fields': ('errors_count', 'last_error', 'last_error_at'),
             'classes': ('collapse',)
         }),
+        ('Метрики', {
+            'fields': ('metrics',),
+            'classes': ('collapse',)
+        }),
     )
     
-    readonly_fields = ['last_heartbeat']
+    readonly_fields = ['last_heartbeat', 'metrics']
     
     actions = ['restart_parser']
     
@@ -0,0 +1,117 @@
+"""
+Кэш ответов AI фильтра по содержимому
+
+Одно и то же объявление за минуты расходится по десяткам чатов, и каждая
+копия раньше стоила запроса к AI для каждого пользователя. Ответ зависит
+только от модели, промпта и текста, поэтому ключ - sha256 от них (текст в
+нормализованной форме). Кэш общий для всех воркеров (Django cache/Redis),
+записи живут AI_VERDICT_CACHE_TTL секунд, а их число ограничено
+AI_VERDICT_CACHE_MAX_ENTRIES: ключи пишутся в кольцо слотов, и новая
+запись вытесняет самую старую (FIFO).
+"""
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .text_normalization import normalize_text
+
+logger = logging.getLogger('telegram_parser')
+
+VERDICT_KEY = 'ai:verdict:{}'
+SLOT_KEY = 'ai:verdict:slot:{}'
+SEQUENCE_KEY = 'ai:verdict:seq'
+
+# Статистика кэша пишется в лог каждые N обращений
+STATS_LOG_EVERY = 100
+
+
+def verdict_key(text: str, prompt: str) -> str:
+    """Ключ ответа: хэш модели, промпта и нормализованного текста"""
+    payload = '\0'.join((settings.AI_MODEL, (prompt or '').strip(), normalize_text(text)))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AIVerdictCache:
+    """Общий для воркеров кэш (одобрено, ответ AI) с TTL и ограничением размера"""
+
+    def __init__(self):
+        # Статистика процесса
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.AI_VERDICT_CACHE_TTL > 0 and settings.AI_VERDICT_CACHE_MAX_ENTRIES > 0
+
+    def get_many(self, keys: List[str]) -> Dict[str, Tuple[bool, str]]:
+        """Найденные ответы {ключ: (одобрено, ответ)}"""
+        if not self.enabled or not keys:
+            return {}
+        try:
+            stored = cache.get_many([VERDICT_KEY.format(key) for key in keys])
+        except Exception as e:
+            # Кэш недоступен - работаем без него
+            self.errors += 1
+            logger.error(f"❌ AI verdict cache read failed: {e}")
+            return {}
+
+        found = {}
+        for key in set(keys):
+            verdict = stored.get(VERDICT_KEY.format(key))
+            if verdict is not None:
+                found[key] = tuple(verdict)
+        lookups = self.hits + self.misses
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        if (self.hits + self.misses) // STATS_LOG_EVERY > lookups // STATS_LOG_EVERY:
+            logger.info(f"🗄️ AI verdict cache stats: {self.get_stats()}")
+        return found
+
+    def get(self, key: str) -> Optional[Tuple[bool, str]]:
+        return self.get_many([key]).get(key)
+
+    def set(self, key: str, verdict: Tuple[bool, str]):
+        """Сохранить ответ, вытеснив самую старую запись кольца"""
+        if not self.enabled:
+            return
+        try:
+            try:
+                sequence = cache.incr(SEQUENCE_KEY)
+            except ValueError:
+                # Счетчика еще нет (первый запуск или очистка Redis)
+                cache.add(SEQUENCE_KEY, 0, timeout=None)
+                sequence = cache.incr(SEQUENCE_KEY)
+
+            slot = SLOT_KEY.format(sequence % settings.AI_VERDICT_CACHE_MAX_ENTRIES)
+            evicted = cache.get(slot)
+            if evicted and evicted != key:
+                cache.delete(VERDICT_KEY.format(evicted))
+                self.evictions += 1
+
+            ttl = settings.AI_VERDICT_CACHE_TTL
+            cache.set_many({VERDICT_KEY.format(key): list(verdict), slot: key}, timeout=ttl)
+            self.stores += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ AI verdict cache write failed: {e}")
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'errors': self.errors,
+        }
+
+
+# Глобальный экземпляр
+ai_verdict_cache = AIVerdictCache()
@@ -0,0 +1,308 @@
+"""
+Клиент AI фильтра (Grok через OpenAI-совместимый API)
+
+Один долгоживущий AsyncOpenAI на процесс поверх httpx.AsyncClient с
+пулом keep-alive соединений: TLS-рукопожатие платится один раз, дальше
+запросы идут по готовым соединениям. Клиент живет в собственном event
+loop в фоновом потоке, поэтому синхронный код (воркеры Celery, в том
+числе пул потоков) отправляет в него запросы, не блокируя друг друга, и
+много проверок идет параллельно. Loop создается лениво и пересоздается
+после fork (prefork-воркеры Celery).
+
+Проверки с одинаковым промптом, пришедшие в течение AI_BATCH_WAIT
+секунд, склеиваются в один запрос (до AI_BATCH_MAX_SIZE сообщений):
+модель возвращает JSON с ответом по каждому номеру. Если ответ пачки не
+разбирается, сообщения пачки проверяются по одному.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger('telegram_parser')
+
+APPROVE_ANSWERS = ('YES', 'Y', '1', 'TRUE', 'ДА')
+
+# Статистика пула пишется в лог каждые N запросов
+STATS_LOG_EVERY = 100
+
+SYSTEM_PROMPT_TEMPLATE = """
+{prompt}
+
+ВАЖНО: Ты должен ответить ТОЛЬКО словом "YES" или "NO".
+- YES - если сообщение соответствует критериям
+- NO - если сообщение НЕ соответствует критериям
+
+Не добавляй никаких пояснений, только YES или NO.
+"""
+
+
+BATCH_PROMPT_TEMPLATE = """
+{prompt}
+
+Тебе дано {count} сообщений, каждое начинается с номера в квадратных скобках.
+Для каждого сообщения реши, соответствует ли оно критериям.
+
+ВАЖНО: Ответь ТОЛЬКО JSON-объектом вида {{"1": "YES", "2": "NO", ...}},
+где ключи - номера всех {count} сообщений, а значения - "YES" или "NO".
+Не добавляй никаких пояснений.
+"""
+
+# Токенов ответа на одно сообщение пачки (ключ, значение, разделители)
+BATCH_TOKENS_PER_MESSAGE = 8
+
+_CODE_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+def build_messages(text: str, prompt: str) -> List[Dict[str, str]]:
+    """Сообщения чата для проверки одного текста"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT_TEMPLATE.format(prompt=prompt)},
+        {"role": "user", "content": f"Проверь это сообщение:\n\n{text}"},
+    ]
+
+
+def parse_verdict(answer: str) -> Tuple[bool, str]:
+    """Ответ модели -> (одобрено, нормализованный ответ)"""
+    result = (answer or '').strip().upper()
+    return result in APPROVE_ANSWERS, result
+
+
+def build_batch_messages(texts: List[str], prompt: str) -> List[Dict[str, str]]:
+    """Сообщения чата для проверки пачки текстов одним запросом"""
+    numbered = '\n\n'.join(f"[{number}] {text}" for number, text in enumerate(texts, 1))
+    return [
+        {"role": "system", "content": BATCH_PROMPT_TEMPLATE.format(prompt=prompt, count=len(texts))},
+        {"role": "user", "content": f"Проверь эти сообщения:\n\n{numbered}"},
+    ]
+
+
+def parse_batch_verdicts(answer: str, count: int) -> Optional[List[Tuple[bool, str]]]:
+    """JSON-ответ на пачку -> ответы по порядку, None если ответ не разобрался"""
+    try:
+        data = json.loads(_CODE_FENCE_RE.sub('', (answer or '').strip()))
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    verdicts = []
+    for number in range(1, count + 1):
+        value = data.get(str(number))
+        if not isinstance(value, str):
+            return None
+        verdicts.append(parse_verdict(value))
+    return verdicts
+
+
+class AIClient:
+    """Пул соединений к AI API с асинхронным интерфейсом и статистикой"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Промпт -> ожидающие пачки (текст, future) и таймер ее отправки
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+        # Статистика
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections_opened = 0
+        self._latencies = deque(maxlen=1000)
+        self.checks = 0
+        self.batch_requests = 0
+        self.batched_checks = 0
+        self.batch_fallbacks = 0
+        self._started_at = time.monotonic()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Запустить loop и клиент в фоновом потоке (один раз на процесс)"""
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                # После fork поток родителя не существует - начинаем заново
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='ai-client-loop', daemon=True).start()
+                try:
+                    asyncio.run_coroutine_threadsafe(self._create_client(), loop).result()
+                except Exception:
+                    loop.call_soon_threadsafe(loop.stop)
+                    raise
+                self._loop = loop
+                self._pid = os.getpid()
+                self._pending = {}
+                self._timers = {}
+                logger.info(
+                    f"🤖 AI client started: pool of {settings.AI_MAX_CONNECTIONS} connections, "
+                    f"keep-alive {settings.AI_KEEPALIVE_EXPIRY}s"
+                )
+        return self._loop
+
+    async def _create_client(self):
+        import httpx
+        from openai import AsyncOpenAI
+
+        async def on_request(request):
+            # Трассировка httpcore сообщает о каждом новом TCP-соединении
+            request.extensions['trace'] = self._trace
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.AI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AI_MAX_CONNECTIONS,
+                keepalive_expiry=settings.AI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.AI_TIMEOUT, connect=10.0),
+            event_hooks={'request': [on_request]},
+        )
+        self._client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=http_client,
+            max_retries=settings.AI_MAX_RETRIES,
+        )
+        self._semaphore = asyncio.Semaphore(settings.AI_MAX_CONNECTIONS)
+
+    async def _trace(self, event_name: str, info: Dict):
+        if event_name == 'connection.connect_tcp.complete':
+            self.connections_opened += 1
+
+    async def _request(self, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        """Один запрос chat completion через пул, возвращает текст ответа"""
+        async with self._semaphore:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            started = time.monotonic()
+            try:
+                response = await self._client.chat.completions.create(
+                    model=settings.AI_MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.3,
+                )
+                return response.choices[0].message.content
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                self.requests += 1
+                self._latencies.append(time.monotonic() - started)
+                if self.requests % STATS_LOG_EVERY == 0:
+                    logger.info(f"🤖 AI client stats: {self.get_stats()}")
+
+    async def _check_single(self, text: str, prompt: str) -> Tuple[bool, str]:
+        return parse_verdict(await self._request(build_messages(text, prompt), max_tokens=10))
+
+    async def check(self, text: str, prompt: str) -> Tuple[bool, str]:
+        """Проверить текст промптом группы (корутина в loop клиента)
+
+        Проверка ставится в пачку своего промпта и ждет ее ответа.
+        """
+        if settings.AI_BATCH_MAX_SIZE <= 1:
+            verdict = await self._check_single(text, prompt)
+            self.checks += 1
+            return verdict
+
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(prompt, [])
+        batch.append((text, future))
+        if len(batch) == 1:
+            self._timers[prompt] = asyncio.get_running_loop().call_later(
+                settings.AI_BATCH_WAIT, self._flush, prompt
+            )
+        if len(batch) >= settings.AI_BATCH_MAX_SIZE:
+            self._flush(prompt)
+        return await future
+
+    def _flush(self, prompt: str):
+        """Отправить накопленную пачку промпта (по размеру или по таймеру)"""
+        timer = self._timers.pop(prompt, None)
+        if timer:
+            timer.cancel()
+        batch = self._pending.pop(prompt, None)
+        if batch:
+            asyncio.get_running_loop().create_task(self._run_batch(prompt, batch))
+
+    async def _run_batch(self, prompt: str, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            if len(texts) == 1:
+                verdicts = [await self._check_single(texts[0], prompt)]
+            else:
+                self.batch_requests += 1
+                self.batched_checks += len(texts)
+                answer = await self._request(
+                    build_batch_messages(texts, prompt),
+                    max_tokens=BATCH_TOKENS_PER_MESSAGE * len(texts) + 16,
+                )
+                verdicts = parse_batch_verdicts(answer, len(texts))
+                if verdicts is None:
+                    # Ответ пачки не разобрался - проверяем по одному
+                    self.batch_fallbacks += 1
+                    logger.warning(f"⚠️ AI batch answer of {len(texts)} messages not parsed, falling back to single checks: '{(answer or '')[:200]}'")
+                    verdicts = await asyncio.gather(
+                        *(self._check_single(text, prompt) for text in texts), return_exceptions=True
+                    )
+        except Exception as e:
+            verdicts = [e] * len(texts)
+
+        for (_, future), verdict in zip(batch, verdicts):
+            if future.done():
+                continue
+            if isinstance(verdict, Exception):
+                future.set_exception(verdict)
+            else:
+                self.checks += 1
+                future.set_result(verdict)
+
+    def check_many(self, items: List[Tuple[str, str]]) -> List[Tuple[bool, str]]:
+        """Проверить пачку (текст, промпт) параллельно
+
+        Возвращает ответы в порядке items; ошибка отдельного запроса
+        возвращается на его месте как исключение.
+        """
+        if not items:
+            return []
+        loop = self._ensure_started()
+
+        async def run_all():
+            return await asyncio.gather(*(self.check(text, prompt) for text, prompt in items), return_exceptions=True)
+
+        return asyncio.run_coroutine_threadsafe(run_all(), loop).result()
+
+    def get_stats(self) -> Dict:
+        latencies = sorted(self._latencies)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'connections_opened': self.connections_opened,
+            'connection_reuse': round(1 - self.connections_opened / self.requests, 3) if self.requests else 0.0,
+            'latency_avg_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            'latency_p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else None,
+            'checks': self.checks,
+            'checks_per_request': round(self.checks / self.requests, 2) if self.requests else None,
+            'checks_per_second': round(self.checks / (time.monotonic() - self._started_at), 2),
+            'batch_requests': self.batch_requests,
+            'avg_batch_size': round(self.batched_checks / self.batch_requests, 1) if self.batch_requests else None,
+            'batch_fallbacks': self.batch_fallbacks,
+        }
+
+
+# Глобальный экземпляр (один пул соединений на процесс)
+ai_client = AIClient()
@@ -7,5 +7,6 @@ class TelegramParserConfig(AppConfig):
     verbose_name = 'Telegram Parser'
     
     def ready(self):
-        """Import tasks when app is ready"""
-        import apps.telegram_parser.tasks
\ No newline at end of file
+        """Import tasks and signals when app is ready"""
+        import apps.telegram_parser.tasks
+        import apps.telegram_parser.signals  # noqa
\ No newline at end of file
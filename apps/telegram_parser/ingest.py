@@ -0,0 +1,724 @@
+"""
+Вспомогательные компоненты ingest-пути мастер-парсера
+"""
+import asyncio
+import hashlib
+import heapq
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from asgiref.sync import sync_to_async
+from django.db import DataError, IntegrityError, close_old_connections
+from django.utils import timezone
+
+from .models import RawMessage
+from .tasks import process_message_batch_task, process_message_task
+
+logger = logging.getLogger('telegram_parser')
+
+
+def assign_shard(chat_id: int, shard_names) -> Optional[str]:
+    """Детерминированно выбрать шард для чата (rendezvous hashing)
+    
+    При добавлении или удалении шарда переезжают только чаты, которые
+    принадлежали удаленному шарду или достаются новому.
+    """
+    if not shard_names:
+        return None
+    return max(
+        shard_names,
+        key=lambda name: hashlib.md5(f"{name}:{chat_id}".encode()).digest()
+    )
+
+
+class BatchBuffer:
+    """Буфер с пакетным сбросом по размеру или по возрасту старейшего элемента
+    
+    Наследники определяют _prepare() (преобразование элемента при добавлении)
+    и _write() (запись пачки). _write() может вернуть элементы, которые не
+    удалось записать; исключение означает, что не записана вся пачка.
+    
+    on_flushed (если задан) вызывается с успешно записанными элементами.
+    
+    Незаписанные элементы возвращаются в начало буфера, следующая попытка -
+    не раньше чем через экспоненциальную паузу (RETRY_BASE_DELAY * 2^n, не
+    больше RETRY_MAX_DELAY). Пока запись не проходит, буфер растет до
+    max_pending элементов, сверх этого вытесняются самые старые (dropped).
+    """
+
+    RETRY_BASE_DELAY = 1.0
+    RETRY_MAX_DELAY = 30.0
+
+    def __init__(
+        self,
+        max_size: int = 200,
+        max_age: float = 2.0,
+        max_pending: int = 20000,
+        on_flushed: Optional[Callable[[List[Any]], None]] = None
+    ):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_pending = max(max_pending, max_size)
+        self.on_flushed = on_flushed
+        self._items: List[Any] = []
+        self._first_added_at = None
+        self._lock = asyncio.Lock()
+        # Неудачные попытки записи подряд и время, раньше которого не повторяем
+        self._failures = 0
+        self._retry_at = 0.0
+
+        # Статистика для тюнинга
+        self.flush_count = 0
+        self.total_flushed = 0
+        self.failed_count = 0
+        self.dropped = 0
+        self.last_flush_size = 0
+        self.last_flush_duration = 0.0
+        self.max_flush_duration = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Количество элементов, ожидающих сброса"""
+        return len(self._items)
+
+    @property
+    def is_backing_off(self) -> bool:
+        """Идет пауза после неудачной записи"""
+        return time.monotonic() < self._retry_at
+
+    @property
+    def is_stale(self) -> bool:
+        """Пора сбрасывать: старейший элемент ждет дольше max_age и нет паузы после ошибки"""
+        return (
+            self._first_added_at is not None
+            and time.monotonic() - self._first_added_at >= self.max_age
+            and not self.is_backing_off
+        )
+
+    async def add(self, item):
+        """Добавить элемент в буфер (при переполнении - сразу сбросить)"""
+        if not self._items:
+            self._first_added_at = time.monotonic()
+        self._items.append(self._prepare(item))
+        self._trim()
+
+        if len(self._items) >= self.max_size:
+            await self.flush(force=False)
+
+    async def flush(self, force: bool = True) -> int:
+        """Сбросить накопленные элементы одной пачкой, вернуть число записанных
+        
+        force=False - не пытаться, пока идет пауза после неудачной записи.
+        """
+        async with self._lock:
+            if not self._items or (not force and self.is_backing_off):
+                return 0
+
+            items, self._items = self._items, []
+            first_added_at, self._first_added_at = self._first_added_at, None
+            started = time.monotonic()
+
+            try:
+                failed = list(await self._write(items) or [])
+            except Exception as e:
+                failed = items
+                logger.error(f"{self.__class__.__name__}: failed to flush {len(items)} items: {e}")
+
+            if failed:
+                self._requeue(failed, first_added_at)
+            else:
+                self._failures = 0
+                self._retry_at = 0.0
+
+            written = len(items) - len(failed)
+            if not written:
+                return 0
+            if self.on_flushed:
+                failed_ids = {id(item) for item in failed}
+                self.on_flushed([item for item in items if id(item) not in failed_ids])
+
+            duration = time.monotonic() - started
+            self.flush_count += 1
+            self.total_flushed += written
+            self.last_flush_size = written
+            self.last_flush_duration = duration
+            self.max_flush_duration = max(self.max_flush_duration, duration)
+
+            logger.debug(f"{self.__class__.__name__}: flushed {written} items in {duration * 1000:.1f} ms")
+            return written
+
+    async def close(self, attempts: int = 3) -> int:
+        """Финальный сброс при остановке: несколько попыток с паузами
+        
+        Возвращает число элементов, которые так и не удалось записать.
+        """
+        for attempt in range(attempts):
+            await self.flush()
+            if not self._items:
+                return 0
+            if attempt + 1 < attempts:
+                await asyncio.sleep(max(self._retry_at - time.monotonic(), 0))
+
+        left = len(self._items)
+        logger.error(f"{self.__class__.__name__}: {left} items could not be flushed on close")
+        return left
+
+    def _requeue(self, items: List[Any], first_added_at: Optional[float]):
+        """Вернуть незаписанные элементы в начало буфера и назначить паузу"""
+        self.failed_count += len(items)
+        self._failures += 1
+        delay = min(self.RETRY_BASE_DELAY * 2 ** (self._failures - 1), self.RETRY_MAX_DELAY)
+        self._retry_at = time.monotonic() + delay
+        self._items = items + self._items
+        self._first_added_at = first_added_at if first_added_at is not None else time.monotonic()
+        self._trim()
+        logger.warning(
+            f"{self.__class__.__name__}: {len(items)} items returned to buffer, "
+            f"retry in {delay:.0f}s (attempt {self._failures})"
+        )
+
+    def _trim(self):
+        """Вытеснить самые старые элементы сверх max_pending"""
+        overflow = len(self._items) - self.max_pending
+        if overflow > 0:
+            del self._items[:overflow]
+            self.dropped += overflow
+            logger.error(f"{self.__class__.__name__}: buffer over {self.max_pending} items, dropped {overflow} oldest")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики буфера"""
+        return {
+            'depth': self.depth,
+            'flush_count': self.flush_count,
+            'total_flushed': self.total_flushed,
+            'failed_count': self.failed_count,
+            'dropped': self.dropped,
+            'consecutive_failures': self._failures,
+            'last_flush_size': self.last_flush_size,
+            'last_flush_ms': round(self.last_flush_duration * 1000, 1),
+            'max_flush_ms': round(self.max_flush_duration * 1000, 1),
+        }
+
+    def _prepare(self, item):
+        return item
+
+    async def _write(self, items) -> Optional[List[Any]]:
+        raise NotImplementedError
+
+
+class RawMessageBuffer(BatchBuffer):
+    """Буфер сырых сообщений с пакетной записью через bulk_create"""
+
+    def _prepare(self, message_data: Dict[str, Any]):
+        """Собрать (несохраненный) объект RawMessage из данных сообщения"""
+        # Парсим дату
+        message_date = timezone.now()
+        if message_data.get('date'):
+            try:
+                message_date = datetime.fromisoformat(message_data['date'].replace('Z', '+00:00'))
+            except ValueError:
+                pass
+
+        return RawMessage(
+            message_id=message_data['message_id'],
+            chat_id=message_data['chat_id'],
+            chat_name=message_data.get('chat_title', '') or '',
+            sender_id=message_data.get('sender_id'),
+            sender_name=message_data.get('sender_name', '') or '',
+            sender_username=message_data.get('sender_username', '') or '',
+            message_text=message_data.get('text', ''),
+            message_date=message_date,
+            is_channel_post=message_data.get('is_channel_post', False),
+        )
+
+    @sync_to_async
+    def _write(self, items):
+        # Соединение, сломанное прошлой ошибкой (обрыв, рестарт БД), открываем заново
+        close_old_connections()
+        try:
+            RawMessage.objects.bulk_create(items, batch_size=self.max_size)
+            return None
+        except (DataError, IntegrityError) as e:
+            logger.warning(f"RawMessageBuffer: bulk insert of {len(items)} rows failed ({e}), saving one by one")
+
+        # Пачку ломает конкретная строка - пишем по одной и теряем только ее
+        for index, item in enumerate(items):
+            try:
+                item.save()
+            except (DataError, IntegrityError) as e:
+                self.dropped += 1
+                logger.error(f"RawMessageBuffer: dropped raw message {item.message_id} from chat {item.chat_id}: {e}")
+            except Exception as e:
+                logger.error(f"RawMessageBuffer: failed to save raw messages: {e}")
+                return items[index:]
+        return None
+
+
+class MessageBatchDispatcher(BatchBuffer):
+    """Группирует сообщения в пачки и отправляет их одной Celery-задачей
+    
+    Если пачку поставить в очередь не удалось, сообщения отправляются по
+    одному (process_message_task); не ушедшие возвращаются в буфер и
+    уходят со следующей попыткой.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.single_fallbacks = 0
+
+    @sync_to_async(thread_sensitive=False)
+    def _write(self, items):
+        try:
+            process_message_batch_task.delay(items)
+            return None
+        except Exception as e:
+            logger.warning(f"MessageBatchDispatcher: batch of {len(items)} messages not queued ({e}), sending one by one")
+
+        self.single_fallbacks += 1
+        for index, item in enumerate(items):
+            try:
+                process_message_task.delay(item)
+            except Exception as e:
+                # Брокер недоступен - остальные сообщения тоже не уйдут, повторим позже
+                logger.error(f"MessageBatchDispatcher: failed to queue message {item.get('message_id')}: {e}")
+                return items[index:]
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats['single_fallbacks'] = self.single_fallbacks
+        return stats
+
+
+class HighWaterTracker:
+    """High-water marks чатов только по доставленным сообщениям
+    
+    Сообщение регистрируется при постановке в ingest-пайплайн (start) и
+    отмечается, когда его пачка ушла в Celery (done). Отметка чата -
+    наибольший ID, до которого доставлены все зарегистрированные сообщения,
+    поэтому порядок обработки воркерами на нее не влияет, а потерянное или
+    еще не доставленное сообщение держит отметку ниже себя: после
+    перезапуска догрузка начнется с него. Повторная регистрация того же
+    сообщения (догрузка пересеклась с живым потоком) требует такого же
+    числа done.
+    
+    Если у чата накопилось больше max_pending недоставленных сообщений,
+    самые старые перестают держать отметку (abandoned).
+    """
+
+    def __init__(self, max_pending: int = 10000):
+        self.max_pending = max_pending
+        self._marks: Dict[int, int] = {}
+        # chat_id -> куча зарегистрированных ID и {ID: сколько раз еще ждем done}
+        self._heaps: Dict[int, List[int]] = {}
+        self._pending: Dict[int, Dict[int, int]] = {}
+        self._changed: Set[int] = set()
+        # Чаты, отметка которых поднялась с прошлого advance()
+        self._moved: Set[int] = set()
+        self.abandoned = 0
+
+    def load(self, marks: Dict[int, int]):
+        """Начальные отметки (из GlobalChat.last_message_id)"""
+        self._marks.update(marks)
+
+    def mark(self, chat_id: int) -> Optional[int]:
+        return self._marks.get(chat_id)
+
+    def start(self, chat_id: int, message_id: int):
+        """Сообщение принято в обработку"""
+        if message_id <= self._marks.get(chat_id, 0):
+            return
+        pending = self._pending.setdefault(chat_id, {})
+        if message_id in pending:
+            pending[message_id] += 1
+            return
+
+        heap = self._heaps.setdefault(chat_id, [])
+        heapq.heappush(heap, message_id)
+        pending[message_id] = 1
+        if len(heap) > self.max_pending:
+            # Уже доставленные и брошенные сообщения снимаем сразу, чтобы
+            # бросать самое старое из еще ожидающих
+            self._pop_delivered(chat_id, heap, pending)
+            while len(heap) > self.max_pending:
+                oldest = heap[0]
+                pending[oldest] = 0
+                self.abandoned += 1
+                logger.warning(f"⚠️ Chat {chat_id}: over {self.max_pending} undelivered messages, message {oldest} no longer holds high-water mark")
+                self._pop_delivered(chat_id, heap, pending)
+            self._changed.add(chat_id)
+
+    def done(self, chat_id: int, message_id: int):
+        """Сообщение доставлено (или его повтор отброшен)"""
+        pending = self._pending.get(chat_id)
+        if not pending or not pending.get(message_id):
+            return
+        pending[message_id] -= 1
+        if not pending[message_id]:
+            self._changed.add(chat_id)
+
+    def _pop_delivered(self, chat_id: int, heap: List[int], pending: Dict[int, int]):
+        """Снять с вершины кучи доставленные и брошенные сообщения, подняв отметку чата"""
+        while heap and not pending[heap[0]]:
+            message_id = heapq.heappop(heap)
+            del pending[message_id]
+            if message_id > self._marks.get(chat_id, 0):
+                self._marks[chat_id] = message_id
+                self._moved.add(chat_id)
+
+    def advance(self) -> Dict[int, int]:
+        """Сдвинуть отметки по доставленным сообщениям, вернуть изменившиеся {chat_id: отметка}"""
+        for chat_id in self._changed:
+            heap = self._heaps.get(chat_id, [])
+            self._pop_delivered(chat_id, heap, self._pending.get(chat_id, {}))
+            if not heap:
+                self._heaps.pop(chat_id, None)
+                self._pending.pop(chat_id, None)
+        self._changed.clear()
+        updated = {chat_id: self._marks[chat_id] for chat_id in self._moved}
+        self._moved.clear()
+        return updated
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'chats_pending': len(self._heaps),
+            'pending': sum(len(heap) for heap in self._heaps.values()),
+            'abandoned': self.abandoned,
+        }
+
+
+class EntityCache:
+    """Ограниченный LRU-кэш сущностей Telegram (чаты, отправители) с TTL
+    
+    Хранит только нужные ingest-пути поля, а не сами объекты Telethon.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, peer_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Получить сущность из кэша (None при промахе или истекшем TTL)"""
+        entry = self._entries.get(peer_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, data = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[peer_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(peer_id)
+        self.hits += 1
+        return data
+
+    def put(self, peer_id: Optional[int], entity) -> Dict[str, Any]:
+        """Положить сущность Telethon в кэш, вернуть сохраненные поля"""
+        data = self.describe(entity)
+        if peer_id is None:
+            return data
+
+        self._entries[peer_id] = (time.monotonic(), data)
+        self._entries.move_to_end(peer_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return data
+
+    def export(self) -> Dict[int, Dict[str, Any]]:
+        """Непросроченные записи кэша (для снапшота состояния)"""
+        now = time.monotonic()
+        return {
+            peer_id: data
+            for peer_id, (stored_at, data) in self._entries.items()
+            if now - stored_at <= self.ttl
+        }
+
+    def load(self, entries: Dict[int, Dict[str, Any]]):
+        """Заполнить кэш ранее сохраненными записями"""
+        now = time.monotonic()
+        for peer_id, data in entries.items():
+            self._entries[peer_id] = (now, data)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def describe(entity) -> Dict[str, Any]:
+        """Извлечь из сущности поля, используемые в message_data"""
+        return {
+            'title': getattr(entity, 'title', '') or '',
+            'username': getattr(entity, 'username', '') or '',
+            'first_name': getattr(entity, 'first_name', '') or '',
+            'last_name': getattr(entity, 'last_name', '') or '',
+            'broadcast': bool(getattr(entity, 'broadcast', False)),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class StatusCounters:
+    """Счетчики парсера, накапливаемые в памяти между сбросами в BotStatus"""
+
+    def __init__(self, history_size: int = 120):
+        self.pending_processed = 0
+        self.pending_errors = 0
+        self.last_error = ''
+        self.last_error_at = None
+        # История скоростей по интервалам сброса: (время, сообщений/с, ошибок/с)
+        self.rates = deque(maxlen=history_size)
+        self._interval_started = time.monotonic()
+
+    def message_processed(self, count: int = 1):
+        self.pending_processed += count
+
+    def error(self, error_text: str):
+        self.pending_errors += 1
+        self.last_error = error_text[:1000]  # Ограничиваем длину
+        self.last_error_at = timezone.now()
+
+    def take(self) -> Dict[str, Any]:
+        """Забрать накопленные значения и закрыть текущий интервал"""
+        now = time.monotonic()
+        elapsed = max(now - self._interval_started, 1e-6)
+        snapshot = {
+            'processed': self.pending_processed,
+            'errors': self.pending_errors,
+            'last_error': self.last_error,
+            'last_error_at': self.last_error_at,
+            'interval': elapsed,
+        }
+        self.rates.append((
+            timezone.now().isoformat(),
+            round(self.pending_processed / elapsed, 2),
+            round(self.pending_errors / elapsed, 2),
+        ))
+
+        self.pending_processed = 0
+        self.pending_errors = 0
+        self.last_error = ''
+        self.last_error_at = None
+        self._interval_started = now
+        return snapshot
+
+    def restore(self, snapshot: Dict[str, Any]):
+        """Вернуть неудачно сброшенные значения обратно в счетчики"""
+        self.pending_processed += snapshot['processed']
+        self.pending_errors += snapshot['errors']
+        if snapshot['last_error'] and not self.last_error:
+            self.last_error = snapshot['last_error']
+            self.last_error_at = snapshot['last_error_at']
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Скорости за последний интервал и усредненные по истории"""
+        if not self.rates:
+            return {'messages_per_sec': 0.0, 'errors_per_sec': 0.0, 'avg_messages_per_sec': 0.0, 'peak_messages_per_sec': 0.0}
+
+        message_rates = [rate for _, rate, _ in self.rates]
+        return {
+            'messages_per_sec': self.rates[-1][1],
+            'errors_per_sec': self.rates[-1][2],
+            'avg_messages_per_sec': round(sum(message_rates) / len(message_rates), 2),
+            'peak_messages_per_sec': max(message_rates),
+        }
+
+
+class ParserSnapshot:
+    """Снапшот состояния парсера на диске для быстрого перезапуска
+    
+    Хранит данные сущностей из EntityCache и время последней успешной
+    проверки доступа к каждому чату.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def load(self) -> Dict[str, Any]:
+        """Прочитать снапшот (пустой при отсутствии или повреждении файла)"""
+        empty = {'entities': {}, 'chats': {}}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return empty
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read parser snapshot {self.path}: {e}")
+            return empty
+
+        if data.get('version') != self.VERSION:
+            return empty
+
+        # JSON хранит ключи строками
+        return {
+            'entities': {int(k): v for k, v in data.get('entities', {}).items()},
+            'chats': {int(k): v for k, v in data.get('chats', {}).items()},
+        }
+
+    def save(self, entities: Dict[int, Dict[str, Any]], chats: Dict[int, Dict[str, Any]]):
+        """Атомарно записать снапшот (через временный файл)"""
+        data = {
+            'version': self.VERSION,
+            'saved_at': timezone.now().isoformat(),
+            'entities': {str(k): v for k, v in entities.items()},
+            'chats': {str(k): v for k, v in chats.items()},
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class IngestPipeline:
+    """Ограниченная очередь asyncio с пулом воркеров между Telethon и обработкой
+    
+    Политики переполнения очереди:
+      block       - обработчик Telethon ждет место в очереди (backpressure)
+      drop_newest - новое сообщение отбрасывается
+      drop_oldest - из очереди вытесняется самое старое сообщение
+    """
+
+    OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        max_size: int = 5000,
+        workers: int = 4,
+        overflow: str = 'block'
+    ):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self._handler = handler
+        self.max_size = max_size
+        self.workers = workers
+        self.overflow = overflow
+        self.queue = None
+        self._worker_tasks = []
+        self._accepting = False
+
+        # Статистика
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def start(self):
+        """Создать очередь и запустить воркеры (внутри работающего event loop)"""
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self._worker_tasks = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.workers)
+        ]
+        self._accepting = True
+
+    async def put(self, item, wait: bool = False) -> bool:
+        """Поставить элемент в очередь согласно политике переполнения
+        
+        wait=True - ждать места в очереди при любой политике (догрузка
+        пропущенного не должна отбрасываться намеренно).
+        """
+        if not self._accepting:
+            self.rejected += 1
+            return False
+
+        entry = (time.monotonic(), item)
+        if self.overflow == 'block' or wait:
+            await self.queue.put(entry)
+        elif self.overflow == 'drop_newest':
+            try:
+                self.queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                logger.warning(f"⚠️ Ingest queue full ({self.max_size}), dropping new message")
+                return False
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(entry)
+                    break
+                except asyncio.QueueFull:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.dropped += 1
+                    logger.warning(f"⚠️ Ingest queue full ({self.max_size}), dropping oldest message")
+
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    async def _worker(self):
+        while True:
+            enqueued_at, item = await self.queue.get()
+            try:
+                self._wait_total += time.monotonic() - enqueued_at
+                await self._handler(item)
+            except Exception as e:
+                logger.error(f"❌ Ingest worker error: {e}")
+            finally:
+                self.processed += 1
+                self.queue.task_done()
+
+    async def drain(self, timeout: float = 30.0):
+        """Перестать принимать элементы, дождаться обработки очереди, остановить воркеры"""
+        if self.queue is None:
+            return
+
+        self._accepting = False
+        remaining = self.queue.qsize()
+        if remaining:
+            logger.info(f"⏳ Draining ingest queue: {remaining} messages")
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"❌ Ingest queue drain timed out, {self.queue.qsize()} messages left unprocessed")
+
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики пайплайна"""
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'capacity': self.max_size,
+            'workers': self.workers,
+            'overflow': self.overflow,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'avg_wait_ms': round(self._wait_total / self.processed * 1000, 1) if self.processed else 0.0,
+        }
@@ -0,0 +1,121 @@
+"""
+Нечеткий поиск ключевых слов (с опечатками)
+
+Для групп с fuzzy_max_distance > 0 фраза ключевого слова считается
+найденной, если в сообщении есть окно из того же числа слов на
+расстоянии Левенштейна не больше заданного. Кандидаты отбираются по
+триграммам: каждая правка портит не больше трех триграмм, поэтому окно
+должно разделять с фразой не меньше len(триграммы) - 3 * k триграмм.
+Точное расстояние считается только для прошедших фильтр, в полосе
+шириной 2k + 1.
+"""
+from typing import Dict, List, Set, Tuple
+
+from django.conf import settings
+
+Q = 3
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f'#{text}#'
+    return {padded[i:i + Q] for i in range(len(padded) - Q + 1)}
+
+
+def levenshtein_within(a: str, b: str, max_distance: int) -> bool:
+    """Расстояние Левенштейна между a и b не больше max_distance (ленточный алгоритм)"""
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+
+    infinity = max_distance + 1
+    previous = [j if j <= max_distance else infinity for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [infinity] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        low = max(1, i - max_distance)
+        high = min(len(b), i + max_distance)
+        row_min = current[0]
+        for j in range(low, high + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            current[j] = value if value <= max_distance else infinity
+            if current[j] < row_min:
+                row_min = current[j]
+        if row_min > max_distance:
+            return False
+        previous = current
+    return previous[len(b)] <= max_distance
+
+
+class FuzzyIndex:
+    """Инвертированный индекс триграмм по нечетким термам"""
+
+    def __init__(self, terms: List[Tuple[str, int, int]]):
+        # terms: (нормализованная фраза, допустимое расстояние, ID терма)
+        self._terms: Dict[int, Tuple[str, int, int, int]] = {}
+        self._index: Dict[str, List[int]] = {}
+        word_counts = set()
+        for text, max_distance, term_id in terms:
+            grams = trigrams(text)
+            # Минимум общих триграмм, при котором расстояние еще может уложиться в k
+            self._terms[term_id] = (text, max_distance, len(grams) - Q * max_distance, len(text.split()))
+            for gram in grams:
+                self._index.setdefault(gram, []).append(term_id)
+            word_counts.add(len(text.split()))
+        self._word_counts = tuple(sorted(word_counts))
+
+        # Статистика
+        self.candidates_checked = 0
+        self.matches = 0
+
+    def __len__(self):
+        return len(self._terms)
+
+    def search(self, normalized_text: str) -> Set[int]:
+        """ID нечетких термов, для которых в тексте нашлось похожее окно слов"""
+        found: Set[int] = set()
+        if not self._terms or not normalized_text:
+            return found
+
+        words = normalized_text.split()
+        for word_count in self._word_counts:
+            for start in range(len(words) - word_count + 1):
+                window = ' '.join(words[start:start + word_count])
+
+                shared: Dict[int, int] = {}
+                for gram in trigrams(window):
+                    for term_id in self._index.get(gram, ()):
+                        shared[term_id] = shared.get(term_id, 0) + 1
+
+                for term_id, count in shared.items():
+                    if term_id in found:
+                        continue
+                    text, max_distance, min_shared, term_words = self._terms[term_id]
+                    if count < min_shared or term_words != word_count:
+                        continue
+                    self.candidates_checked += 1
+                    if levenshtein_within(window, text, max_distance):
+                        found.add(term_id)
+                        self.matches += 1
+        return found
+
+    def get_stats(self) -> Dict:
+        return {
+            'terms': len(self._terms),
+            'candidates_checked': self.candidates_checked,
+            'matches': self.matches,
+        }
+
+
+def fuzzy_distance_for(text: str, max_distance: int) -> int:
+    """Допустимое расстояние для фразы
+
+    Короткие слова ищутся только точно; для остальных расстояние
+    ограничено так, чтобы после k правок оставалась хотя бы одна общая
+    триграмма - иначе фильтр по триграммам пропускал бы совпадения.
+    """
+    if len(text.replace(' ', '')) < settings.KEYWORD_FUZZY_MIN_LENGTH:
+        return 0
+    return min(max_distance, (len(trigrams(text)) - 1) // Q)
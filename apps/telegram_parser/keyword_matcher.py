@@ -0,0 +1,327 @@
+"""
+Глобальный матчер ключевых слов (автомат Ахо-Корасик)
+
+Один автомат строится из термов выражений всех активных групп всех
+пользователей. Каждый терм знает, каким группам он принадлежит, поэтому
+один проход по тексту сообщения находит совпадения сразу для всех групп;
+затем выражения групп-кандидатов вычисляются над множеством найденных
+термов (см. keyword_query.py).
+
+Термы групп с морфологическим поиском (use_stemming) хранятся как фразы
+из основ слов в хеш-индексе: основы слов сообщения считаются один раз,
+и каждая n-грамма основ проверяется одним обращением к словарю.
+Регулярные выражения ищутся одной склеенной альтернативой (keyword_regex.py),
+фразы групп с опечатками - через индекс триграмм (keyword_fuzzy.py) и
+точным вхождением через автомат.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Set, Tuple
+
+from .models import KeywordGroup
+from .routing import routing_table
+from . import stemming
+from .keyword_fuzzy import FuzzyIndex
+from .keyword_regex import RegexSet
+from .keyword_query import (
+    KeywordQueryError, compile_keyword, fuzzy_keyword, keyword_terms, parse_keyword, stem_keyword
+)
+from .text_normalization import get_normalized_text, normalize_text
+
+logger = logging.getLogger('telegram_parser')
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик для поиска множества подстрок за один проход"""
+
+    def __init__(self, patterns: Iterable[str]):
+        # Узел автомата: переходы, суффиксная ссылка и шаблоны, заканчивающиеся в узле
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.patterns: List[str] = []
+
+        for pattern in patterns:
+            self._add(pattern)
+        self._build_links()
+
+    def _add(self, pattern: str):
+        index = len(self.patterns)
+        self.patterns.append(pattern)
+
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = next_node
+        self._out[node].append(index)
+
+    def _build_links(self):
+        """Суффиксные ссылки обходом в ширину; выходы наследуются по ссылкам"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def search(self, text: str) -> Set[int]:
+        """Индексы всех шаблонов, встречающихся в тексте"""
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+    @property
+    def size(self) -> int:
+        return len(self._goto)
+
+
+class CompiledGroup:
+    """Скомпилированные выражения одной группы
+
+    Строки, которые истинны и без единого найденного терма (например,
+    "-аренда" или "NOT аренда"), работают как фильтры всей группы: группа
+    срабатывает, если истинна хотя бы одна обычная строка и все фильтры.
+    """
+
+    __slots__ = ('order', 'group', 'entries', 'filters')
+
+    def __init__(self, order: int, group: KeywordGroup):
+        self.order = order
+        self.group = group
+        self.entries: List[Tuple[str, Callable[[FrozenSet[int]], bool]]] = []
+        self.filters: List[Callable[[FrozenSet[int]], bool]] = []
+
+    def evaluate(self, found: FrozenSet[int]) -> List[str]:
+        """Сработавшие строки группы (пустой список - группа не сработала)"""
+        matched = [keyword for keyword, evaluate in self.entries if evaluate(found)]
+        if matched and all(evaluate(found) for evaluate in self.filters):
+            return matched
+        return []
+
+
+class CompiledKeywords:
+    """Скомпилированные структуры поиска одной ревизии групп
+
+    Собираются целиком и подменяются одной ссылкой, поэтому обработка
+    никогда не видит смесь старых и новых данных.
+    """
+
+    def __init__(self, groups, term_ids: Dict[Any, int], owners: Dict[int, Set[int]]):
+        # Нечеткий терм тоже ищется точным вхождением (в т.ч. внутри слова)
+        pattern_ids: Dict[str, List[int]] = {}
+        for key, term_id in term_ids.items():
+            if isinstance(key, str):
+                pattern_ids.setdefault(key, []).append(term_id)
+            elif key[0] == 'fuzzy':
+                pattern_ids.setdefault(key[1], []).append(term_id)
+        patterns = list(pattern_ids)
+        fuzzy_terms = [(key[1], key[2], term_id) for key, term_id in term_ids.items() if isinstance(key, tuple) and key[0] == 'fuzzy']
+        regexes = [(key[1], term_id) for key, term_id in term_ids.items() if isinstance(key, tuple) and key[0] == 'regex']
+
+        self.automaton = AhoCorasick(patterns)
+        # Индекс шаблона в автомате -> ID термов (точный и нечеткий терм могут делить шаблон)
+        self.pattern_terms: List[Tuple[int, ...]] = [tuple(pattern_ids[pattern]) for pattern in patterns]
+        # Фраза из основ -> ID терма и длины таких фраз (в словах)
+        self.stem_index: Dict[str, int] = {
+            key[1]: term_id for key, term_id in term_ids.items() if isinstance(key, tuple) and key[0] == 'stem'
+        }
+        self.stem_lengths: Tuple[int, ...] = tuple(sorted({len(phrase.split()) for phrase in self.stem_index}))
+        self.regex_set = RegexSet(regexes)
+        self.fuzzy_index = FuzzyIndex(fuzzy_terms)
+        # ID терма -> ID групп, где он встречается
+        self.owners: List[Tuple[int, ...]] = [tuple(owners.get(term_id, ())) for term_id in range(len(term_ids))]
+        self.groups: Dict[int, CompiledGroup] = groups
+
+    def find_terms(self, message_data: Dict[str, Any]) -> FrozenSet[int]:
+        """ID всех термов, найденных в сообщении"""
+        normalized_text = get_normalized_text(message_data)
+        if not normalized_text:
+            return frozenset()
+
+        pattern_terms = self.pattern_terms
+        found = {term_id for index in self.automaton.search(normalized_text) for term_id in pattern_terms[index]}
+        if len(self.fuzzy_index):
+            found |= self.fuzzy_index.search(normalized_text)
+        if self.stem_index:
+            stems = stemming.get_text_stems(message_data)
+            stem_index = self.stem_index
+            for length in self.stem_lengths:
+                for start in range(len(stems) - length + 1):
+                    term_id = stem_index.get(' '.join(stems[start:start + length]))
+                    if term_id is not None:
+                        found.add(term_id)
+        if len(self.regex_set):
+            # Регулярки работают по исходному тексту: цены, телефоны и т.п. без нормализации
+            found |= self.regex_set.search(
+                message_data.get('text') or '',
+                context=f"(message {message_data.get('message_id')} in chat {message_data.get('chat_id')})"
+            )
+        return frozenset(found)
+
+    def evaluate(self, found: FrozenSet[int]) -> Dict[int, List[Tuple[KeywordGroup, List[str]]]]:
+        """Вычислить выражения групп, в которых нашелся хотя бы один терм"""
+        if not found:
+            return {}
+
+        groups = self.groups
+        candidates = {group_id for term_id in found for group_id in self.owners[term_id]}
+
+        result: Dict[int, List[Tuple[KeywordGroup, List[str]]]] = {}
+        for group_id in sorted(candidates, key=lambda group_id: groups[group_id].order):
+            compiled = groups[group_id]
+            matched = compiled.evaluate(found)
+            if matched:
+                result.setdefault(compiled.group.user_id, []).append((compiled.group, matched))
+        return result
+
+
+class KeywordMatcher:
+    """Матчер ключевых слов всех активных групп
+
+    Группы берутся из таблицы маршрутизации; автомат перестраивается,
+    когда в ней меняется ревизия групп.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compiled = None
+        self._revision = None
+
+        # Статистика
+        self.rebuild_count = 0
+        self.last_rebuild_duration = 0.0
+
+    def refresh(self, force: bool = False) -> CompiledKeywords:
+        """Перестроить автомат, если группы ключевых слов изменились"""
+        routing_table.refresh()
+        if not force and self._revision == routing_table.groups_revision:
+            return self._compiled
+
+        with self._lock:
+            revision = routing_table.groups_revision
+            if force or self._revision != revision:
+                self._rebuild(revision)
+            return self._compiled
+
+    def _rebuild(self, revision):
+        started = time.monotonic()
+
+        groups = {}
+        term_ids: Dict[Any, int] = {}
+        owners: Dict[int, Set[int]] = {}
+        for order, group in enumerate(routing_table.groups()):
+            compiled = groups[group.id] = CompiledGroup(order, group)
+            # Без snowballstemmer такие группы ищут по подстроке, как обычные
+            stem_group = group.use_stemming and stemming.is_available()
+            for keyword in group.keywords or []:
+                if not isinstance(keyword, str):
+                    continue
+                try:
+                    node = parse_keyword(keyword, group.use_query_syntax)
+                except KeywordQueryError as e:
+                    # Старые записи без валидации: ищем строку как обычную фразу
+                    logger.warning(f"⚠️ Keyword group {group.id}: {e}, matching as plain text")
+                    normalized = normalize_text(keyword)
+                    if not normalized:
+                        continue
+                    node = ('term', normalized)
+
+                # Морфология важнее опечаток: в группе со стеммингом нечеткий поиск не применяется
+                if stem_group:
+                    node = stem_keyword(node, stemming.stem_phrase)
+                elif group.fuzzy_max_distance:
+                    node = fuzzy_keyword(node, group.fuzzy_max_distance)
+
+                evaluate = compile_keyword(node, term_ids)
+                if evaluate(frozenset()):
+                    compiled.filters.append(evaluate)
+                else:
+                    compiled.entries.append((keyword, evaluate))
+                for term in keyword_terms(node):
+                    owners.setdefault(term_ids[term], set()).add(group.id)
+
+        self._compiled = compiled = CompiledKeywords(groups, term_ids, owners)
+        self._revision = revision
+
+        self.rebuild_count += 1
+        self.last_rebuild_duration = time.monotonic() - started
+        logger.info(
+            f"🔤 Keyword automaton rebuilt: {len(compiled.pattern_terms)} terms, "
+            f"{len(compiled.stem_index)} stem phrases, {len(compiled.regex_set)} regexes, "
+            f"{len(compiled.fuzzy_index)} fuzzy terms, {len(groups)} groups, "
+            f"{compiled.automaton.size} states in {self.last_rebuild_duration * 1000:.1f}ms"
+        )
+
+    def match(self, message_data: Dict[str, Any]) -> Dict[int, List[Tuple[KeywordGroup, List[str]]]]:
+        """Совпадения по всем группам: {user_id: [(группа, [сработавшие строки])]}
+
+        Нормализованный текст и основы слов берутся из message_data (и
+        кэшируются в нем). Вычисляются только группы, в которых нашелся
+        хотя бы один терм.
+        Группы пользователя идут в порядке выборки KeywordGroup, строки -
+        в том порядке, в котором они заданы в группе.
+        """
+        if not (message_data.get('text') or '').strip():
+            return {}
+        compiled = self.refresh()
+        return compiled.evaluate(compiled.find_terms(message_data))
+
+    def match_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[int, List[Tuple[KeywordGroup, List[str]]]]]:
+        """Совпадения для пачки сообщений (результаты в том же порядке)
+
+        Структуры поиска берутся один раз на пачку, а одинаковые тексты
+        (рассылки одного и того же объявления по чатам) ищутся один раз.
+        """
+        compiled = self.refresh()
+        by_text: Dict[str, Dict[int, List[Tuple[KeywordGroup, List[str]]]]] = {}
+        results = []
+        for message_data in messages:
+            text = message_data.get('text') or ''
+            if not text.strip():
+                results.append({})
+                continue
+            if text not in by_text:
+                by_text[text] = compiled.evaluate(compiled.find_terms(message_data))
+            results.append(by_text[text])
+        return results
+
+    def get_stats(self) -> Dict:
+        compiled = self._compiled
+        if compiled is None:
+            return {'rebuild_count': 0}
+        return {
+            'terms': len(compiled.owners),
+            'stem_phrases': len(compiled.stem_index),
+            'stem_cache': stemming.get_stats(),
+            'regex': compiled.regex_set.get_stats(),
+            'fuzzy': compiled.fuzzy_index.get_stats(),
+            'groups': len(compiled.groups),
+            'states': compiled.automaton.size,
+            'rebuild_count': self.rebuild_count,
+            'last_rebuild_ms': round(self.last_rebuild_duration * 1000, 1),
+        }
+
+
+# Глобальный экземпляр матчера (один на процесс воркера)
+keyword_matcher = KeywordMatcher()
@@ -0,0 +1,226 @@
+"""
+Язык запросов для ключевых слов
+
+Каждая строка группы - выражение:
+    купить квартиру              фраза (подстрока, как раньше)
+    "ремонт под ключ"            фраза в кавычках
+    ремонт AND (ванная OR кухня) логические операторы (также & и |)
+    NOT аренда, -аренда          отрицание / минус-слово
+    купить квартиру -аренда      соседние элементы без оператора - AND
+    re:ищу .{0,20} поставщик     регулярное выражение (вся строка, см. keyword_regex.py)
+
+Операторы разбираются только в группах с включенным языком запросов
+(KeywordGroup.use_query_syntax). В остальных группах строка целиком - одна
+фраза, как раньше: "Москва (центр)", "rock&roll", "a|b" или "-20%" не
+меняют смысл. Регулярные выражения (re:) работают в обоих режимах.
+Выражение компилируется один раз в функцию над множеством ID найденных
+термов.
+"""
+import re
+from typing import Any, Callable, Dict, FrozenSet, List, Tuple
+
+from .keyword_fuzzy import fuzzy_distance_for
+from .keyword_regex import REGEX_PREFIX, validate_regex
+from .text_normalization import normalize_text
+
+Evaluator = Callable[[FrozenSet[int]], bool]
+
+# Узлы-термы: ('term', подстрока), ('stem', основы слов фразы через пробел),
+# ('regex', регулярное выражение) или ('fuzzy', фраза, допустимое расстояние)
+_TERM_KINDS = ('term', 'stem', 'regex', 'fuzzy')
+
+_TOKEN_RE = re.compile(r'"[^"]*"?|\(|\)|&|\||\S+?(?=[()&|"]|\s|$)|\S')
+
+
+class KeywordQueryError(ValueError):
+    """Синтаксическая ошибка в выражении ключевых слов"""
+
+
+def _tokenize(entry: str) -> List[Tuple[str, str]]:
+    tokens = []
+    for raw in _TOKEN_RE.findall(entry):
+        if raw.startswith('"'):
+            if len(raw) < 2 or not raw.endswith('"'):
+                raise KeywordQueryError(f"незакрытая кавычка в «{entry}»")
+            tokens.append(('phrase', raw[1:-1]))
+        elif raw in ('(', ')'):
+            tokens.append((raw, raw))
+        elif raw in ('AND', '&'):
+            tokens.append(('and', raw))
+        elif raw in ('OR', '|'):
+            tokens.append(('or', raw))
+        elif raw == 'NOT':
+            tokens.append(('not', raw))
+        elif raw.startswith('-') and len(raw) > 1:
+            tokens.append(('minus', raw[1:]))
+        else:
+            tokens.append(('word', raw))
+    return tokens
+
+
+class _Parser:
+    """Рекурсивный спуск: or := and (OR and)*, and := unary (AND? unary)*"""
+
+    def __init__(self, entry: str):
+        self.entry = entry
+        self.tokens = _tokenize(entry)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise KeywordQueryError("пустое выражение")
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise KeywordQueryError(f"лишний «{self.tokens[self.pos][1]}» в «{self.entry}»")
+        return node
+
+    def _or(self):
+        children = [self._and()]
+        while self._peek() == 'or':
+            self._next()
+            children.append(self._and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def _and(self):
+        children = [self._unary()]
+        while self._peek() in ('and', 'not', 'minus', 'phrase', 'word', '('):
+            if self._peek() == 'and':
+                self._next()
+            children.append(self._unary())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def _unary(self):
+        kind = self._peek()
+        if kind == 'not':
+            self._next()
+            return ('not', self._unary())
+        if kind == 'minus':
+            return ('not', self._term(self._next()[1]))
+        return self._atom()
+
+    def _atom(self):
+        kind = self._peek()
+        if kind == '(':
+            self._next()
+            node = self._or()
+            if self._peek() != ')':
+                raise KeywordQueryError(f"незакрытая скобка в «{self.entry}»")
+            self._next()
+            return node
+        if kind == 'phrase':
+            return self._term(self._next()[1])
+        if kind == 'word':
+            # Соседние слова - одна фраза (совместимость с обычными ключевыми словами)
+            words = [self._next()[1]]
+            while self._peek() == 'word':
+                words.append(self._next()[1])
+            return self._term(' '.join(words))
+        found = self.tokens[self.pos][1] if kind else 'конец строки'
+        raise KeywordQueryError(f"ожидалось слово, а не «{found}» в «{self.entry}»")
+
+    def _term(self, text: str):
+        normalized = normalize_text(text)
+        if not normalized:
+            raise KeywordQueryError(f"пустой терм «{text}» в «{self.entry}»")
+        return ('term', normalized)
+
+
+def parse_keyword(entry: str, query_syntax: bool = True):
+    """Разобрать строку группы в дерево выражения
+
+    Узлы: ('term', текст), ('regex', выражение), ('and', [...]), ('or', [...]),
+    ('not', узел). Без query_syntax строка - одна фраза ('term').
+    """
+    if entry.startswith(REGEX_PREFIX):
+        pattern = entry[len(REGEX_PREFIX):].strip()
+        try:
+            validate_regex(pattern)
+        except ValueError as e:
+            raise KeywordQueryError(str(e))
+        return ('regex', pattern)
+    if not query_syntax:
+        normalized = normalize_text(entry)
+        if not normalized:
+            raise KeywordQueryError(f"пустая фраза «{entry}»")
+        return ('term', normalized)
+    return _Parser(entry).parse()
+
+
+def validate_keyword(entry: str, query_syntax: bool = True):
+    """Проверить синтаксис; бросает KeywordQueryError"""
+    parse_keyword(entry, query_syntax)
+
+
+def stem_keyword(node, stem_phrase: Callable[[str], str]):
+    """Заменить подстрочные термы на термы из основ слов (морфологический поиск)"""
+    kind = node[0]
+    if kind == 'term':
+        return ('stem', stem_phrase(node[1]))
+    if kind in _TERM_KINDS:
+        return node
+    if kind == 'not':
+        return ('not', stem_keyword(node[1], stem_phrase))
+    return (kind, [stem_keyword(child, stem_phrase) for child in node[1]])
+
+
+def fuzzy_keyword(node, max_distance: int):
+    """Разрешить опечатки в подстрочных термах (нечеткий поиск)"""
+    kind = node[0]
+    if kind == 'term':
+        distance = fuzzy_distance_for(node[1], max_distance)
+        return ('fuzzy', node[1], distance) if distance else node
+    if kind in _TERM_KINDS:
+        return node
+    if kind == 'not':
+        return ('not', fuzzy_keyword(node[1], max_distance))
+    return (kind, [fuzzy_keyword(child, max_distance) for child in node[1]])
+
+
+def term_key(node) -> Any:
+    """Ключ терма в общем словаре: строка для подстроки, сам узел для остальных видов"""
+    return node[1] if node[0] == 'term' else node
+
+
+def keyword_terms(node) -> List[Any]:
+    """Ключи всех термов выражения"""
+    if node[0] in _TERM_KINDS:
+        return [term_key(node)]
+    if node[0] == 'not':
+        return keyword_terms(node[1])
+    return [term for child in node[1] for term in keyword_terms(child)]
+
+
+def compile_keyword(node, term_ids: Dict[Any, int]) -> Evaluator:
+    """Скомпилировать дерево в функцию над множеством ID найденных термов
+
+    term_ids - общий словарь терм -> ID, новые термы в нем регистрируются.
+    И/ИЛИ над одними термами сводятся к одной операции над множествами.
+    """
+    kind = node[0]
+    if kind in _TERM_KINDS:
+        term_id = term_ids.setdefault(term_key(node), len(term_ids))
+        return lambda found: term_id in found
+
+    if kind == 'not':
+        inner = compile_keyword(node[1], term_ids)
+        return lambda found: not inner(found)
+
+    children = node[1]
+    if all(child[0] in _TERM_KINDS for child in children):
+        ids = frozenset(term_ids.setdefault(term_key(child), len(term_ids)) for child in children)
+        if kind == 'and':
+            return ids.issubset
+        return lambda found: not ids.isdisjoint(found)
+
+    evaluators = [compile_keyword(child, term_ids) for child in children]
+    if kind == 'and':
+        return lambda found: all(evaluate(found) for evaluate in evaluators)
+    return lambda found: any(evaluate(found) for evaluate in evaluators)
@@ -0,0 +1,120 @@
+"""
+Регулярные выражения в ключевых словах
+
+Строки группы вида "re:<выражение>" ищутся регуляркой по исходному
+тексту сообщения (без нормализации, без учета регистра). Все регулярки
+воркера склеиваются в одну альтернативу с именованными группами, по
+которым совпадение сопоставляется с термом. Поиск ограничен бюджетом
+времени на сообщение, чтобы одна катастрофическая регулярка не вешала
+воркер Celery.
+"""
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger('telegram_parser')
+
+REGEX_PREFIX = 're:'
+
+# Обратные ссылки по номеру в склеенной альтернативе указывали бы на чужие группы
+_BACKREF_RE = re.compile(r'\\[1-9]|\(\?P=|\(\?P<')
+
+try:
+    # Модуль regex умеет прерывать поиск по таймауту
+    import regex as _regex_engine
+    HAS_TIMEOUT = True
+except ImportError:
+    _regex_engine = re
+    HAS_TIMEOUT = False
+
+
+def _wrap(name: str, pattern: str) -> str:
+    # Lookahead нулевой длины: совпадения разных регулярок могут пересекаться
+    return f'(?=(?P<{name}>{pattern}))'
+
+
+def validate_regex(pattern: str):
+    """Проверить регулярку; бросает ValueError с понятным сообщением"""
+    if not pattern:
+        raise ValueError("пустое регулярное выражение")
+    if _BACKREF_RE.search(pattern):
+        raise ValueError(f"именованные группы и обратные ссылки не поддерживаются: «{pattern}»")
+    try:
+        # Проверяем в том виде, в котором регулярка попадет в общую альтернативу
+        _regex_engine.compile(_wrap('r0', pattern), re.IGNORECASE)
+    except Exception as e:
+        raise ValueError(f"ошибка в регулярном выражении «{pattern}»: {e}")
+
+
+class RegexSet:
+    """Набор регулярок, склеенный в одну альтернативу
+
+    Альтернатива на каждой позиции сообщает только первую сработавшую
+    регулярку, поэтому поиск повторяется проходами: найденные регулярки
+    исключаются, и следующий проход идет по оставшимся (скомпилированные
+    подмножества кэшируются).
+    """
+
+    def __init__(self, patterns: List[Tuple[str, int]]):
+        # Имя группы -> (регулярка, ID терма)
+        self._patterns: Dict[str, Tuple[str, int]] = {
+            f'r{index}': (pattern, term_id)
+            for index, (pattern, term_id) in enumerate(patterns)
+        }
+        self._compile = lru_cache(maxsize=64)(self._compile_names)
+
+        # Статистика
+        self.timeouts = 0
+        self.max_duration = 0.0
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def _compile_names(self, names: FrozenSet[str]):
+        alternation = '|'.join(_wrap(name, self._patterns[name][0]) for name in sorted(names))
+        return _regex_engine.compile(alternation, re.IGNORECASE)
+
+    def search(self, text: str, context: str = '') -> Set[int]:
+        """ID термов, чьи регулярки нашлись в тексте (в пределах бюджета времени)"""
+        found: Set[int] = set()
+        if not self._patterns or not text:
+            return found
+
+        budget = settings.KEYWORD_REGEX_TIME_BUDGET
+        started = time.monotonic()
+        remaining = frozenset(self._patterns)
+        try:
+            while remaining:
+                compiled = self._compile(remaining)
+                matched_names = set()
+                left = budget - (time.monotonic() - started)
+                if left <= 0:
+                    raise TimeoutError
+                matches = compiled.finditer(text, timeout=left) if HAS_TIMEOUT else compiled.finditer(text)
+                for match in matches:
+                    matched_names.add(match.lastgroup)
+                    # Без модуля regex бюджет проверяется только между совпадениями
+                    if time.monotonic() - started > budget:
+                        raise TimeoutError
+                if not matched_names:
+                    break
+                found.update(self._patterns[name][1] for name in matched_names)
+                remaining = remaining - matched_names
+        except TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"⏱️ Regex keywords exceeded {budget * 1000:.0f}ms budget {context}, partial result used")
+
+        self.max_duration = max(self.max_duration, time.monotonic() - started)
+        return found
+
+    def get_stats(self) -> Dict:
+        return {
+            'patterns': len(self._patterns),
+            'timeouts': self.timeouts,
+            'max_ms': round(self.max_duration * 1000, 1),
+            'engine': 'regex' if HAS_TIMEOUT else 're',
+        }
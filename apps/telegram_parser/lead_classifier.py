@@ -0,0 +1,233 @@
+"""
+Локальный предклассификатор лидов по оценкам пользователей
+
+Пользователи размечают лиды кнопками Квал / Неквал / Спам в боте и в
+дашборде (ProcessedMessage.quality_status). Периодическая задача обучает
+по этой разметке наивный байесовский классификатор на каждую группу с
+AI фильтром: признаки - хэши слов и пар слов нормализованного текста
+(бинарные, как в binarized multinomial NB). Уверенные оценки
+(>= AI_CLASSIFIER_APPROVE_THRESHOLD или <= AI_CLASSIFIER_REJECT_THRESHOLD)
+решают без запроса к Grok, в AI уходит только неуверенная середина.
+
+Классификатор включается, только если на отложенной выборке его
+уверенные ответы совпали с разметкой не реже AI_CLASSIFIER_MIN_ACCURACY.
+"""
+import logging
+import math
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from .text_normalization import normalize_text
+
+logger = logging.getLogger('telegram_parser')
+
+POSITIVE_STATUSES = ('qualified',)
+NEGATIVE_STATUSES = ('unqualified', 'spam')
+
+# Размер пространства хэшей признаков
+FEATURE_BITS = 18
+_FEATURE_MASK = (1 << FEATURE_BITS) - 1
+
+# Каждый N-й размеченный пример идет в отложенную выборку
+HOLDOUT_EVERY = 5
+
+# Сглаживание Лапласа
+ALPHA = 1.0
+
+# Статистика пишется в лог каждые N оценок
+STATS_LOG_EVERY = 100
+
+
+def extract_features(text: str) -> Set[str]:
+    """Хэши слов и пар соседних слов нормализованного текста"""
+    words = normalize_text(text).split()
+    grams = words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+    return {str(zlib.crc32(gram.encode('utf-8')) & _FEATURE_MASK) for gram in grams}
+
+
+def count_features(samples: List[Tuple[Set[str], bool]]) -> Tuple[Dict[str, List[int]], int, int]:
+    """Частоты признаков {признак: [в квал, в неквал]} и число примеров по классам"""
+    feature_counts: Dict[str, List[int]] = {}
+    positive = negative = 0
+    for features, label in samples:
+        if label:
+            positive += 1
+        else:
+            negative += 1
+        for feature in features:
+            counts = feature_counts.setdefault(feature, [0, 0])
+            counts[0 if label else 1] += 1
+    return feature_counts, positive, negative
+
+
+class NaiveBayesModel:
+    """Обученная модель: вероятность, что сообщение - квалифицированный лид"""
+
+    def __init__(self, feature_counts: Dict[str, List[int]], positive_samples: int, negative_samples: int):
+        total_positive = sum(counts[0] for counts in feature_counts.values())
+        total_negative = sum(counts[1] for counts in feature_counts.values())
+        vocabulary = max(len(feature_counts), 1)
+        positive_norm = math.log(total_positive + ALPHA * vocabulary)
+        negative_norm = math.log(total_negative + ALPHA * vocabulary)
+
+        self.prior = math.log((positive_samples + ALPHA) / (negative_samples + ALPHA))
+        # Вес незнакомого признака: разница нормировок классов
+        self.default_weight = negative_norm - positive_norm
+        self.weights = {
+            feature: (math.log(positive + ALPHA) - positive_norm) - (math.log(negative + ALPHA) - negative_norm)
+            for feature, (positive, negative) in feature_counts.items()
+        }
+
+    def probability_of(self, features: Set[str]) -> float:
+        logit = self.prior + sum(self.weights.get(feature, self.default_weight) for feature in features)
+        # Ограничиваем, чтобы exp не переполнялся
+        logit = max(-50.0, min(50.0, logit))
+        return 1.0 / (1.0 + math.exp(-logit))
+
+    def probability(self, text: str) -> float:
+        return self.probability_of(extract_features(text))
+
+
+def decide(score: Optional[float]) -> Optional[bool]:
+    """Уверенное решение по оценке: True/False, None - нужна проверка AI"""
+    if score is None:
+        return None
+    if score >= settings.AI_CLASSIFIER_APPROVE_THRESHOLD:
+        return True
+    if score <= settings.AI_CLASSIFIER_REJECT_THRESHOLD:
+        return False
+    return None
+
+
+def train(samples: List[Tuple[int, str, bool]]) -> Dict:
+    """Обучить модель по [(id сообщения, текст, квал?)]
+
+    Сначала модель обучается без отложенной выборки и проверяется на ней,
+    затем переобучается на всех примерах. Возвращает поля LeadClassifier.
+    """
+    featured = [(message_id, extract_features(text), label) for message_id, text, label in samples]
+    train_set = [(features, label) for message_id, features, label in featured if message_id % HOLDOUT_EVERY]
+    holdout = [(features, label) for message_id, features, label in featured if not message_id % HOLDOUT_EVERY]
+
+    confident = correct = 0
+    if train_set and holdout:
+        model = NaiveBayesModel(*count_features(train_set))
+        for features, label in holdout:
+            decision = decide(model.probability_of(features))
+            if decision is not None:
+                confident += 1
+                correct += decision == label
+
+    feature_counts, positive, negative = count_features([(features, label) for _, features, label in featured])
+    # Признаки, встретившиеся один раз, почти ничего не дают, а модель раздувают
+    feature_counts = {feature: counts for feature, counts in feature_counts.items() if sum(counts) > 1}
+
+    holdout_accuracy = correct / confident if confident else None
+    is_active = (
+        positive >= settings.AI_CLASSIFIER_MIN_SAMPLES
+        and negative >= settings.AI_CLASSIFIER_MIN_SAMPLES
+        and holdout_accuracy is not None
+        and holdout_accuracy >= settings.AI_CLASSIFIER_MIN_ACCURACY
+    )
+    return {
+        'feature_counts': feature_counts,
+        'positive_samples': positive,
+        'negative_samples': negative,
+        'holdout_accuracy': holdout_accuracy,
+        'holdout_coverage': confident / len(holdout) if holdout else None,
+        'is_active': is_active,
+    }
+
+
+class LeadClassifiers:
+    """Активные модели групп в памяти процесса (перечитываются периодически)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[int, NaiveBayesModel] = {}
+        self._loaded_at = 0.0
+
+        # Статистика
+        self.predictions = 0
+        self.approved = 0
+        self.rejected = 0
+
+    def _refresh(self):
+        if time.monotonic() - self._loaded_at < settings.AI_CLASSIFIER_RELOAD_INTERVAL:
+            return
+        with self._lock:
+            if time.monotonic() - self._loaded_at < settings.AI_CLASSIFIER_RELOAD_INTERVAL:
+                return
+            from .models import LeadClassifier
+
+            try:
+                self._models = {
+                    row['keyword_group_id']: NaiveBayesModel(
+                        row['feature_counts'], row['positive_samples'], row['negative_samples']
+                    )
+                    for row in LeadClassifier.objects.filter(is_active=True).values(
+                        'keyword_group_id', 'feature_counts', 'positive_samples', 'negative_samples'
+                    )
+                }
+                logger.info(f"🧮 Loaded {len(self._models)} lead classifiers")
+            except Exception as e:
+                # Остаемся со старыми моделями, следующая попытка - через интервал
+                logger.error(f"❌ Failed to load lead classifiers: {e}")
+            self._loaded_at = time.monotonic()
+
+    def predict(self, keyword_group_id: int, text: str) -> Optional[float]:
+        """Вероятность квал-лида по модели группы, None - модели нет"""
+        if not settings.AI_CLASSIFIER_ENABLED:
+            return None
+        self._refresh()
+        model = self._models.get(keyword_group_id)
+        if model is None:
+            return None
+        return model.probability(text)
+
+    def decide(self, score: Optional[float]) -> Optional[bool]:
+        decision = decide(score)
+        if score is not None:
+            self.predictions += 1
+            if decision is True:
+                self.approved += 1
+            elif decision is False:
+                self.rejected += 1
+            if self.predictions % STATS_LOG_EVERY == 0:
+                logger.info(f"🧮 Lead classifier stats: {self.get_stats()}")
+        return decision
+
+    def get_stats(self) -> Dict:
+        confident = self.approved + self.rejected
+        return {
+            'models': len(self._models),
+            'predictions': self.predictions,
+            'approved': self.approved,
+            'rejected': self.rejected,
+            'skip_rate': round(confident / self.predictions, 3) if self.predictions else 0.0,
+        }
+
+
+def train_group(keyword_group) -> Optional[Dict]:
+    """Обучить и сохранить классификатор группы, None - нет разметки"""
+    from .models import LeadClassifier, ProcessedMessage
+
+    labeled = ProcessedMessage.objects.filter(
+        keyword_group=keyword_group,
+        quality_status__in=POSITIVE_STATUSES + NEGATIVE_STATUSES,
+    ).values_list('id', 'message_text', 'quality_status')
+    samples = [(message_id, text, status in POSITIVE_STATUSES) for message_id, text, status in labeled]
+    if not samples:
+        return None
+
+    fields = train(samples)
+    LeadClassifier.objects.update_or_create(keyword_group=keyword_group, defaults=fields)
+    return fields
+
+
+# Глобальный экземпляр
+lead_classifiers = LeadClassifiers()
@@ -0,0 +1,34 @@
+"""
+Management команда для авторизации аккаунта (шарда) мастер-парсера
+"""
+import asyncio
+from django.core.management.base import BaseCommand, CommandError
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+from apps.telegram_parser.models import ParserAccount
+
+
+class Command(BaseCommand):
+    help = 'Интерактивно авторизует ParserAccount и сохраняет строку сессии'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Имя шарда (ParserAccount.name)')
+
+    def handle(self, *args, **options):
+        try:
+            account = ParserAccount.objects.get(name=options['name'])
+        except ParserAccount.DoesNotExist:
+            raise CommandError(f"Аккаунт парсера '{options['name']}' не найден")
+
+        async def authorize():
+            client = TelegramClient(StringSession(), account.api_id, account.api_hash)
+            # Telethon сам запросит код подтверждения (и пароль 2FA) в терминале
+            await client.start(phone=account.phone)
+            session_string = client.session.save()
+            await client.disconnect()
+            return session_string
+
+        account.session_string = asyncio.run(authorize())
+        account.save(update_fields=['session_string', 'updated_at'])
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Аккаунт {account.name} авторизован'))
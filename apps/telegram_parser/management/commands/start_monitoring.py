@@ -3,8 +3,8 @@ Management команда для запуска Telegram мониторинга
 """
 import asyncio
 import logging
-from django.core.management.base import BaseCommand
-from apps.telegram_parser.telegram_client import master_parser
+from django.core.management.base import BaseCommand, CommandError
+from apps.telegram_parser.telegram_client import master_parser, create_shard_parsers, run_parsers
 
 logger = logging.getLogger('telegram_parser')
 
@@ -12,12 +12,39 @@ logger = logging.getLogger('telegram_parser')
 class Command(BaseCommand):
     help = 'Запускает постоянный мониторинг Telegram чатов'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shard',
+            action='append',
+            dest='shards',
+            help='Запустить шард(ы) с указанным именем ParserAccount (можно повторять)'
+        )
+        parser.add_argument(
+            '--all-shards',
+            action='store_true',
+            help='Запустить все активные шарды (ParserAccount) в этом процессе'
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS('🚀 Запуск Telegram мониторинга...'))
+        shard_names = options.get('shards')
+        all_shards = options.get('all_shards')
+        
+        parsers = None
+        if shard_names or all_shards:
+            parsers = create_shard_parsers(shard_names)
+            if not parsers:
+                raise CommandError('Не найдено активных авторизованных аккаунтов парсера')
+            names = ', '.join(parser.shard_name for parser in parsers)
+            self.stdout.write(self.style.SUCCESS(f'🚀 Запуск Telegram мониторинга (шарды: {names})...'))
+        else:
+            self.stdout.write(self.style.SUCCESS('🚀 Запуск Telegram мониторинга...'))
         
         try:
             # Запускаем мониторинг
-            asyncio.run(master_parser.start_monitoring())
+            if parsers:
+                asyncio.run(run_parsers(parsers))
+            else:
+                asyncio.run(master_parser.start_monitoring())
         except KeyboardInterrupt:
             self.stdout.write(self.style.WARNING('\n⚠️  Получен сигнал остановки'))
         except Exception as e:
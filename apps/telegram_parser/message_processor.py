@@ -1,202 +1,463 @@
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, Tuple
 from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from .models import GlobalChat, UserChatSettings, KeywordGroup, ProcessedMessage, RejectedMessage
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import GlobalChat, KeywordGroup, ProcessedMessage, RejectedMessage
+from .ai_cache import ai_verdict_cache, verdict_key
+from .ai_client import ai_client
+from .keyword_matcher import keyword_matcher
+from .lead_classifier import lead_classifiers
+from .near_duplicates import near_duplicates
+from .routing import routing_table
 import telebot
 import re
 
 logger = logging.getLogger('telegram_parser')
 
 
+def make_verdict(
+    ai_approved: bool = True,
+    ai_result: str = "",
+    ai_cached: bool = False,
+    ai_score: Optional[float] = None,
+    duplicate_of_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Решение по совпадению - AI поля ProcessedMessage (по умолчанию - без AI фильтра)
+    
+    duplicate_of_id - запись оригинала, если решение взято у почти-дубликата.
+    """
+    return {
+        'ai_approved': ai_approved,
+        'ai_result': ai_result,
+        'ai_cached': ai_cached,
+        'ai_score': ai_score,
+        'duplicate_of_id': duplicate_of_id,
+    }
+
+
+def _describe_verdict(verdict: Dict[str, Any]) -> str:
+    source = ' (из кэша)' if verdict['ai_cached'] else ''
+    if verdict['ai_score'] is not None:
+        source += f" (оценка {verdict['ai_score']:.2f})"
+    return f"🤖 AI ответ: '{verdict['ai_result']}' | Одобрено: {verdict['ai_approved']}{source}"
+
+
 class MessageProcessor:
     """Процессор сообщений для всех пользователей"""
     
+    # Строк в одном INSERT ... ON CONFLICT (ограничение на число параметров запроса)
+    UPSERT_BATCH_SIZE = 500
+    
     def __init__(self):
         self.user_bots = {}  # Кэш пользовательских ботов
+        self.last_batch_stats = {}  # Статистика последней пачки process_messages()
     
-    def process_message(self, message_data: Dict[str, Any]) -> bool:
-        """Главная функция обработки сообщения"""
-        try:
-            chat_id = message_data['chat_id']
-            message_text = message_data.get('text', '')
-            
-            if not message_text.strip():
-                logger.debug(f"Skipping empty message {message_data.get('message_id')}")
-                return True
-            
-            # Находим всех пользователей, которые мониторят этот чат
-            interested_users = self._find_interested_users(chat_id)
-            
-            if not interested_users:
-                logger.debug(f"No users monitoring chat {chat_id}")
-                return True
-            
-            logger.info(f"Processing message {message_data.get('message_id')} for {len(interested_users)} users")
-            
-            # Обрабатываем для каждого пользователя
-            for user_data in interested_users:
-                self._process_for_user(user_data, message_data)
+    def process_messages(self, batch: List[Dict[str, Any]]) -> Dict[Tuple[int, int], List[Tuple[Dict, KeywordGroup, List[str]]]]:
+        """Сопоставление пачки сообщений без побочных эффектов (реплеи, догрузка, бэктесты)
+        
+        Нормализация, токенизация и поиск идут по общим скомпилированным
+        структурам, одинаковые тексты ищутся один раз. Возвращает
+        {(chat_id, message_id): [(user_data, группа, [ключевые слова])]} только
+        для сообщений, которые сработали у кого-то из пользователей чата.
+        Статистика пачки сохраняется в self.last_batch_stats.
+        """
+        started = time.monotonic()
+        
+        results = {}
+        matched_pairs = 0
+        for message_data, matches in zip(batch, keyword_matcher.match_batch(batch)):
+            if not matches:
+                continue
             
-            return True
+            message_matches = []
+            for user_data in self._find_interested_users(message_data['chat_id']):
+                for group, keywords in matches.get(user_data['user__id'], ()):
+                    message_matches.append((user_data, group, keywords))
             
-        except Exception as e:
-            logger.error(f"Error processing message {message_data.get('message_id')}: {e}")
-            return False
+            if message_matches:
+                results[(message_data['chat_id'], message_data['message_id'])] = message_matches
+                matched_pairs += len(message_matches)
+        
+        duration = time.monotonic() - started
+        self.last_batch_stats = {
+            'messages': len(batch),
+            'matched_messages': len(results),
+            'matches': matched_pairs,
+            'duration_ms': round(duration * 1000, 1),
+            'messages_per_second': round(len(batch) / duration, 1) if duration > 0 else None,
+        }
+        logger.info(
+            f"🔎 Matched batch of {len(batch)} messages: {len(results)} matched, "
+            f"{matched_pairs} user/group hits in {duration * 1000:.1f}ms "
+            f"({self.last_batch_stats['messages_per_second']} msg/s)"
+        )
+        return results
     
-    def _find_interested_users(self, chat_id: int) -> List[Dict]:
-        """Находим пользователей, которые мониторят данный чат через UserChatSettings"""
-        try:
-            # Находим глобальный чат
-            try:
-                global_chat = GlobalChat.objects.get(chat_id=chat_id, is_active=True)
-            except GlobalChat.DoesNotExist:
-                logger.debug(f"Chat {chat_id} not found in GlobalChat")
-                return []
-            
-            # Находим пользователей с включенным мониторингом этого чата
-            user_settings = UserChatSettings.objects.filter(
-                global_chat=global_chat,
-                is_enabled=True,
-                user__is_active=True
-            ).select_related('user', 'global_chat').values(
-                'user__id',
-                'user__username',
-                'user__notification_chat_id',  # Fallback для групп без своего chat_id
-                'global_chat__id',
-                'global_chat__name'
-            )
-            
-            return list(user_settings)
-            
-        except Exception as e:
-            logger.error(f"Error finding interested users for chat {chat_id}: {e}")
-            return []
+    def _duplicate_phases(self, messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Пачка в порядке обработки: сначала обычные сообщения, затем почти-дубликаты
+        
+        dispatch_batch() помечает копии недавних сообщений полем duplicate_of
+        (near_duplicates.py). Оригинал часто приходит в той же пачке, поэтому
+        дубликаты обрабатываются после сохранения остальных сообщений.
+        """
+        primary = [message_data for message_data in messages if not message_data.get('duplicate_of')]
+        duplicates = [message_data for message_data in messages if message_data.get('duplicate_of')]
+        return [phase for phase in (primary, duplicates) if phase]
     
-    def _process_for_user(self, user_data: Dict, message_data: Dict[str, Any]):
-        """Обрабатываем сообщение для конкретного пользователя"""
+    def _find_originals(
+        self,
+        messages: List[Dict[str, Any]],
+        results: Dict[Tuple[int, int], List[Tuple[Dict, Any, Any]]]
+    ) -> Dict[Tuple[int, int, int], Dict[str, Any]]:
+        """Решения оригиналов для почти-дубликатов одним запросом
+        
+        results - совпадения в формате process_messages(). Возвращает
+        {(user_id, message_id, chat_id) дубликата: make_verdict() из записи
+        оригинала этого пользователя}. Если у пользователя записи оригинала
+        нет (чат оригинала он не мониторит или она еще в очереди ai),
+        дубликат обрабатывается как обычное сообщение.
+        """
+        # (user_id, chat_id оригинала, message_id оригинала) -> ключи дубликатов
+        wanted = {}
+        for message_data in messages:
+            original = message_data.get('duplicate_of')
+            if not original:
+                continue
+            for user_data, _, _ in results.get((message_data['chat_id'], message_data['message_id']), ()):
+                user_id = user_data['user__id']
+                wanted.setdefault((user_id, original['chat_id'], original['message_id']), set()).add(
+                    (user_id, message_data['message_id'], message_data['chat_id'])
+                )
+        if not wanted:
+            return {}
+        
+        query = Q()
+        for chat_id, message_id in {(chat_id, message_id) for _, chat_id, message_id in wanted}:
+            query |= Q(chat_id=chat_id, message_id=message_id)
         try:
-            user_id = user_data['user__id']
-            message_text = message_data.get('text', '')
-            
-            # Получаем активные группы ключевых слов пользователя
-            keyword_groups = KeywordGroup.objects.filter(
-                user_id=user_id,
-                is_active=True
+            rows = ProcessedMessage.objects.filter(query, user_id__in={user_id for user_id, _, _ in wanted}).values(
+                'id', 'user_id', 'chat_id', 'message_id', 'ai_approved', 'ai_result', 'ai_score'
             )
-            
-            for group in keyword_groups:
-                matched_keywords = self._check_keywords(message_text, group.keywords)
-                
-                if matched_keywords:
-                    logger.info(f"Found keywords {matched_keywords} for user {user_id} in group {group.name}")
-                    
-                    # Проверяем AI фильтр если включен
-                    ai_approved = True
-                    ai_result = ""
-                    
-                    if group.use_ai_filter and group.ai_prompt:
-                        logger.info(f"🤖 AI проверка включена для группы '{group.name}' (user {user_id})")
-                        ai_approved, ai_result = self._check_ai_filter(message_text, group.ai_prompt)
-                        logger.info(f"🤖 AI ответ: '{ai_result}' | Одобрено: {ai_approved}")
-                    
-                    # Всегда сохраняем сообщение в ProcessedMessage
-                    logger.info(f"✅ Сообщение прошло проверку ключевых слов для user {user_id}")
-                    # Сохраняем в БД
-                    processed_msg = self._save_processed_message(
-                        user_data, group, message_data, matched_keywords, ai_result, ai_approved
+            verdicts = {}
+            for row in rows:
+                for key in wanted.get((row['user_id'], row['chat_id'], row['message_id']), ()):
+                    verdicts[key] = make_verdict(
+                        row['ai_approved'], row['ai_result'], ai_score=row['ai_score'], duplicate_of_id=row['id']
                     )
-                    
-                    # Отправляем уведомление только если AI одобрил (или AI не используется)
-                    if processed_msg and ai_approved:
-                        logger.info(f"📨 Отправка уведомления в Telegram для user {user_id}")
-                        self._send_notification(user_data, processed_msg, group)
-                        logger.info(f"✅ Уведомление отправлено для сообщения {processed_msg.id}")
-                    elif processed_msg and not ai_approved:
-                        logger.info(f"⚠️ Уведомление НЕ отправлено - AI отклонил сообщение {processed_msg.id}")
-                
         except Exception as e:
-            logger.error(f"Error processing message for user {user_data.get('user__id')}: {e}")
+            # Без оригиналов дубликаты просто обрабатываются как обычные сообщения
+            logger.error(f"❌ Failed to load originals of near-duplicates: {e}")
+            return {}
+        
+        if verdicts:
+            logger.info(f"♻️ Reusing verdicts of originals for {len(verdicts)} near-duplicate matches")
+        return verdicts
     
-    def _check_keywords(self, text: str, keywords: List[str]) -> List[str]:
-        """Проверяем наличие ключевых слов в тексте"""
-        if not text or not keywords:
-            return []
+    def _find_interested_users(self, chat_id: int) -> List[Dict]:
+        """Находим пользователей, которые мониторят данный чат через UserChatSettings
         
-        text_lower = text.lower()
-        matched = []
+        Данные берутся из таблицы маршрутизации процесса (routing.py).
+        """
+        routing_table.refresh()
+        return routing_table.users_for_chat(chat_id)
+    
+    def _persist_decisions(
+        self,
+        pending: List[Tuple[Dict, Dict[str, Any], List[Tuple[KeywordGroup, List[str], Dict[str, Any]]]]]
+    ) -> Tuple[Dict[Tuple[int, int, int], int], Dict[Tuple[int, int, int], Tuple[Dict, KeywordGroup]]]:
+        """Сохраняем решения одним запросом
         
-        for keyword in keywords:
-            if not keyword:
-                continue
-                
-            keyword_lower = keyword.lower().strip()
-            
-            # Простая проверка на вхождение
-            if keyword_lower in text_lower:
-                matched.append(keyword)
-            
-            # Можно добавить более сложную логику:
-            # - регулярные выражения
-            # - проверка по словам (word boundaries)
-            # - морфологический анализ
+        На пару (пользователь, сообщение) приходится одна запись
+        ProcessedMessage (unique_together): группа и ответ AI берутся из
+        первой сработавшей группы, ключевые слова объединяются. Возвращает
+        ({ключ: id записи}, {ключ: (user_data, первая одобренная группа)});
+        почти-дубликаты в одобренные не попадают - о них уже уведомляли.
+        """
+        rows = {}
+        approved = {}
+        for user_data, message_data, decisions in pending:
+            for group, matched_keywords, verdict in decisions:
+                key = (user_data['user__id'], message_data['message_id'], message_data['chat_id'])
+                if verdict['ai_approved'] and not verdict.get('duplicate_of_id'):
+                    approved.setdefault(key, (user_data, group))
+                row = rows.get(key)
+                if row is None:
+                    rows[key] = {
+                        'user_data': user_data,
+                        'message_data': message_data,
+                        'keyword_group': group,
+                        'matched_keywords': list(matched_keywords),
+                        **verdict,
+                    }
+                else:
+                    row['matched_keywords'].extend(
+                        keyword for keyword in matched_keywords if keyword not in row['matched_keywords']
+                    )
+        
+        if not rows:
+            return {}, {}
+        return self._save_processed_messages(list(rows.values())), approved
+    
+    def dispatch_batch(self, messages: List[Dict[str, Any]]) -> int:
+        """Стадия match конвейера Celery, возвращает число отправленных дальше задач
+        
+        Сопоставление пачки, сохранение совпадений групп без AI фильтра одним
+        запросом и передача работы дальше: совпадения с AI фильтром уходят
+        в очередь ai (ai_check_task), одобренные записи - в очередь notify
+        (send_notification_task). Задачи ставятся только после успешного
+        сохранения, поэтому повтор стадии не дублирует запросы к AI.
+        """
+        from .tasks import ai_check_task, send_notification_task
         
-        return matched
+        results = self.process_messages(messages)
+        # Дубликаты ищутся только среди сработавших сообщений: решение
+        # берется у записи оригинала, а она есть только у совпадений
+        near_duplicates.mark_duplicates([
+            message_data for message_data in messages
+            if (message_data['chat_id'], message_data['message_id']) in results
+        ])
+        
+        saved_ids = {}
+        approved = {}
+        ai_jobs = []
+        # Почти-дубликаты с сохраненным оригиналом берут его решение без AI
+        for phase in self._duplicate_phases(messages):
+            originals = self._find_originals(phase, results)
+            pending = []
+            for message_data in phase:
+                for user_data, group, keywords in results.get((message_data['chat_id'], message_data['message_id']), ()):
+                    original = originals.get((user_data['user__id'], message_data['message_id'], message_data['chat_id']))
+                    if original:
+                        pending.append((user_data, message_data, [(group, keywords, original)]))
+                    elif group.use_ai_filter and group.ai_prompt:
+                        ai_jobs.append((self._stage_payload(message_data), user_data, group.id, keywords))
+                    else:
+                        pending.append((user_data, message_data, [(group, keywords, make_verdict())]))
+            
+            phase_ids, phase_approved = self._persist_decisions(pending)
+            saved_ids.update(phase_ids)
+            approved.update(phase_approved)
+        
+        for job in ai_jobs:
+            ai_check_task.delay(*job)
+        for key, (user_data, group) in approved.items():
+            if key in saved_ids:
+                send_notification_task.delay(saved_ids[key], group.id, user_data)
+        
+        if ai_jobs or approved:
+            logger.info(f"📤 Match stage: {len(ai_jobs)} AI checks, {len(approved)} notifications queued")
+        return len(ai_jobs) + len(approved)
+    
+    def run_ai_check(self, message_data: Dict[str, Any], user_data: Dict, keyword_group: KeywordGroup) -> Dict[str, Any]:
+        """Стадия ai конвейера: решение make_verdict() по совпадению"""
+        logger.info(f"🤖 AI проверка включена для группы '{keyword_group.name}' (user {user_data['user__id']})")
+        verdict = self._check_ai_filter(message_data.get('text', ''), keyword_group)
+        logger.info(_describe_verdict(verdict))
+        return verdict
     
-    def _check_ai_filter(self, text: str, prompt: str) -> tuple[bool, str]:
-        """Проверяем сообщение через AI (Grok)"""
+    def save_ai_verdict(
+        self,
+        message_data: Dict[str, Any],
+        user_data: Dict,
+        keyword_group: KeywordGroup,
+        matched_keywords: List[str],
+        verdict: Dict[str, Any]
+    ) -> Optional[int]:
+        """Стадия ai конвейера: сохранение совпадения с ответом AI, возвращает id записи"""
+        saved_ids, _ = self._persist_decisions(
+            [(user_data, message_data, [(keyword_group, matched_keywords, verdict)])]
+        )
+        return saved_ids.get((user_data['user__id'], message_data['message_id'], message_data['chat_id']))
+    
+    def deliver_notification(self, processed_message_id: int, keyword_group: KeywordGroup, user_data: Dict) -> bool:
+        """Стадия notify конвейера: идемпотентная отправка уведомления
+        
+        Запись атомарно захватывается по notification_sent=False, поэтому
+        повторы и параллельные задачи по одной записи не шлют дубликатов.
+        Ошибка отправки снимает захват и пробрасывается для повтора задачи.
+        """
+        claimed = ProcessedMessage.objects.filter(
+            id=processed_message_id, notification_sent=False
+        ).update(notification_sent=True)
+        if not claimed:
+            logger.info(f"Notification for processed message {processed_message_id} already sent, skipping")
+            return False
+        
         try:
-            from openai import OpenAI
-            from django.conf import settings
-            
+            processed_msg = ProcessedMessage.objects.select_related('global_chat').get(id=processed_message_id)
+            sent = self._send_notification(user_data, processed_msg, keyword_group, raise_errors=True)
+        except Exception:
+            ProcessedMessage.objects.filter(id=processed_message_id).update(notification_sent=False)
+            raise
+        
+        if not sent:
+            # Уведомление некуда отправить (нет токена или чата) - повтор не поможет
+            ProcessedMessage.objects.filter(id=processed_message_id).update(notification_sent=False)
+        return sent
+    
+    def _stage_payload(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Данные сообщения для передачи между стадиями (без кэшей поиска)"""
+        return {key: value for key, value in message_data.items() if key not in ('text_normalized', 'text_stems')}
+    
+    def _check_ai_filter(self, text: str, keyword_group: KeywordGroup) -> Dict[str, Any]:
+        """Проверяем сообщение AI фильтром группы, возвращает решение make_verdict()"""
+        return self._check_ai_filters([(text, keyword_group)])[0]
+    
+    def _check_ai_filters(self, items: List[Tuple[str, KeywordGroup]]) -> List[Dict[str, Any]]:
+        """Проверяем несколько (текст, группа) AI фильтром
+        
+        1. Локальный классификатор группы (lead_classifier.py): уверенные
+           оценки решают сами, без запроса к Grok.
+        2. Общий кэш ответов (ai_cache.py).
+        3. Оставшиеся уникальные пары - в Grok через пул ai_client
+           (ai_client.py), параллельно и пачками. Ошибки AI не кэшируются.
+        """
+        if not items:
+            return []
+        
+        verdicts: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        scores: List[Optional[float]] = [None] * len(items)
+        for index, (text, group) in enumerate(items):
+            score = scores[index] = lead_classifiers.predict(group.id, text)
+            decision = lead_classifiers.decide(score)
+            if decision is not None:
+                verdicts[index] = make_verdict(decision, f"LOCAL {'YES' if decision else 'NO'}", ai_score=score)
+        
+        remote = [index for index, verdict in enumerate(verdicts) if verdict is None]
+        keys = {index: verdict_key(items[index][0], items[index][1].ai_prompt) for index in remote}
+        cached = ai_verdict_cache.get_many(list(keys.values()))
+        if cached:
+            logger.info(f"🤖 AI ответ из кэша для {sum(1 for key in keys.values() if key in cached)} из {len(items)} проверок")
+        
+        # Уникальные промахи - в API
+        misses = {}
+        for index, key in keys.items():
+            if key not in cached and key not in misses:
+                misses[key] = (items[index][0], items[index][1].ai_prompt)
+        
+        for text, prompt in misses.values():
             logger.info(f"🤖 AI проверка сообщения: '{text[:100]}...'")
-            
-            # Создаем клиент для Grok API
-            client = OpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_BASE_URL
-            )
-            
-            # Формируем системный промт
-            system_prompt = f"""
-{prompt}
-
-ВАЖНО: Ты должен ответить ТОЛЬКО словом "YES" или "NO".
-- YES - если сообщение соответствует критериям
-- NO - если сообщение НЕ соответствует критериям
-
-Не добавляй никаких пояснений, только YES или NO.
-"""
-            
             logger.info(f"🤖 AI промт: '{prompt[:100]}...'")
+        
+        answers = {}
+        for key, answer in zip(misses, ai_client.check_many(list(misses.values()))):
+            if isinstance(answer, Exception):
+                logger.error(f"❌ AI filter error: {answer}")
+                # При ошибке AI пропускаем сообщение (не блокируем)
+                answers[key] = (True, f"AI filter error: {str(answer)}")
+                continue
             
-            # Отправляем запрос к Grok
-            response = client.chat.completions.create(
-                model="grok-3-mini",  # Grok модель
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Проверь это сообщение:\n\n{text}"}
-                ],
-                max_tokens=10,
-                temperature=0.3
-            )
-            
-            # Получаем результат
-            result = response.choices[0].message.content.strip().upper()
+            is_approved, result = answer
             logger.info(f"🤖 AI ответил: '{result}'")
-            
-            # Проверяем ответ
-            is_approved = result in ['YES', 'Y', '1', 'TRUE', 'ДА']
-            
             logger.info(f"🤖 Решение: {'ОДОБРЕНО ✅' if is_approved else 'ОТКЛОНЕНО ❌'}")
-            
-            return is_approved, result
-            
-        except Exception as e:
-            logger.error(f"❌ AI filter error: {e}")
-            # При ошибке AI пропускаем сообщение (не блокируем)
-            return True, f"AI filter error: {str(e)}"
+            ai_verdict_cache.set(key, answer)
+            answers[key] = answer
+        
+        for index, key in keys.items():
+            if key in cached:
+                verdicts[index] = make_verdict(*cached[key], ai_cached=True, ai_score=scores[index])
+            else:
+                verdicts[index] = make_verdict(*answers[key], ai_score=scores[index])
+        return verdicts
+    
+    def _save_processed_messages(self, rows: List[Dict[str, Any]]) -> Dict[Tuple[int, int, int], int]:
+        """Сохраняем совпадения одним запросом, возвращает {(user_id, message_id, chat_id): id записи}
+        
+        В PostgreSQL - INSERT ... ON CONFLICT (user_id, message_id, chat_id):
+        новые записи вставляются, у существующих matched_keywords дополняются
+        недостающими словами прямо в БД. GlobalChat берется по
+        user_data['global_chat__id'] без запроса. На других СУБД - по одной
+        записи через _save_processed_message().
+        """
+        if connection.vendor != 'postgresql':
+            saved_ids = {}
+            for row in rows:
+                processed_msg = self._save_processed_message(
+                    row['user_data'], row['keyword_group'], row['message_data'],
+                    row['matched_keywords'], row['ai_result'], row['ai_approved'], row['ai_cached'], row['ai_score'],
+                    row.get('duplicate_of_id')
+                )
+                if processed_msg:
+                    saved_ids[(processed_msg.user_id, processed_msg.message_id, processed_msg.chat_id)] = processed_msg.id
+            return saved_ids
+        
+        meta = ProcessedMessage._meta
+        fields = [field for field in meta.concrete_fields if not field.primary_key]
+        table = connection.ops.quote_name(meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+        
+        saved_ids = {}
+        created = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.UPSERT_BATCH_SIZE):
+                chunk = rows[start:start + self.UPSERT_BATCH_SIZE]
+                params = []
+                for row in chunk:
+                    processed_msg = self._build_processed_message(row)
+                    # pre_save заполняет auto_now поля, get_db_prep_save готовит JSON и т.п.
+                    params.extend(
+                        field.get_db_prep_save(field.pre_save(processed_msg, True), connection)
+                        for field in fields
+                    )
+                
+                cursor.execute(
+                    f"""
+                    INSERT INTO {table} ({columns})
+                    VALUES {', '.join([placeholders] * len(chunk))}
+                    ON CONFLICT (user_id, message_id, chat_id) DO UPDATE SET
+                        matched_keywords = {table}.matched_keywords || COALESCE((
+                            SELECT jsonb_agg(keyword)
+                            FROM jsonb_array_elements(EXCLUDED.matched_keywords) AS keyword
+                            WHERE NOT {table}.matched_keywords @> jsonb_build_array(keyword)
+                        ), '[]'::jsonb)
+                    RETURNING id, user_id, message_id, chat_id, (xmax = 0)
+                    """,
+                    params
+                )
+                for processed_id, user_id, message_id, chat_id, inserted in cursor.fetchall():
+                    saved_ids[(user_id, message_id, chat_id)] = processed_id
+                    created += inserted
+        
+        logger.info(f"💾 Saved {len(saved_ids)} processed messages in one upsert ({created} new, {len(saved_ids) - created} merged)")
+        return saved_ids
+    
+    def _build_processed_message(self, row: Dict[str, Any]) -> ProcessedMessage:
+        """Несохраненная запись ProcessedMessage для пакетной вставки"""
+        user_data = row['user_data']
+        message_data = row['message_data']
+        return ProcessedMessage(
+            user_id=user_data['user__id'],
+            message_id=message_data['message_id'],
+            chat_id=message_data['chat_id'],
+            keyword_group=row['keyword_group'],
+            global_chat_id=user_data['global_chat__id'],
+            monitored_chat_id=None,  # Устаревшее поле, оставляем None
+            sender_id=message_data.get('sender_id'),
+            sender_name=self._format_sender_name(message_data),
+            sender_username=message_data.get('sender_username', ''),
+            message_text=message_data.get('text', ''),
+            message_link=self._message_link(message_data),
+            matched_keywords=row['matched_keywords'],
+            ai_result=row['ai_result'],
+            ai_approved=row['ai_approved'],
+            ai_cached=row['ai_cached'],
+            ai_score=row['ai_score'],
+            duplicate_of_id=row.get('duplicate_of_id'),
+            notification_sent=False,
+        )
+    
+    def _message_link(self, message_data: Dict[str, Any]) -> str:
+        """Ссылка на сообщение (только для каналов и супергрупп)"""
+        chat_id = message_data['chat_id']
+        if str(chat_id).startswith('-100'):
+            # Публичный канал или супергруппа
+            chat_id_clean = str(chat_id)[4:]  # Убираем -100
+            return f"https://t.me/c/{chat_id_clean}/{message_data['message_id']}"
+        return ""
     
     def _save_processed_message(
         self, 
@@ -205,24 +466,17 @@ class MessageProcessor:
         message_data: Dict[str, Any], 
         matched_keywords: List[str],
         ai_result: str,
-        ai_approved: bool = True
+        ai_approved: bool = True,
+        ai_cached: bool = False,
+        ai_score: Optional[float] = None,
+        duplicate_of_id: Optional[int] = None
     ) -> Optional[ProcessedMessage]:
         """Сохраняем обработанное сообщение в БД"""
         try:
             with transaction.atomic():
-                # Получаем GlobalChat
-                global_chat = GlobalChat.objects.get(id=user_data['global_chat__id'])
-                
-                # Формируем ссылку на сообщение
-                message_link = ""
                 chat_id = message_data['chat_id']
                 message_id = message_data['message_id']
                 
-                if str(chat_id).startswith('-100'):
-                    # Публичный канал или супергруппа
-                    chat_id_clean = str(chat_id)[4:]  # Убираем -100
-                    message_link = f"https://t.me/c/{chat_id_clean}/{message_id}"
-                
                 # Используем get_or_create чтобы избежать дубликатов
                 # unique_together = ['user', 'message_id', 'chat_id']
                 processed_msg, created = ProcessedMessage.objects.get_or_create(
@@ -231,16 +485,19 @@ class MessageProcessor:
                     chat_id=chat_id,
                     defaults={
                         'keyword_group': keyword_group,
-                        'global_chat': global_chat,
+                        'global_chat_id': user_data['global_chat__id'],
                         'monitored_chat_id': None,  # Устаревшее поле, оставляем None
                         'sender_id': message_data.get('sender_id'),
                         'sender_name': self._format_sender_name(message_data),
                         'sender_username': message_data.get('sender_username', ''),
                         'message_text': message_data.get('text', ''),
-                        'message_link': message_link,
+                        'message_link': self._message_link(message_data),
                         'matched_keywords': matched_keywords,
                         'ai_result': ai_result,
                         'ai_approved': ai_approved,
+                        'ai_cached': ai_cached,
+                        'ai_score': ai_score,
+                        'duplicate_of_id': duplicate_of_id,
                         'notification_sent': False
                     }
                 )
@@ -317,8 +574,11 @@ class MessageProcessor:
         else:
             return f"User {message_data.get('sender_id', 'Unknown')}"
     
-    def _send_notification(self, user_data: Dict, processed_msg: ProcessedMessage, keyword_group: KeywordGroup):
-        """Отправляем уведомление пользователю"""
+    def _send_notification(self, user_data: Dict, processed_msg: ProcessedMessage, keyword_group: KeywordGroup, raise_errors: bool = False):
+        """Отправляем уведомление пользователю
+        
+        raise_errors=True пробрасывает ошибки отправки (для повтора задачи Celery).
+        """
         try:
             # Используем централизованный токен бота
             bot_token = settings.TELEGRAM_NOTIFICATION_BOT_TOKEN
@@ -367,10 +627,14 @@ class MessageProcessor:
                 
             except Exception as send_error:
                 logger.error(f"Failed to send notification to user {user_data['user__id']}: {send_error}")
+                if raise_errors:
+                    raise
                 return False
                 
         except Exception as e:
             logger.error(f"Error in send_notification: {e}")
+            if raise_errors:
+                raise
             return False
     
     def _create_status_keyboard(self, processed_msg: ProcessedMessage):
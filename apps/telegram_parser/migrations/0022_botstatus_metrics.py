@@ -0,0 +1,18 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_parser', '0021_chat_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botstatus',
+            name='metrics',
+            field=models.JSONField(blank=True, default=dict, help_text='Скорость обработки, состояние буферов и кэшей (обновляется с heartbeat)', verbose_name='Метрики парсера'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_parser', '0022_botstatus_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParserAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Уникальный ключ шарда, например: shard1. Смена имени перераспределяет чаты', max_length=100, unique=True, verbose_name='Имя шарда')),
+                ('phone', models.CharField(help_text='Номер в международном формате', max_length=20, verbose_name='Номер телефона')),
+                ('api_id', models.IntegerField(help_text='API ID от my.telegram.org', verbose_name='API ID')),
+                ('api_hash', models.CharField(help_text='API Hash от my.telegram.org', max_length=255, verbose_name='API Hash')),
+                ('session_string', models.TextField(blank=True, help_text='Строка сессии Telegram (manage.py authorize_parser_account <name>)', verbose_name='Session String')),
+                ('is_active', models.BooleanField(default=True, help_text='Участвует в распределении чатов', verbose_name='Активен')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Аккаунт парсера',
+                'verbose_name_plural': 'Аккаунты парсера',
+                'ordering': ['name'],
+            },
+        ),
+    ]
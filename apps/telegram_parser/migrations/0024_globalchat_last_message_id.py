@@ -0,0 +1,18 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_parser', '0023_parseraccount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='globalchat',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, help_text='ID последнего сообщения, принятого парсером (для догрузки пропущенных после простоя)', null=True, verbose_name='Последнее полученное сообщение'),
+        ),
+    ]
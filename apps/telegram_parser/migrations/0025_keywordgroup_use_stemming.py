@@ -0,0 +1,18 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_parser', '0024_globalchat_last_message_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keywordgroup',
+            name='use_stemming',
+            field=models.BooleanField(default=False, help_text='Искать слова в любой форме (доставка / доставку / доставки)', verbose_name='Морфологический поиск'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated manually
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_parser', '0025_keywordgroup_use_stemming'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keywordgroup',
+            name='fuzzy_max_distance',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Сколько опечаток допускать в ключевой фразе (0 - искать точно)', validators=[django.core.validators.MaxValueValidator(2)], verbose_name='Допустимые опечатки'),
+        ),
+    ]
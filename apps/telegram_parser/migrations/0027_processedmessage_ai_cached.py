@@ -0,0 +1,18 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_parser', '0026_keywordgroup_fuzzy_max_distance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processedmessage',
+            name='ai_cached',
+            field=models.BooleanField(default=False, help_text='True если ответ AI взят из кэша без запроса к API', verbose_name='Ответ AI из кэша'),
+        ),
+    ]
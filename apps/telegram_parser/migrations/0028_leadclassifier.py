@@ -0,0 +1,32 @@
+# Generated manually
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_parser', '0027_processedmessage_ai_cached'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadClassifier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feature_counts', models.JSONField(default=dict, help_text='Хэш признака -> [в квал-лидах, в неквал/спаме]', verbose_name='Частоты признаков')),
+                ('positive_samples', models.PositiveIntegerField(default=0, verbose_name='Квал-лидов в обучении')),
+                ('negative_samples', models.PositiveIntegerField(default=0, verbose_name='Неквал/спама в обучении')),
+                ('holdout_accuracy', models.FloatField(blank=True, help_text='Доля верных уверенных ответов на отложенной выборке', null=True, verbose_name='Точность уверенных ответов')),
+                ('holdout_coverage', models.FloatField(blank=True, help_text='Какую часть отложенной выборки классификатор решил без AI', null=True, verbose_name='Доля уверенных ответов')),
+                ('is_active', models.BooleanField(default=False, help_text='Включается автоматически, если разметки достаточно и точность выше порога', verbose_name='Используется')),
+                ('trained_at', models.DateTimeField(auto_now=True, verbose_name='Дата обучения')),
+                ('keyword_group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='lead_classifier', to='telegram_parser.keywordgroup', verbose_name='Группа ключевых слов')),
+            ],
+            options={
+                'verbose_name': 'Классификатор лидов',
+                'verbose_name_plural': 'Классификаторы лидов',
+            },
+        ),
+    ]
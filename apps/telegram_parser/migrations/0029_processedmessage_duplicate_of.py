@@ -0,0 +1,19 @@
+# Generated manually
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_parser', '0028_leadclassifier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processedmessage',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Ранее обработанное сообщение с почти таким же текстом (решение взято из него, уведомление не отправлялось)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='telegram_parser.processedmessage', verbose_name='Дубликат сообщения'),
+        ),
+    ]
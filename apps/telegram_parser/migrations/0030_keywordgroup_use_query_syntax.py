@@ -0,0 +1,18 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('telegram_parser', '0029_processedmessage_duplicate_of'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keywordgroup',
+            name='use_query_syntax',
+            field=models.BooleanField(default=False, help_text='Разбирать операторы AND, OR, NOT, -слово, кавычки и скобки (иначе строка ищется целиком как фраза)', verbose_name='Язык запросов'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
-from django.core.validators import MinLengthValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinLengthValidator
 from django.utils import timezone
 import json
 
@@ -60,6 +61,12 @@ class GlobalChat(models.Model):
         help_text="Группы/категории чата"
     )
     is_active = models.BooleanField(default=True, verbose_name="Чат активен")
+    last_message_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Последнее полученное сообщение",
+        help_text="ID последнего сообщения, принятого парсером (для догрузки пропущенных после простоя)"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Добавлен")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлен")
     
@@ -192,6 +199,22 @@ class KeywordGroup(models.Model):
         verbose_name="Ключевые слова",
         help_text="Список ключевых слов для поиска"
     )
+    use_stemming = models.BooleanField(
+        default=False,
+        verbose_name="Морфологический поиск",
+        help_text="Искать слова в любой форме (доставка / доставку / доставки)"
+    )
+    fuzzy_max_distance = models.PositiveSmallIntegerField(
+        default=0,
+        validators=[MaxValueValidator(2)],
+        verbose_name="Допустимые опечатки",
+        help_text="Сколько опечаток допускать в ключевой фразе (0 - искать точно)"
+    )
+    use_query_syntax = models.BooleanField(
+        default=False,
+        verbose_name="Язык запросов",
+        help_text="Разбирать операторы AND, OR, NOT, -слово, кавычки и скобки (иначе строка ищется целиком как фраза)"
+    )
     
     # Notification settings
     notification_chat_id = models.BigIntegerField(
@@ -236,6 +259,19 @@ class KeywordGroup(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.name}"
     
+    def clean(self):
+        """Проверка синтаксиса выражений ключевых слов"""
+        from .keyword_query import KeywordQueryError, validate_keyword
+        
+        errors = []
+        for keyword in self.keywords or []:
+            try:
+                validate_keyword(keyword, self.use_query_syntax)
+            except KeywordQueryError as e:
+                errors.append(str(e))
+        if errors:
+            raise ValidationError({'keywords': errors})
+    
     @property
     def keywords_count(self):
         """Количество ключевых слов"""
@@ -385,6 +421,20 @@ class ProcessedMessage(models.Model):
         verbose_name="Одобрено AI",
         help_text="True если AI одобрил сообщение или AI не использовался"
     )
+    ai_cached = models.BooleanField(
+        default=False,
+        verbose_name="Ответ AI из кэша",
+        help_text="True если ответ AI взят из кэша без запроса к API"
+    )
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Дубликат сообщения",
+        related_name="duplicates",
+        help_text="Ранее обработанное сообщение с почти таким же текстом (решение взято из него, уведомление не отправлялось)"
+    )
     
     # Status flags
     notification_sent = models.BooleanField(
@@ -541,6 +591,12 @@ class BotStatus(models.Model):
         blank=True,
         verbose_name="Время последней ошибки"
     )
+    metrics = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Метрики парсера",
+        help_text="Скорость обработки, состояние буферов и кэшей (обновляется с heartbeat)"
+    )
     
     class Meta:
         verbose_name = "Статус бота"
@@ -634,6 +690,49 @@ class RejectedMessage(models.Model):
         return f"{self.user.username} - Rejected {self.message_id}"
 
 
+class LeadClassifier(models.Model):
+    """Локальный классификатор лидов группы, обученный по оценкам пользователя"""
+    
+    keyword_group = models.OneToOneField(
+        KeywordGroup,
+        on_delete=models.CASCADE,
+        verbose_name="Группа ключевых слов",
+        related_name="lead_classifier"
+    )
+    feature_counts = models.JSONField(
+        default=dict,
+        verbose_name="Частоты признаков",
+        help_text="Хэш признака -> [в квал-лидах, в неквал/спаме]"
+    )
+    positive_samples = models.PositiveIntegerField(default=0, verbose_name="Квал-лидов в обучении")
+    negative_samples = models.PositiveIntegerField(default=0, verbose_name="Неквал/спама в обучении")
+    holdout_accuracy = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Точность уверенных ответов",
+        help_text="Доля верных уверенных ответов на отложенной выборке"
+    )
+    holdout_coverage = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Доля уверенных ответов",
+        help_text="Какую часть отложенной выборки классификатор решил без AI"
+    )
+    is_active = models.BooleanField(
+        default=False,
+        verbose_name="Используется",
+        help_text="Включается автоматически, если разметки достаточно и точность выше порога"
+    )
+    trained_at = models.DateTimeField(auto_now=True, verbose_name="Дата обучения")
+    
+    class Meta:
+        verbose_name = "Классификатор лидов"
+        verbose_name_plural = "Классификаторы лидов"
+    
+    def __str__(self):
+        return f"{self.keyword_group} ({self.positive_samples}+/{self.negative_samples}-)"
+
+
 class RawMessage(models.Model):
     """Все сырые сообщения, полученные парсером (для отладки)"""
     
@@ -1073,3 +1172,64 @@ class SenderAccount(models.Model):
         """Переключить статус активности"""
         self.is_active = not self.is_active
         self.save()
+
+
+class ParserAccount(models.Model):
+    """Аккаунты Telegram для шардированного приема сообщений мастер-парсером
+    
+    Каждый активный аккаунт с сессией - отдельный шард. Чаты распределяются
+    между шардами детерминированно (rendezvous hashing по имени аккаунта).
+    """
+    
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name="Имя шарда",
+        help_text="Уникальный ключ шарда, например: shard1. Смена имени перераспределяет чаты"
+    )
+    phone = models.CharField(
+        max_length=20,
+        verbose_name="Номер телефона",
+        help_text="Номер в международном формате"
+    )
+    api_id = models.IntegerField(
+        verbose_name="API ID",
+        help_text="API ID от my.telegram.org"
+    )
+    api_hash = models.CharField(
+        max_length=255,
+        verbose_name="API Hash",
+        help_text="API Hash от my.telegram.org"
+    )
+    session_string = models.TextField(
+        blank=True,
+        verbose_name="Session String",
+        help_text="Строка сессии Telegram (manage.py authorize_parser_account <name>)"
+    )
+    is_active = models.BooleanField(
+        default=True,
+        verbose_name="Активен",
+        help_text="Участвует в распределении чатов"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата добавления"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата обновления"
+    )
+    
+    class Meta:
+        verbose_name = "Аккаунт парсера"
+        verbose_name_plural = "Аккаунты парсера"
+        ordering = ['name']
+    
+    def __str__(self):
+        status = "✅" if self.is_active else "❌"
+        return f"{status} {self.name} ({self.phone})"
+    
+    @property
+    def is_connected(self):
+        """Проверяет, подключен ли аккаунт (есть ли session_string)"""
+        return bool(self.session_string)
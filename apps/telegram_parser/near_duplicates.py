@@ -0,0 +1,218 @@
+"""
+Поиск почти-дубликатов сообщений между чатами
+
+Перекупы публикуют один и тот же текст с мелкими правками в десятки
+чатов. Стадия match для каждого сработавшего сообщения считает MinHash-подпись
+нормализованного текста (64 хэша по множеству слов и пар слов) и ищет
+похожие тексты последних PARSER_DUPLICATE_WINDOW секунд в индексе LSH:
+подпись режется на 8 полос по 8 хэшей, кандидаты - тексты, совпавшие с
+новым хотя бы в одной полосе. Для кандидатов сходство Жаккара оценивается
+по доле совпавших хэшей и сравнивается с PARSER_DUPLICATE_MIN_SIMILARITY.
+
+Индекс общий для всех воркеров: корзина полосы - запись Django cache/Redis
+с ключом по хэшу полосы, в ней до PARSER_DUPLICATE_BUCKET_SIZE последних
+подписей в порядке добавления. Пачка читает свои корзины одним get_many и
+записывает одним set_many. Одновременная запись одной корзины двумя
+воркерами может потерять подпись - тогда копия просто пройдет обычную
+проверку AI.
+
+SimHash здесь не подходит: в коротком посте правка одного слова меняет
+заметную долю признаков, и расстояние Хэмминга выходит за разумный порог.
+
+Дубликат ссылается на первое сообщение цепочки, поэтому копии копий
+указывают на один оригинал.
+"""
+import hashlib
+import logging
+import random
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .text_normalization import get_normalized_text
+
+logger = logging.getLogger('telegram_parser')
+
+BUCKET_KEY = 'dup:bucket:{}:{}'
+
+# Статистика индекса пишется в лог каждые N проверок
+STATS_LOG_EVERY = 100
+
+NUM_HASHES = 64
+BANDS = 8
+ROWS = NUM_HASHES // BANDS
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+# Фиксированные коэффициенты перестановок (a * x + b) mod p
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_HASHES)]
+
+MessageRef = Tuple[int, int]  # (chat_id, message_id)
+
+
+def shingles(normalized_text: str) -> Set[int]:
+    """64-битные хэши слов и пар соседних слов"""
+    words = normalized_text.split()
+    features = set(words)
+    features.update(f'{first} {second}' for first, second in zip(words, words[1:]))
+    return {
+        int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for feature in features
+    }
+
+
+def minhash(normalized_text: str) -> array:
+    """MinHash-подпись текста (NUM_HASHES 32-битных значений)"""
+    values = shingles(normalized_text)
+    if not values:
+        return array('Q', [_MASK] * NUM_HASHES)
+    return array('Q', (
+        min((a * value + b) % _PRIME for value in values) & _MASK
+        for a, b in _PERMUTATIONS
+    ))
+
+
+def similarity(first: array, second: array) -> float:
+    """Оценка сходства Жаккара по доле совпавших хэшей подписей"""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_HASHES
+
+
+def band_keys(signature: array) -> List[str]:
+    """Ключи корзин LSH подписи (хэш полосы одинаков во всех процессах)"""
+    return [
+        BUCKET_KEY.format(band, hashlib.blake2b(signature[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).hexdigest())
+        for band in range(BANDS)
+    ]
+
+
+class NearDuplicateIndex:
+    """Скользящее окно MinHash-подписей в общих корзинах LSH
+
+    Запись корзины - (время добавления, сообщение, оригинал цепочки, подпись).
+    """
+
+    def __init__(self):
+        # Статистика процесса
+        self.checked = 0
+        self.skipped_short = 0
+        self.duplicates = 0
+        self.candidates = 0
+        self.errors = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+
+    def mark_duplicates(self, messages: List[Dict[str, Any]]) -> int:
+        """Пометить почти-дубликаты пачки полем duplicate_of и добавить пачку в окно
+
+        Сообщения сравниваются с окном и с более ранними сообщениями той же
+        пачки. Короткие тексты (меньше PARSER_DUPLICATE_MIN_WORDS слов) не
+        проверяются: у них слишком много случайных совпадений. Повтор стадии
+        не находит сообщение само у себя. Возвращает число дубликатов.
+        """
+        prepared = []
+        for message_data in messages:
+            normalized_text = get_normalized_text(message_data)
+            if len(normalized_text.split()) < settings.PARSER_DUPLICATE_MIN_WORDS:
+                self.skipped_short += 1
+                continue
+            signature = minhash(normalized_text)
+            prepared.append((message_data, signature, band_keys(signature)))
+        if not prepared:
+            return 0
+
+        started = time.monotonic()
+        now = time.time()
+        window = settings.PARSER_DUPLICATE_WINDOW
+        try:
+            stored = cache.get_many(list({key for _, _, keys in prepared for key in keys}))
+        except Exception as e:
+            # Без индекса копии просто проходят обычную проверку
+            self.errors += 1
+            logger.error(f"❌ Near-duplicate index read failed: {e}")
+            return 0
+        buckets = {
+            key: [entry for entry in bucket if now - entry[0] <= window]
+            for key, bucket in stored.items()
+        }
+
+        found = 0
+        changed = set()
+        for message_data, signature, keys in prepared:
+            ref = (message_data['chat_id'], message_data['message_id'])
+            original = self._find_original(signature, ref, keys, buckets)
+            if original:
+                found += 1
+                message_data['duplicate_of'] = {'chat_id': original[0], 'message_id': original[1]}
+                logger.info(f"  ♻️ Near-duplicate of message {original[1]} from chat {original[0]}")
+
+            entry = (now, ref, original or ref, signature.tobytes())
+            for key in keys:
+                bucket = buckets.setdefault(key, [])
+                if any(existing[1] == ref for existing in bucket):
+                    continue
+                bucket.append(entry)
+                # Корзина в порядке добавления - вытесняем самые старые
+                if len(bucket) > settings.PARSER_DUPLICATE_BUCKET_SIZE:
+                    del bucket[:len(bucket) - settings.PARSER_DUPLICATE_BUCKET_SIZE]
+                changed.add(key)
+
+        if changed:
+            try:
+                cache.set_many({key: buckets[key] for key in changed}, timeout=window)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Near-duplicate index write failed: {e}")
+
+        checked = self.checked
+        self.checked += len(prepared)
+        self.duplicates += found
+        duration = time.monotonic() - started
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        if self.checked // STATS_LOG_EVERY > checked // STATS_LOG_EVERY:
+            logger.info(f"♻️ Near-duplicate index stats: {self.get_stats()}")
+        return found
+
+    def _find_original(
+        self,
+        signature: array,
+        ref: MessageRef,
+        keys: List[str],
+        buckets: Dict[str, List[Tuple]]
+    ) -> Optional[MessageRef]:
+        """Оригинал самого похожего кандидата, при равенстве - более раннего"""
+        best = None
+        seen = set()
+        for key in keys:
+            for added_at, entry_ref, entry_original, entry_signature in buckets.get(key, ()):
+                # Сама запись сообщения или копия, ссылающаяся на него
+                if entry_ref in seen or ref in (entry_ref, entry_original):
+                    continue
+                seen.add(entry_ref)
+                score = similarity(signature, array('Q', entry_signature))
+                if score >= settings.PARSER_DUPLICATE_MIN_SIMILARITY and (
+                    best is None or (score, -added_at) > (best[0], -best[1])
+                ):
+                    best = (score, added_at, tuple(entry_original))
+        self.candidates += len(seen)
+        return best[2] if best else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'checked': self.checked,
+            'skipped_short': self.skipped_short,
+            'duplicates': self.duplicates,
+            'duplicate_ratio': round(self.duplicates / self.checked, 3) if self.checked else 0.0,
+            'avg_candidates': round(self.candidates / self.checked, 2) if self.checked else 0.0,
+            'avg_ms': round(self.total_duration / self.checked * 1000, 3) if self.checked else 0.0,
+            'max_ms': round(self.max_duration * 1000, 3),
+            'errors': self.errors,
+        }
+
+
+# Глобальный экземпляр
+near_duplicates = NearDuplicateIndex()
@@ -0,0 +1,221 @@
+"""
+Таблица маршрутизации сообщений: чат -> пользователи -> группы ключевых слов
+
+Таблица живет в памяти процесса воркера и обновляется инкрементально.
+Сигналы моделей (signals.py) увеличивают общий счетчик версий в кэше и
+записывают под номером версии, что изменилось. Воркер перед обработкой
+сравнивает свою версию с общей и применяет пропущенные изменения; если
+журнал успел устареть - перестраивает таблицу целиком.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import KeywordGroup, UserChatSettings
+
+logger = logging.getLogger('telegram_parser')
+
+VERSION_KEY = 'routing:version'
+CHANGE_KEY = 'routing:change:{}'
+
+# Поля пользователя/чата, которые нужны процессору (формат как у .values())
+USER_DATA_FIELDS = (
+    'user__id',
+    'user__username',
+    'user__notification_chat_id',
+    'global_chat__id',
+    'global_chat__name',
+    'global_chat__chat_id',
+)
+
+
+def record_change(kind: str, **ids):
+    """Зарегистрировать изменение для всех воркеров
+
+    kind: 'chat' (global_chat_id), 'user' (user_id), 'groups' (user_id)
+    или 'reload' - полная перестройка таблицы.
+    """
+    try:
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            # Ключа еще нет (первый запуск или очистка Redis)
+            cache.add(VERSION_KEY, 0, timeout=None)
+            version = cache.incr(VERSION_KEY)
+        cache.set(CHANGE_KEY.format(version), {'kind': kind, **ids}, timeout=settings.ROUTING_CHANGE_LOG_TTL)
+    except Exception as e:
+        # Без кэша воркеры догонят изменения по ROUTING_FULL_RELOAD_INTERVAL
+        logger.error(f"❌ Failed to record routing change {kind} {ids}: {e}")
+
+
+class RoutingTable:
+    """Маршрутизация chat_id -> пользователи и user_id -> активные группы"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+        self._users_by_chat: Dict[int, List[Dict]] = {}
+        # global_chat.id -> chat_id (нужно, чтобы найти запись чата при его изменении)
+        self._chat_ids: Dict[int, int] = {}
+        self._groups_by_user: Dict[int, List[KeywordGroup]] = {}
+        # Номер версий групп: матчер перестраивает автомат, когда он меняется
+        self.groups_revision = 0
+
+        # Статистика
+        self.full_reloads = 0
+        self.incremental_updates = 0
+
+    def users_for_chat(self, chat_id: int) -> List[Dict]:
+        return self._users_by_chat.get(chat_id, [])
+
+    def groups(self):
+        """Все активные группы ключевых слов в порядке выборки"""
+        return [group for groups in self._groups_by_user.values() for group in groups]
+
+    def refresh(self):
+        """Подтянуть изменения, сделанные с момента последней проверки"""
+        now = time.monotonic()
+        if self.version is not None and now - self._checked_at < settings.ROUTING_CHECK_INTERVAL:
+            return
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                shared_version = cache.get(VERSION_KEY, 0)
+            except Exception as e:
+                logger.error(f"❌ Failed to read routing version: {e}")
+                shared_version = None
+
+            expired = now - self._loaded_at > settings.ROUTING_FULL_RELOAD_INTERVAL
+            if self.version is None or expired:
+                self._reload(shared_version)
+                return
+
+            # Без кэша работаем на загруженной таблице до страховочной перезагрузки
+            if shared_version is None or shared_version == self.version:
+                return
+
+            if shared_version < self.version:
+                # Счетчик сброшен (очистка Redis) - журналу верить нельзя
+                self._reload(shared_version)
+                return
+
+            self._apply_changes(shared_version)
+
+    def _apply_changes(self, shared_version: int):
+        versions = range(self.version + 1, shared_version + 1)
+        if len(versions) > settings.ROUTING_MAX_INCREMENTAL:
+            self._reload(shared_version)
+            return
+
+        keys = [CHANGE_KEY.format(version) for version in versions]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            # Часть журнала истекла - надежнее перестроить все
+            self._reload(shared_version)
+            return
+
+        chats, users, group_owners = set(), set(), set()
+        for key in keys:
+            change = changes[key]
+            kind = change['kind']
+            if kind == 'reload':
+                self._reload(shared_version)
+                return
+            if kind == 'chat':
+                chats.add(change['global_chat_id'])
+            elif kind == 'user':
+                users.add(change['user_id'])
+                group_owners.add(change['user_id'])
+            elif kind == 'groups':
+                group_owners.add(change['user_id'])
+
+        if users:
+            chats.update(
+                UserChatSettings.objects.filter(user_id__in=users)
+                .values_list('global_chat_id', flat=True)
+            )
+        for global_chat_id in chats:
+            self._reload_chat(global_chat_id)
+        for user_id in group_owners:
+            self._reload_user_groups(user_id)
+        if group_owners:
+            self.groups_revision += 1
+
+        self.version = shared_version
+        self.incremental_updates += 1
+        logger.info(
+            f"🧭 Routing table updated to v{shared_version}: "
+            f"{len(chats)} chats, {len(group_owners)} users' groups"
+        )
+
+    def _user_settings(self):
+        return UserChatSettings.objects.filter(
+            global_chat__is_active=True,
+            is_enabled=True,
+            user__is_active=True
+        ).order_by('id')
+
+    def _reload(self, shared_version: Optional[int]):
+        started = time.monotonic()
+
+        users_by_chat, chat_ids = {}, {}
+        for user_data in self._user_settings().values(*USER_DATA_FIELDS):
+            users_by_chat.setdefault(user_data['global_chat__chat_id'], []).append(user_data)
+            chat_ids[user_data['global_chat__id']] = user_data['global_chat__chat_id']
+
+        groups_by_user = {}
+        for group in KeywordGroup.objects.filter(is_active=True):
+            groups_by_user.setdefault(group.user_id, []).append(group)
+
+        self._users_by_chat = users_by_chat
+        self._chat_ids = chat_ids
+        self._groups_by_user = groups_by_user
+        self.groups_revision += 1
+        # Без кэша версия неизвестна: перестроимся снова по таймеру
+        self.version = shared_version if shared_version is not None else 0
+        self._loaded_at = time.monotonic()
+
+        self.full_reloads += 1
+        logger.info(
+            f"🧭 Routing table loaded (v{self.version}): {len(users_by_chat)} chats, "
+            f"{len(groups_by_user)} users with groups in {(time.monotonic() - started) * 1000:.1f}ms"
+        )
+
+    def _reload_chat(self, global_chat_id: int):
+        old_chat_id = self._chat_ids.pop(global_chat_id, None)
+        if old_chat_id is not None:
+            self._users_by_chat.pop(old_chat_id, None)
+
+        rows = list(self._user_settings().filter(global_chat_id=global_chat_id).values(*USER_DATA_FIELDS))
+        if rows:
+            chat_id = rows[0]['global_chat__chat_id']
+            self._users_by_chat[chat_id] = rows
+            self._chat_ids[global_chat_id] = chat_id
+
+    def _reload_user_groups(self, user_id: int):
+        groups = list(KeywordGroup.objects.filter(user_id=user_id, is_active=True))
+        if groups:
+            self._groups_by_user[user_id] = groups
+        else:
+            self._groups_by_user.pop(user_id, None)
+
+    def get_stats(self) -> Dict:
+        return {
+            'version': self.version,
+            'chats': len(self._users_by_chat),
+            'users_with_groups': len(self._groups_by_user),
+            'full_reloads': self.full_reloads,
+            'incremental_updates': self.incremental_updates,
+        }
+
+
+# Глобальный экземпляр таблицы (один на процесс воркера)
+routing_table = RoutingTable()
@@ -0,0 +1,51 @@
+"""
+Signals for routing table invalidation
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import GlobalChat, KeywordGroup, UserChatSettings
+from .routing import record_change
+
+User = get_user_model()
+
+# Поля пользователя, изменение которых не влияет на маршрутизацию
+USER_IGNORED_FIELDS = {'last_login', 'messages_this_month'}
+
+
+def _on_commit(kind, **ids):
+    """Воркеры должны увидеть изменение только после коммита транзакции"""
+    transaction.on_commit(lambda: record_change(kind, **ids))
+
+
+@receiver(post_save, sender=GlobalChat)
+@receiver(post_delete, sender=GlobalChat)
+def global_chat_changed(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    # High-water mark мастер-парсера на маршрутизацию не влияет
+    if update_fields and set(update_fields) <= {'last_message_id'}:
+        return
+    _on_commit('chat', global_chat_id=instance.pk)
+
+
+@receiver(post_save, sender=UserChatSettings)
+@receiver(post_delete, sender=UserChatSettings)
+def user_chat_settings_changed(sender, instance, **kwargs):
+    _on_commit('chat', global_chat_id=instance.global_chat_id)
+
+
+@receiver(post_save, sender=KeywordGroup)
+@receiver(post_delete, sender=KeywordGroup)
+def keyword_group_changed(sender, instance, **kwargs):
+    _on_commit('groups', user_id=instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= USER_IGNORED_FIELDS:
+        return
+    _on_commit('user', user_id=instance.pk)
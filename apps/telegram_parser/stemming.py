@@ -0,0 +1,64 @@
+"""
+Стемминг русских слов для групп с морфологическим поиском
+
+Используется snowballstemmer (опциональная зависимость). Словарь чатов
+сильно повторяется, поэтому слово -> основа мемоизируется в ограниченном
+LRU-кэше и стемминг почти ничего не стоит.
+"""
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from django.conf import settings
+
+from .text_normalization import get_normalized_text
+
+logger = logging.getLogger('telegram_parser')
+
+_stemmer = None
+_stemmer_checked = False
+
+
+def _get_stemmer():
+    global _stemmer, _stemmer_checked
+    if not _stemmer_checked:
+        _stemmer_checked = True
+        try:
+            import snowballstemmer
+            _stemmer = snowballstemmer.stemmer('russian')
+        except ImportError:
+            logger.warning("⚠️ snowballstemmer не установлен - группы со стеммингом ищут по подстроке")
+    return _stemmer
+
+
+def is_available() -> bool:
+    return _get_stemmer() is not None
+
+
+@lru_cache(maxsize=settings.STEM_CACHE_SIZE)
+def stem_word(word: str) -> str:
+    return _get_stemmer().stemWord(word)
+
+
+def stem_phrase(normalized_text: str) -> str:
+    """Основы слов уже нормализованного текста через пробел"""
+    return ' '.join(stem_word(word) for word in normalized_text.split())
+
+
+def get_text_stems(message_data: Dict[str, Any]) -> List[str]:
+    """Основы слов сообщения (считаются один раз и хранятся в message_data)"""
+    stems = message_data.get('text_stems')
+    if stems is None:
+        stems = message_data['text_stems'] = [
+            stem_word(word) for word in get_normalized_text(message_data).split()
+        ]
+    return stems
+
+
+def get_stats() -> Dict:
+    info = stem_word.cache_info()
+    total = info.hits + info.misses
+    return {
+        'cache_size': info.currsize,
+        'hit_rate': round(info.hits / total, 3) if total else 0.0,
+    }
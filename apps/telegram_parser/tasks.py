@@ -8,7 +8,7 @@ logger = logging.getLogger('telegram_parser')
 @shared_task(bind=True, max_retries=3)
 def process_message_task(self, message_data):
     """
-    Celery task для обработки сообщений
+    Celery task для обработки сообщений (стадия match, очередь match)
     """
     try:
         # Ленивый импорт для избежания циклических зависимостей
@@ -16,15 +16,11 @@ def process_message_task(self, message_data):
         
         logger.info(f"Processing message {message_data.get('message_id')} from chat {message_data.get('chat_id')}")
         
-        # Обрабатываем сообщение
-        success = message_processor.process_message(message_data)
+        # Сопоставляем сообщение, AI проверка и уведомления уходят в свои очереди
+        queued = message_processor.dispatch_batch([message_data])
         
-        if success:
-            logger.info(f"Successfully processed message {message_data.get('message_id')}")
-            return f"Processed message {message_data.get('message_id')}"
-        else:
-            logger.error(f"Failed to process message {message_data.get('message_id')}")
-            raise Exception("Message processing failed")
+        logger.info(f"Successfully processed message {message_data.get('message_id')}")
+        return f"Processed message {message_data.get('message_id')} ({queued} tasks queued)"
             
     except Exception as exc:
         logger.error(f"Error in process_message_task: {exc}")
@@ -39,6 +35,121 @@ def process_message_task(self, message_data):
             raise exc
 
 
+@shared_task(bind=True, max_retries=3)
+def process_message_batch_task(self, messages):
+    """
+    Celery task для пакетной обработки сообщений (стадия match, очередь match).
+    Данные маршрутизации и группы ключевых слов загружаются один раз на пачку,
+    совпадения без AI фильтра сохраняются одним запросом, AI проверки и
+    уведомления уходят в очереди ai и notify.
+    """
+    try:
+        # Ленивый импорт для избежания циклических зависимостей
+        from .message_processor import message_processor
+        
+        logger.info(f"Processing batch of {len(messages)} messages")
+        
+        queued = message_processor.dispatch_batch(messages)
+        
+        logger.info(f"Successfully processed batch of {len(messages)} messages")
+        return f"Processed batch of {len(messages)} messages ({queued} tasks queued)"
+            
+    except Exception as exc:
+        # Сюда попадаем только если пачка не обработалась целиком (например, БД недоступна)
+        logger.error(f"Error in process_message_batch_task: {exc}")
+        
+        if self.request.retries < self.max_retries:
+            countdown = 2 ** self.request.retries
+            logger.info(f"Retrying batch of {len(messages)} messages in {countdown} seconds")
+            raise self.retry(exc=exc, countdown=countdown)
+        else:
+            logger.error(f"Max retries reached for batch of {len(messages)} messages")
+            raise exc
+
+
+@shared_task(bind=True, max_retries=3)
+def ai_check_task(self, message_data, user_data, keyword_group_id, matched_keywords, verdict=None):
+    """
+    Celery task для AI проверки совпадения (стадия ai, очередь ai).
+    Сохраняет результат и передает одобренную запись в очередь notify.
+    """
+    try:
+        # Ленивый импорт для избежания циклических зависимостей
+        from .message_processor import make_verdict, message_processor
+        from .models import KeywordGroup
+        
+        keyword_group = KeywordGroup.objects.filter(id=keyword_group_id, is_active=True).first()
+        if not keyword_group:
+            logger.info(f"Keyword group {keyword_group_id} deleted or disabled, skipping AI check")
+            return "Keyword group inactive"
+        
+        # Без AI фильтра (выключили после постановки задачи) совпадение просто одобряется
+        if verdict is None and not (keyword_group.use_ai_filter and keyword_group.ai_prompt):
+            verdict = make_verdict()
+        
+        # Ответ AI передается в повтор задачи, поэтому ошибка сохранения не стоит второго запроса к AI
+        if verdict is None:
+            verdict = message_processor.run_ai_check(message_data, user_data, keyword_group)
+        
+        ai_approved = verdict['ai_approved']
+        processed_message_id = message_processor.save_ai_verdict(
+            message_data, user_data, keyword_group, matched_keywords, verdict
+        )
+        
+        if ai_approved and processed_message_id:
+            send_notification_task.delay(processed_message_id, keyword_group.id, user_data)
+        elif not ai_approved:
+            logger.info(f"⚠️ Уведомление НЕ отправлено - AI отклонил сообщение {processed_message_id}")
+        return f"AI check for message {message_data.get('message_id')}: {'approved' if ai_approved else 'rejected'}"
+        
+    except Exception as exc:
+        logger.error(f"Error in ai_check_task: {exc}")
+        
+        if self.request.retries < self.max_retries:
+            countdown = 2 ** self.request.retries
+            logger.info(f"Retrying AI check for message {message_data.get('message_id')} in {countdown} seconds")
+            raise self.retry(
+                exc=exc,
+                countdown=countdown,
+                args=(message_data, user_data, keyword_group_id, matched_keywords, verdict),
+                kwargs={},
+            )
+        else:
+            logger.error(f"Max retries reached for AI check of message {message_data.get('message_id')}")
+            raise exc
+
+
+@shared_task(bind=True, max_retries=5)
+def send_notification_task(self, processed_message_id, keyword_group_id, user_data):
+    """
+    Celery task для отправки уведомления (стадия notify, очередь notify).
+    Идемпотентна: запись с notification_sent=True повторно не отправляется.
+    """
+    try:
+        # Ленивый импорт для избежания циклических зависимостей
+        from .message_processor import message_processor
+        from .models import KeywordGroup
+        
+        keyword_group = KeywordGroup.objects.filter(id=keyword_group_id).first()
+        if not keyword_group:
+            logger.info(f"Keyword group {keyword_group_id} deleted, skipping notification")
+            return "Keyword group deleted"
+        
+        sent = message_processor.deliver_notification(processed_message_id, keyword_group, user_data)
+        return f"Notification for processed message {processed_message_id}: {'sent' if sent else 'skipped'}"
+        
+    except Exception as exc:
+        logger.error(f"Error in send_notification_task: {exc}")
+        
+        if self.request.retries < self.max_retries:
+            countdown = 2 ** self.request.retries
+            logger.info(f"Retrying notification for processed message {processed_message_id} in {countdown} seconds")
+            raise self.retry(exc=exc, countdown=countdown)
+        else:
+            logger.error(f"Max retries reached for notification of processed message {processed_message_id}")
+            raise exc
+
+
 @shared_task
 def start_telegram_parser():
     """
@@ -80,7 +191,9 @@ def stop_telegram_parser():
         logger.info("Stopping Telegram parser via Celery task")
         
         import asyncio
-        asyncio.run(master_parser.stop())
+        if not asyncio.run(master_parser.stop()):
+            logger.error("Telegram parser stopped with unflushed messages")
+            return "Telegram parser stopped, some buffered messages were lost"
         
         logger.info("Telegram parser stopped successfully")
         return "Telegram parser stopped"
@@ -98,12 +211,10 @@ def reset_daily_message_counter():
     try:
         from .models import BotStatus
         
-        bot_status = BotStatus.objects.first()
-        if bot_status:
-            bot_status.messages_processed_today = 0
-            bot_status.save(update_fields=['messages_processed_today'])
-            
-            logger.info("Daily message counter reset successfully")
+        # Сбрасываем у всех записей (мастер-парсер и шарды)
+        updated = BotStatus.objects.update(messages_processed_today=0)
+        if updated:
+            logger.info(f"Daily message counter reset successfully ({updated} records)")
             return "Daily counter reset"
         else:
             logger.warning("No bot status record found for daily reset")
@@ -138,6 +249,38 @@ def cleanup_old_messages():
         raise exc
 
 
+@shared_task
+def train_lead_classifiers():
+    """
+    Задача для обучения локальных классификаторов лидов по оценкам пользователей
+    (Квал / Неквал / Спам) для групп с AI фильтром
+    """
+    try:
+        from .lead_classifier import train_group
+        from .models import KeywordGroup
+        
+        trained = active = 0
+        for keyword_group in KeywordGroup.objects.filter(is_active=True, use_ai_filter=True):
+            fields = train_group(keyword_group)
+            if fields is None:
+                continue
+            trained += 1
+            active += fields['is_active']
+            logger.info(
+                f"🧮 Lead classifier for group {keyword_group.id}: "
+                f"{fields['positive_samples']}+/{fields['negative_samples']}-, "
+                f"holdout accuracy {fields['holdout_accuracy']}, coverage {fields['holdout_coverage']}, "
+                f"{'active' if fields['is_active'] else 'inactive'}"
+            )
+        
+        logger.info(f"Trained {trained} lead classifiers ({active} active)")
+        return f"Trained {trained} lead classifiers ({active} active)"
+        
+    except Exception as exc:
+        logger.error(f"Error training lead classifiers: {exc}")
+        raise exc
+
+
 @shared_task
 def update_bot_statistics():
     """
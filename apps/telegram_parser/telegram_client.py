@@ -1,33 +1,101 @@
 import asyncio
 import logging
+import os
+import time
+from collections import OrderedDict
 from datetime import datetime
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, errors
+from telethon.sessions import StringSession
 from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import F
 from .models import MonitoredChat, BotStatus
-from .tasks import process_message_task
+from .routing import record_change
+from .ingest import (
+    RawMessageBuffer, MessageBatchDispatcher, EntityCache, StatusCounters, ParserSnapshot,
+    IngestPipeline, HighWaterTracker, assign_shard
+)
 
 logger = logging.getLogger('telegram_parser')
 
 
 class MasterTelegramParser:
-    """Главный парсер сообщений из всех чатов"""
+    """Главный парсер сообщений из всех чатов
     
-    def __init__(self):
-        self.client = TelegramClient(
-            'master_session',
-            settings.TELEGRAM_API_ID,
-            settings.TELEGRAM_API_HASH
-        )
+    Без shard_name работает от мастер-аккаунта (master_session) и слушает все
+    чаты. С shard_name работает от ParserAccount с этим именем и слушает только
+    чаты, закрепленные за этим шардом (см. assign_shard).
+    """
+    
+    def __init__(self, shard_name=None, session_string=None, api_id=None, api_hash=None):
+        self.shard_name = shard_name
+        if shard_name:
+            self.client = TelegramClient(StringSession(session_string), api_id, api_hash)
+            self.status_name = f'master_parser:{shard_name}'
+            state_base, state_ext = os.path.splitext(settings.PARSER_STATE_FILE)
+            state_file = f'{state_base}.{shard_name}{state_ext}'
+        else:
+            self.client = TelegramClient(
+                'master_session',
+                settings.TELEGRAM_API_ID,
+                settings.TELEGRAM_API_HASH
+            )
+            self.status_name = 'master_parser'
+            state_file = settings.PARSER_STATE_FILE
         self.is_running = False
         self.bot_status = None
+        self.monitored_chats = frozenset()
+        self._message_event = None
+        self._probe_task = None
+        self.raw_buffer = RawMessageBuffer(
+            max_size=settings.PARSER_RAW_BUFFER_SIZE,
+            max_age=settings.PARSER_RAW_BUFFER_MAX_AGE,
+            max_pending=settings.PARSER_BUFFER_MAX_PENDING,
+        )
+        self.dispatcher = MessageBatchDispatcher(
+            max_size=settings.PARSER_DISPATCH_BATCH_SIZE,
+            max_age=settings.PARSER_DISPATCH_MAX_WAIT,
+            max_pending=settings.PARSER_BUFFER_MAX_PENDING,
+            on_flushed=self._on_dispatched,
+        )
+        self.entity_cache = EntityCache(
+            max_size=settings.PARSER_ENTITY_CACHE_SIZE,
+            ttl=settings.PARSER_ENTITY_CACHE_TTL,
+        )
+        self.counters = StatusCounters()
+        self.pipeline = IngestPipeline(
+            self._process_message,
+            max_size=settings.PARSER_QUEUE_SIZE,
+            workers=settings.PARSER_WORKERS,
+            overflow=settings.PARSER_QUEUE_OVERFLOW,
+        )
+        self.snapshot = ParserSnapshot(state_file)
+        # chat_id -> время (unix) последней успешной проверки доступа
+        self.chat_verified_at = {}
+        # chat_id -> high-water mark на момент запуска (откуда начинать догрузку),
+        # отметки по доставленным сообщениям и еще не сохраненные в БД отметки
+        self.high_water_marks = {}
+        self.high_water = HighWaterTracker()
+        self._pending_high_water = {}
+        # Недавно обработанные (chat_id, message_id) - защита от повторов при догрузке
+        self._seen_messages = OrderedDict()
+        # Сообщения догрузки, уже сохраненные в RawMessage (второй раз не пишем)
+        self._raw_saved = set()
+        self._catchup_tasks = []
         
     async def initialize(self):
         """Инициализация клиента и статуса"""
         try:
-            await self.client.start()
-            logger.info("✅ Telegram client started successfully")
+            if self.shard_name:
+                # У шарда сессия уже авторизована, интерактивный вход невозможен
+                await self.client.connect()
+                if not await self.client.is_user_authorized():
+                    logger.error(f"❌ Parser account '{self.shard_name}' is not authorized")
+                    return False
+            else:
+                await self.client.start()
+            logger.info(f"✅ Telegram client started successfully ({self.status_name})")
             
             # Получаем или создаем статус бота
             self.bot_status, created = await self._get_or_create_bot_status()
@@ -48,7 +116,7 @@ class MasterTelegramParser:
         @sync_to_async
         def get_or_create_status():
             bot_status, created = BotStatus.objects.get_or_create(
-                bot_username='master_parser',
+                bot_username=self.status_name,
                 defaults={
                     'is_running': False,
                     'total_chats_monitored': 0,
@@ -68,60 +136,36 @@ class MasterTelegramParser:
         
         try:
             # Получаем все уникальные чаты для мониторинга
-            self.monitored_chats = await self._get_all_monitored_chats()
+            candidate_chats = await self._get_all_monitored_chats()
             
-            if not self.monitored_chats:
+            if not candidate_chats:
                 logger.warning("⚠️ No chats to monitor")
                 return False
             
-            logger.info(f"📺 Starting monitoring for {len(self.monitored_chats)} chats")
-            
-            # Проверяем доступность ВСЕХ чатов
-            logger.info("� ПРОВЕРКА ДОСТУПНОСТИ ЧАТОВ:")
-            accessible_chats = []
-            inaccessible_chats = []
-            
-            for idx, chat_id in enumerate(self.monitored_chats, 1):
-                try:
-                    chat = await self.client.get_entity(chat_id)
-                    chat_title = getattr(chat, 'title', 'Unknown')
-                    chat_username = getattr(chat, 'username', None)
-                    accessible_chats.append(chat_id)
-                    
-                    if idx <= 20:  # Логируем первые 20
-                        username_str = f"@{chat_username}" if chat_username else "приватный"
-                        logger.info(f"  ✅ {idx}. {chat_title} (ID: {chat_id}, {username_str})")
-                except Exception as e:
-                    inaccessible_chats.append((chat_id, str(e)))
-                    error_msg = str(e)
-                    if "not found" in error_msg.lower() or "invalid" in error_msg.lower():
-                        logger.warning(f"  ❌ {idx}. Chat ID {chat_id}: БОТ УДАЛЁН ИЗ ЧАТА - {error_msg}")
-                    else:
-                        logger.warning(f"  ⚠️ {idx}. Chat ID {chat_id}: Ошибка доступа - {error_msg}")
-            
-            # Итоговая статистика
-            logger.info("=" * 80)
-            logger.info(f"📊 ИТОГОВАЯ СТАТИСТИКА ЧАТОВ:")
-            logger.info(f"   ✅ Доступных чатов: {len(accessible_chats)}")
-            logger.info(f"   ❌ Недоступных чатов: {len(inaccessible_chats)}")
-            logger.info(f"   📈 Процент доступности: {len(accessible_chats) / len(self.monitored_chats) * 100:.1f}%")
-            
-            if inaccessible_chats:
-                logger.warning(f"⚠️ НЕДОСТУПНЫЕ ЧАТЫ (возможно бот удалён):")
-                for chat_id, error in inaccessible_chats[:10]:
-                    logger.warning(f"   - Chat ID {chat_id}: {error}")
-                if len(inaccessible_chats) > 10:
-                    logger.warning(f"   ... и ещё {len(inaccessible_chats) - 10} чатов")
-                
-                # Автоматически деактивируем недоступные чаты
-                await self.cleanup_inaccessible_chats(inaccessible_chats)
+            logger.info(f"📺 Starting monitoring for {len(candidate_chats)} chats")
             
-            logger.info("=" * 80)
+            # Теплый старт: недавно проверенные чаты слушаем сразу, перепроверяем только устаревшие
+            fresh_chats = await self._load_snapshot(candidate_chats)
+            stale_chats = [chat_id for chat_id in candidate_chats if chat_id not in fresh_chats]
+            logger.info(f"♻️ Warm start: {len(fresh_chats)} chats from snapshot, {len(stale_chats)} to probe")
             
-            # Обновляем список только доступными чатами
-            if accessible_chats:
-                self.monitored_chats = accessible_chats
-                logger.info(f"🎯 Будет мониториться {len(self.monitored_chats)} доступных чатов")
+            # Отметки загружаем до первого сообщения: пока догрузка чата не
+            # закончена, его отметка не сдвигается (см. _start_catch_up)
+            candidate_set = set(candidate_chats)
+            self.high_water_marks = {
+                chat_id: message_id
+                for chat_id, message_id in (await self._load_high_water_marks()).items()
+                if chat_id in candidate_set
+            }
+            self.high_water.load(self.high_water_marks)
+            for chat_id, message_id in self.high_water_marks.items():
+                self.high_water.start(chat_id, message_id + 1)
+            
+            # Начинаем слушать сразу; остальные чаты добавляются по мере подтверждения доступа
+            self.pipeline.start()
+            self.monitored_chats = frozenset(fresh_chats)
+            self._register_message_handler()
+            self.is_running = True
             
             # Обновляем статус
             await self._update_bot_status(
@@ -131,40 +175,370 @@ class MasterTelegramParser:
                 total_users=await self._get_total_users_count()
             )
             
-            # Настраиваем обработчик новых сообщений для ВСЕХ чатов
-            @self.client.on(events.NewMessage())
-            async def message_handler(event):
-                logger.info(f"📨 Raw message received from chat {event.chat_id}")
-                await self._handle_new_message(event)
+            # Запускаем heartbeat и фоновый сброс буферов
+            asyncio.create_task(self._heartbeat_loop())
+            asyncio.create_task(self._buffers_flush_loop())
+            
+            # Догружаем пропущенное за время простоя в уже подтвержденных чатах
+            self._start_catch_up(fresh_chats)
+            
+            # Проверка доступности чатов идет в фоне параллельно с прослушиванием
+            self._probe_task = asyncio.create_task(self._probe_chats(stale_chats))
             
             logger.info("🚀 Master parser started and listening for messages...")
-            logger.info(f"🔊 Listening to chat IDs: {self.monitored_chats}")
             logger.info(f"✅ Message handler registered successfully")
-            self.is_running = True
-            
-            # Запускаем heartbeat
-            asyncio.create_task(self._heartbeat_loop())
             
             # Запускаем основной loop
             await self.client.run_until_disconnected()
             
         except Exception as e:
             logger.error(f"❌ Error in monitoring loop: {e}")
-            await self._update_bot_status(
-                is_running=False,
-                errors_count=self.bot_status.errors_count + 1,
-                last_error=str(e),
-                last_error_at=timezone.now()
-            )
+            self.counters.error(str(e))
             return False
         finally:
             self.is_running = False
+            await self.pipeline.drain(settings.PARSER_DRAIN_TIMEOUT)
+            await self._close_buffers()
+            await self._flush_high_water_marks()
+            await self._flush_status()
+            await self._save_snapshot()
             await self._update_bot_status(is_running=False)
     
+    async def _probe_chats(self, chat_ids):
+        """Параллельная проверка доступности чатов
+        
+        Не более PARSER_PROBE_CONCURRENCY запросов get_entity одновременно.
+        При FloodWait все проверки приостанавливаются на указанное Telegram время.
+        Подтвержденные чаты сразу добавляются в прослушивание пачками.
+        """
+        total = len(chat_ids)
+        semaphore = asyncio.Semaphore(settings.PARSER_PROBE_CONCURRENCY)
+        progress_every = max(settings.PARSER_PROBE_PROGRESS_EVERY, 1)
+        resume_at = 0.0
+        
+        async def probe(chat_id):
+            nonlocal resume_at
+            async with semaphore:
+                for _ in range(settings.PARSER_PROBE_FLOOD_RETRIES + 1):
+                    delay = resume_at - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    try:
+                        return chat_id, await self.client.get_entity(chat_id), None
+                    except errors.FloodWaitError as e:
+                        resume_at = max(resume_at, time.monotonic() + e.seconds + 1)
+                        logger.warning(f"⏳ FloodWait {e.seconds}s при проверке чата {chat_id}, пауза")
+                    except Exception as e:
+                        return chat_id, None, str(e)
+                # Доступ не проверен (не удалось из-за лимитов) - это не повод деактивировать чат
+                return chat_id, None, None
+        
+        logger.info(f"🔍 ПРОВЕРКА ДОСТУПНОСТИ {total} ЧАТОВ (параллельно: {settings.PARSER_PROBE_CONCURRENCY})")
+        started = time.monotonic()
+        accessible_chats = []
+        unverified_chats = []
+        inaccessible_chats = []
+        confirmed_batch = []
+        
+        try:
+            for idx, future in enumerate(asyncio.as_completed([probe(chat_id) for chat_id in chat_ids]), 1):
+                chat_id, chat, error = await future
+                
+                if chat is not None:
+                    self.entity_cache.put(chat_id, chat)
+                    self.chat_verified_at[chat_id] = time.time()
+                    accessible_chats.append(chat_id)
+                    confirmed_batch.append(chat_id)
+                
+                    if len(accessible_chats) <= 20:  # Логируем первые 20
+                        chat_username = getattr(chat, 'username', None)
+                        username_str = f"@{chat_username}" if chat_username else "приватный"
+                        logger.info(f"  ✅ {getattr(chat, 'title', 'Unknown')} (ID: {chat_id}, {username_str})")
+                elif error is None:
+                    unverified_chats.append(chat_id)
+                    confirmed_batch.append(chat_id)
+                    logger.warning(f"  ⚠️ Chat ID {chat_id}: не проверен из-за FloodWait, слушаем без проверки")
+                else:
+                    inaccessible_chats.append((chat_id, error))
+                    if "not found" in error.lower() or "invalid" in error.lower():
+                        logger.warning(f"  ❌ Chat ID {chat_id}: БОТ УДАЛЁН ИЗ ЧАТА - {error}")
+                    else:
+                        logger.warning(f"  ⚠️ Chat ID {chat_id}: Ошибка доступа - {error}")
+                
+                # Подключаем подтвержденные чаты к прослушиванию пачками
+                if confirmed_batch and (len(confirmed_batch) >= progress_every or idx == total):
+                    self.monitored_chats = self.monitored_chats | frozenset(confirmed_batch)
+                    self._register_message_handler()
+                    confirmed_batch = []
+                
+                if idx % progress_every == 0 or idx == total:
+                    logger.info(
+                        f"🔍 Проверено {idx}/{total} чатов: ✅ {len(accessible_chats)}, "
+                        f"❌ {len(inaccessible_chats)}, ⏳ {len(unverified_chats)} "
+                        f"({time.monotonic() - started:.1f}s)"
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Chat probe failed after {len(accessible_chats)} chats: {e}")
+            return
+        
+        # Итоговая статистика
+        logger.info("=" * 80)
+        logger.info(f"📊 ИТОГОВАЯ СТАТИСТИКА ЧАТОВ:")
+        logger.info(f"   ✅ Доступных чатов: {len(accessible_chats)}")
+        logger.info(f"   ❌ Недоступных чатов: {len(inaccessible_chats)}")
+        logger.info(f"   ⏳ Не проверено (FloodWait): {len(unverified_chats)}")
+        if total:
+            logger.info(f"   📈 Процент доступности: {len(accessible_chats) / total * 100:.1f}%")
+        logger.info(f"   ⏱️ Время проверки: {time.monotonic() - started:.1f}s")
+        
+        if inaccessible_chats:
+            logger.warning(f"⚠️ НЕДОСТУПНЫЕ ЧАТЫ (возможно бот удалён):")
+            for chat_id, error in inaccessible_chats[:10]:
+                logger.warning(f"   - Chat ID {chat_id}: {error}")
+            if len(inaccessible_chats) > 10:
+                logger.warning(f"   ... и ещё {len(inaccessible_chats) - 10} чатов")
+            
+            # Автоматически деактивируем недоступные чаты
+            await self.cleanup_inaccessible_chats(inaccessible_chats)
+        
+        logger.info("=" * 80)
+        logger.info(f"🎯 Мониторится {len(self.monitored_chats)} доступных чатов")
+        
+        await self._update_bot_status(total_chats_monitored=len(self.monitored_chats))
+        await self._save_snapshot()
+        
+        self._start_catch_up(accessible_chats + unverified_chats)
+    
+    async def _load_high_water_marks(self):
+        """Загрузить high-water marks чатов из GlobalChat"""
+        from asgiref.sync import sync_to_async
+        from .models import GlobalChat
+        
+        @sync_to_async
+        def load():
+            return dict(
+                GlobalChat.objects.filter(last_message_id__isnull=False)
+                .values_list('chat_id', 'last_message_id')
+            )
+        
+        return await load()
+    
+    def _start_catch_up(self, chat_ids):
+        """Запустить фоновую догрузку сообщений для чатов с известным high-water mark
+        
+        До конца догрузки чата его отметку держит барьер (high_water_marks + 1),
+        зарегистрированный при запуске парсера: живые сообщения чата не сдвинут
+        отметку через еще не догруженный промежуток.
+        """
+        targets = [
+            (chat_id, self.high_water_marks[chat_id])
+            for chat_id in chat_ids
+            if self.high_water_marks.get(chat_id)
+        ]
+        if targets:
+            self._catchup_tasks.append(asyncio.create_task(self._catch_up(targets)))
+    
+    async def _catch_up(self, targets, delay: float = 0):
+        """Догрузка сообщений, пропущенных за время простоя
+        
+        Для каждого чата запрашиваются сообщения новее min_id (не больше
+        PARSER_CATCHUP_LIMIT), не более PARSER_CATCHUP_CONCURRENCY чатов
+        одновременно. FloodWait и ошибки повторяются с паузой до
+        PARSER_CATCHUP_DEADLINE секунд от начала прохода; недогруженные чаты
+        уходят в новый проход через PARSER_CATCHUP_RETRY_DELAY секунд и
+        продолжают с последнего полученного сообщения. Сообщения ставятся в
+        пайплайн с ожиданием места при любой политике переполнения. Уже
+        сохраненные в RawMessage сообщения тоже обрабатываются (их отправка в
+        Celery могла не состояться), но в RawMessage второй раз не пишутся.
+        """
+        if delay:
+            await asyncio.sleep(delay)
+        
+        semaphore = asyncio.Semaphore(settings.PARSER_CATCHUP_CONCURRENCY)
+        started = time.monotonic()
+        deadline = started + settings.PARSER_CATCHUP_DEADLINE
+        
+        async def catch_up_chat(chat_id, min_id):
+            """(догружено сообщений, min_id для следующего прохода или None - чат догружен)"""
+            async with semaphore:
+                fetched = scanned = failures = 0
+                known_ids = None
+                while True:
+                    try:
+                        if known_ids is None:
+                            known_ids = await self._get_raw_message_ids(chat_id, min_id)
+                        async for message in self.client.iter_messages(
+                            chat_id,
+                            min_id=min_id,
+                            reverse=True,
+                            limit=settings.PARSER_CATCHUP_LIMIT - scanned
+                        ):
+                            # При повторе продолжаем с последнего полученного
+                            scanned += 1
+                            if message.id in known_ids:
+                                self._raw_saved.add((chat_id, message.id))
+                            self.high_water.start(chat_id, message.id)
+                            if not await self.pipeline.put(message, wait=True):
+                                # Парсер останавливается - сообщение достанется следующему запуску
+                                return fetched, min_id
+                            min_id = max(min_id, message.id)
+                            fetched += 1
+                        if scanned >= settings.PARSER_CATCHUP_LIMIT:
+                            logger.warning(f"⚠️ Catch-up of chat {chat_id} stopped at limit of {settings.PARSER_CATCHUP_LIMIT} messages")
+                        return fetched, None
+                    except errors.FloodWaitError as e:
+                        pause = e.seconds + 1
+                        logger.warning(f"⏳ FloodWait {e.seconds}s при догрузке чата {chat_id}")
+                    except Exception as e:
+                        failures += 1
+                        pause = min(2 ** failures, 60)
+                        logger.warning(f"⚠️ Catch-up of chat {chat_id} failed: {e}, retry in {pause}s")
+                    
+                    if time.monotonic() + pause > deadline:
+                        return fetched, min_id
+                    await asyncio.sleep(pause)
+        
+        logger.info(f"📥 Catch-up started for {len(targets)} chats")
+        results = await asyncio.gather(
+            *(catch_up_chat(chat_id, min_id) for chat_id, min_id in targets),
+            return_exceptions=True
+        )
+        
+        recovered = 0
+        unfinished = []
+        for (chat_id, min_id), result in zip(targets, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"⚠️ Catch-up failed for chat {chat_id}: {result}")
+                unfinished.append((chat_id, min_id))
+                continue
+            fetched, resume_from = result
+            recovered += fetched
+            if resume_from is None:
+                # Чат догружен - барьер больше не держит его отметку
+                self.high_water.done(chat_id, self.high_water_marks[chat_id] + 1)
+            else:
+                unfinished.append((chat_id, resume_from))
+        
+        logger.info(
+            f"📥 Catch-up finished: {recovered} missed messages recovered "
+            f"from {len(targets)} chats in {time.monotonic() - started:.1f}s"
+        )
+        if unfinished and self.is_running:
+            logger.warning(
+                f"📥 Catch-up unfinished for {len(unfinished)} chats, "
+                f"next pass in {settings.PARSER_CATCHUP_RETRY_DELAY}s"
+            )
+            self._catchup_tasks.append(asyncio.create_task(
+                self._catch_up(unfinished, delay=settings.PARSER_CATCHUP_RETRY_DELAY)
+            ))
+    
+    async def _get_raw_message_ids(self, chat_id, min_id):
+        """ID уже сохраненных сообщений чата новее min_id"""
+        from asgiref.sync import sync_to_async
+        from .models import RawMessage
+        
+        @sync_to_async
+        def load():
+            return set(
+                RawMessage.objects.filter(chat_id=chat_id, message_id__gt=min_id)
+                .values_list('message_id', flat=True)
+            )
+        
+        return await load()
+    
+    def _mark_seen(self, chat_id, message_id):
+        """Запомнить сообщение; False если оно уже обрабатывалось недавно"""
+        key = (chat_id, message_id)
+        if key in self._seen_messages:
+            return False
+        
+        self._seen_messages[key] = None
+        while len(self._seen_messages) > settings.PARSER_SEEN_CACHE_SIZE:
+            self._seen_messages.popitem(last=False)
+        return True
+    
+    def _on_dispatched(self, items):
+        """Пачка ушла в Celery - ее сообщения больше не держат high-water marks"""
+        for message_data in items:
+            self.high_water.done(message_data['chat_id'], message_data['message_id'])
+    
+    async def _flush_high_water_marks(self):
+        """Сохранить high-water marks чатов в GlobalChat
+        
+        Отметки сдвигаются только по сообщениям, отправленным в Celery
+        (HighWaterTracker), поэтому не опережают недоставленные сообщения.
+        """
+        from asgiref.sync import sync_to_async
+        from django.db.models import Q
+        from .models import GlobalChat
+        
+        for chat_id, message_id in self.high_water.advance().items():
+            if message_id > self._pending_high_water.get(chat_id, 0):
+                self._pending_high_water[chat_id] = message_id
+        if not self._pending_high_water:
+            return
+        
+        pending, self._pending_high_water = self._pending_high_water, {}
+        
+        @sync_to_async
+        def flush():
+            with transaction.atomic():
+                for chat_id, message_id in pending.items():
+                    GlobalChat.objects.filter(chat_id=chat_id).filter(
+                        Q(last_message_id__isnull=True) | Q(last_message_id__lt=message_id)
+                    ).update(last_message_id=message_id)
+        
+        try:
+            await flush()
+        except Exception as e:
+            # Вернем отметки, чтобы сохранить их в следующий раз
+            for chat_id, message_id in pending.items():
+                if message_id > self._pending_high_water.get(chat_id, 0):
+                    self._pending_high_water[chat_id] = message_id
+            logger.error(f"❌ Failed to save high-water marks: {e}")
+    
+    async def _load_snapshot(self, candidate_chats):
+        """Загрузить снапшот: прогреть кэш сущностей, вернуть недавно проверенные чаты"""
+        try:
+            state = await asyncio.to_thread(self.snapshot.load)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to load parser snapshot: {e}")
+            return set()
+        
+        self.entity_cache.load(state['entities'])
+        
+        now = time.time()
+        fresh_chats = set()
+        for chat_id in candidate_chats:
+            chat_state = state['chats'].get(chat_id)
+            if not chat_state or not chat_state.get('accessible'):
+                continue
+            verified_at = chat_state.get('verified_at', 0)
+            if now - verified_at < settings.PARSER_CHAT_VERIFY_TTL:
+                self.chat_verified_at[chat_id] = verified_at
+                fresh_chats.add(chat_id)
+        
+        return fresh_chats
+    
+    async def _save_snapshot(self):
+        """Сохранить снапшот состояния парсера на диск"""
+        chats = {
+            chat_id: {'accessible': True, 'verified_at': verified_at}
+            for chat_id, verified_at in self.chat_verified_at.items()
+            if chat_id in self.monitored_chats
+        }
+        try:
+            await asyncio.to_thread(self.snapshot.save, self.entity_cache.export(), chats)
+            logger.debug(f"💾 Parser snapshot saved ({len(chats)} chats)")
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to save parser snapshot: {e}")
+    
     async def _get_all_monitored_chats(self):
         """Получить все уникальные чаты для мониторинга из GlobalChat"""
         from asgiref.sync import sync_to_async
-        from .models import GlobalChat
+        from .models import GlobalChat, ParserAccount
         
         @sync_to_async
         def get_chats():
@@ -187,6 +561,22 @@ class MasterTelegramParser:
             
             logger.info("=" * 80)
             
+            # В шардированном режиме оставляем только чаты этого шарда
+            if self.shard_name:
+                shard_names = list(
+                    ParserAccount.objects.filter(is_active=True)
+                    .exclude(session_string='')
+                    .values_list('name', flat=True)
+                )
+                if self.shard_name not in shard_names:
+                    logger.warning(f"⚠️ Shard '{self.shard_name}' is inactive, no chats assigned")
+                    return []
+                chat_ids = [
+                    chat_id for chat_id in chat_ids
+                    if assign_shard(chat_id, shard_names) == self.shard_name
+                ]
+                logger.info(f"🧩 Shard '{self.shard_name}': {len(chat_ids)} chats of {len(shard_names)} shards")
+            
             return chat_ids
         
         return await get_chats()
@@ -202,116 +592,155 @@ class MasterTelegramParser:
         
         return await get_count()
     
+    def _register_message_handler(self):
+        """(Пере)регистрировать обработчик NewMessage с фильтром по мониторимым чатам
+        
+        Фильтр chats= применяется Telethon до создания корутины обработчика,
+        поэтому апдейты из остальных диалогов отбрасываются без какой-либо работы.
+        """
+        if self._message_event is not None:
+            self.client.remove_event_handler(self._handle_new_message, self._message_event)
+        
+        # Telethon не считает frozenset списком, передаем list
+        self._message_event = events.NewMessage(chats=list(self.monitored_chats))
+        self.client.add_event_handler(self._handle_new_message, self._message_event)
+    
     async def _handle_new_message(self, event):
-        """Обработка нового сообщения"""
+        """Обработчик Telethon: только ставит сообщение в очередь ingest-пайплайна"""
+        # Страховка на случай гонки с перерегистрацией фильтра
+        if event.chat_id not in self.monitored_chats:
+            return
+        
+        # Отброшенное при переполнении сообщение держит high-water mark - его догрузит следующий запуск
+        self.high_water.start(event.chat_id, event.message.id)
+        await self.pipeline.put(event.message)
+    
+    async def _process_message(self, message):
+        """Обработка нового сообщения (выполняется воркерами пайплайна)"""
         try:
-            # Проверяем, что сообщение из мониторимого чата
-            if not hasattr(self, 'monitored_chats') or event.chat_id not in self.monitored_chats:
-                logger.debug(f"⏩ Сообщение из НЕмониторимого чата {event.chat_id}, пропускаем")
-                return
+            chat_id = message.chat_id
             
-            message = event.message
+            # Повторы (догрузка после простоя пересеклась с живым потоком) пропускаем
+            if not self._mark_seen(chat_id, message.id):
+                self.high_water.done(chat_id, message.id)
+                return
             
-            # Получаем информацию о чате для лога
-            chat_info = "Unknown"
-            try:
-                chat = await event.get_chat()
-                chat_info = f"{getattr(chat, 'title', 'Unknown')} (ID: {event.chat_id})"
-            except:
-                chat_info = f"Chat ID: {event.chat_id}"
+            # Информация о чате и отправителе (из кэша, при промахе - из Telethon)
+            chat_entity = await self._get_chat_entity(message)
+            sender_entity = await self._get_sender_entity(message)
             
+            chat_info = f"{chat_entity['title'] or 'Unknown'} (ID: {chat_id})" if chat_entity else f"Chat ID: {chat_id}"
             logger.info(f"🔔 НОВОЕ СООБЩЕНИЕ! Чат: {chat_info}, Message ID: {message.id}")
-            logger.info(f"   Текст: {(message.text or '')[:100]}...")
             
             # Базовая информация о сообщении
             message_data = {
                 'message_id': message.id,
-                'chat_id': event.chat_id,
+                'chat_id': chat_id,
                 'sender_id': message.sender_id,
                 'text': message.text or '',
                 'date': message.date.isoformat() if message.date else None,
-                'is_channel_post': getattr(event.chat, 'broadcast', False),
+                'is_channel_post': chat_entity['broadcast'] if chat_entity else False,
             }
             
-            # Получаем информацию об отправителе
-            try:
-                sender = await message.get_sender()
-                if sender:
-                    message_data.update({
-                        'sender_name': getattr(sender, 'first_name', '') or getattr(sender, 'title', ''),
-                        'sender_last_name': getattr(sender, 'last_name', ''),
-                        'sender_username': getattr(sender, 'username', ''),
-                    })
-                    logger.info(f"  👤 Sender: {message_data.get('sender_name')} (@{message_data.get('sender_username')})")
-            except Exception as e:
-                logger.warning(f"Failed to get sender info for message {message.id}: {e}")
+            if sender_entity:
+                message_data.update({
+                    'sender_name': sender_entity['first_name'] or sender_entity['title'],
+                    'sender_last_name': sender_entity['last_name'],
+                    'sender_username': sender_entity['username'],
+                })
+                logger.info(f"  👤 Sender: {message_data.get('sender_name')} (@{message_data.get('sender_username')})")
             
-            # Информация о чате
-            try:
-                chat = await event.get_chat()
-                if chat:
-                    message_data.update({
-                        'chat_title': getattr(chat, 'title', ''),
-                        'chat_username': getattr(chat, 'username', ''),
-                    })
-                    logger.info(f"  💬 Chat: {message_data.get('chat_title')} (ID: {event.chat_id})")
-            except Exception as e:
-                logger.warning(f"Failed to get chat info for message {message.id}: {e}")
+            if chat_entity:
+                message_data.update({
+                    'chat_title': chat_entity['title'],
+                    'chat_username': chat_entity['username'],
+                })
             
             logger.info(f"  📝 Text preview: {(message.text or '')[:100]}")
             
-            # Сохраняем сырое сообщение в БД для отладки
-            await self._save_raw_message(message_data)
+            # Сохраняем сырое сообщение в БД для отладки (догруженное - если его там еще нет)
+            if (chat_id, message.id) in self._raw_saved:
+                self._raw_saved.discard((chat_id, message.id))
+            else:
+                await self._save_raw_message(message_data)
             
-            # Отправляем в Celery для обработки
-            process_message_task.delay(message_data)
+            # Отправляем в Celery для обработки (пачками)
+            await self.dispatcher.add(message_data)
             
-            # Обновляем статистику
-            await self._increment_message_counter()
+            # Обновляем статистику (сбрасывается в БД вместе с heartbeat)
+            self.counters.message_processed()
             
-            logger.info(f"✅ Message {message.id} from chat {event.chat_id} processed and saved")
+            logger.info(f"✅ Message {message.id} from chat {chat_id} processed and saved")
             
         except Exception as e:
-            logger.error(f"❌ Error handling message {getattr(event.message, 'id', 'unknown')}: {e}")
-            await self._increment_error_counter(str(e))
+            logger.error(f"❌ Error handling message {getattr(message, 'id', 'unknown')}: {e}")
+            self.counters.error(str(e))
+    
+    async def _get_chat_entity(self, message):
+        """Данные чата сообщения из кэша сущностей (при промахе - через Telethon)"""
+        cached = self.entity_cache.get(message.chat_id)
+        if cached is not None:
+            return cached
+        
+        try:
+            chat = await message.get_chat()
+            if chat:
+                return self.entity_cache.put(message.chat_id, chat)
+        except Exception as e:
+            logger.warning(f"Failed to get chat info for message {message.id}: {e}")
+        return None
+    
+    async def _get_sender_entity(self, message):
+        """Данные отправителя из кэша сущностей (при промахе - через Telethon)"""
+        if message.sender_id is None:
+            return None
+        
+        cached = self.entity_cache.get(message.sender_id)
+        if cached is not None:
+            return cached
+        
+        try:
+            sender = await message.get_sender()
+            if sender:
+                return self.entity_cache.put(message.sender_id, sender)
+        except Exception as e:
+            logger.warning(f"Failed to get sender info for message {message.id}: {e}")
+        return None
     
     async def _save_raw_message(self, message_data):
-        """Сохранить сырое сообщение в БД"""
+        """Поставить сырое сообщение в буфер на пакетную запись в БД"""
         try:
-            from asgiref.sync import sync_to_async
-            from .models import RawMessage
-            from datetime import datetime
-            
-            @sync_to_async
-            def save_message():
-                # Парсим дату
-                if message_data.get('date'):
-                    try:
-                        message_date = datetime.fromisoformat(message_data['date'].replace('Z', '+00:00'))
-                    except:
-                        message_date = timezone.now()
-                else:
-                    message_date = timezone.now()
-                
-                RawMessage.objects.create(
-                    message_id=message_data['message_id'],
-                    chat_id=message_data['chat_id'],
-                    chat_name=message_data.get('chat_title', ''),
-                    sender_id=message_data.get('sender_id'),
-                    sender_name=message_data.get('sender_name', ''),
-                    sender_username=message_data.get('sender_username', ''),
-                    message_text=message_data.get('text', ''),
-                    message_date=message_date,
-                    is_channel_post=message_data.get('is_channel_post', False),
-                )
-            
-            await save_message()
-            logger.debug(f"Saved raw message {message_data['message_id']}")
+            await self.raw_buffer.add(message_data)
         except Exception as e:
-            logger.error(f"Failed to save raw message: {e}")
+            logger.error(f"Failed to buffer raw message: {e}")
+    
+    async def _buffers_flush_loop(self):
+        """Сброс буферов (сырые сообщения, пачки для Celery) по возрасту"""
+        buffers = (self.raw_buffer, self.dispatcher)
+        interval = max(min(b.max_age for b in buffers) / 2, 0.1)
+        while self.is_running:
+            try:
+                await asyncio.sleep(interval)
+                for buffer in buffers:
+                    if buffer.is_stale:
+                        await buffer.flush()
+            except Exception as e:
+                logger.error(f"❌ Buffer flush error: {e}")
+    
+    async def _close_buffers(self):
+        """Финальный сброс буферов при остановке, возвращает число несброшенных элементов"""
+        lost_raw = await self.raw_buffer.close()
+        lost_dispatch = await self.dispatcher.close()
+        if lost_raw or lost_dispatch:
+            error = f"{lost_raw} raw messages and {lost_dispatch} queued messages were not flushed on shutdown"
+            logger.error(f"❌ {error}")
+            self.counters.error(error)
+        else:
+            logger.info("📦 All buffers flushed")
+        return lost_raw + lost_dispatch
     
     async def _update_bot_status(self, **fields):
-        """Обновить статус бота"""
+        """Обновить статус бота (только переданные поля, счетчики не затираются)"""
         from asgiref.sync import sync_to_async
         
         @sync_to_async
@@ -319,30 +748,56 @@ class MasterTelegramParser:
             if self.bot_status:
                 for field, value in fields.items():
                     setattr(self.bot_status, field, value)
-                self.bot_status.save()
+                self.bot_status.save(update_fields=list(fields))
         
         await update_status()
     
-    async def _increment_message_counter(self):
-        """Увеличить счетчик обработанных сообщений"""
+    async def _flush_status(self):
+        """Сбросить накопленные счетчики и heartbeat одним UPDATE
+        
+        Счетчики увеличиваются выражениями F() на стороне БД, поэтому
+        параллельные писатели не теряют обновления.
+        """
         from asgiref.sync import sync_to_async
         
+        if not self.bot_status:
+            return
+        
+        snapshot = self.counters.take()
+        fields = {
+            'last_heartbeat': timezone.now(),
+            'metrics': self._collect_metrics(),
+        }
+        if snapshot['processed']:
+            fields['messages_processed_today'] = F('messages_processed_today') + snapshot['processed']
+            fields['messages_processed_total'] = F('messages_processed_total') + snapshot['processed']
+        if snapshot['errors']:
+            fields['errors_count'] = F('errors_count') + snapshot['errors']
+            fields['last_error'] = snapshot['last_error']
+            fields['last_error_at'] = snapshot['last_error_at']
+        
         @sync_to_async
-        def increment():
-            if self.bot_status:
-                self.bot_status.messages_processed_today += 1
-                self.bot_status.messages_processed_total += 1
-                self.bot_status.save(update_fields=['messages_processed_today', 'messages_processed_total'])
-        
-        await increment()
-    
-    async def _increment_error_counter(self, error_text):
-        """Увеличить счетчик ошибок"""
-        await self._update_bot_status(
-            errors_count=self.bot_status.errors_count + 1,
-            last_error=error_text[:1000],  # Ограничиваем длину
-            last_error_at=timezone.now()
-        )
+        def flush():
+            BotStatus.objects.filter(pk=self.bot_status.pk).update(**fields)
+        
+        try:
+            await flush()
+        except Exception as e:
+            # Значения не потеряются - уйдут со следующим сбросом
+            self.counters.restore(snapshot)
+            logger.error(f"❌ Failed to flush bot status counters: {e}")
+    
+    def _collect_metrics(self):
+        """Метрики парсера для BotStatus.metrics"""
+        return {
+            'throughput': self.counters.get_stats(),
+            'pipeline': self.pipeline.get_stats(),
+            'raw_buffer': self.raw_buffer.get_stats(),
+            'dispatcher': self.dispatcher.get_stats(),
+            'high_water': self.high_water.get_stats(),
+            'entity_cache': self.entity_cache.get_stats(),
+            'monitored_chats': len(self.monitored_chats),
+        }
     
     async def cleanup_inaccessible_chats(self, inaccessible_chat_ids):
         """Пометить недоступные чаты как неактивные в базе данных"""
@@ -352,6 +807,14 @@ class MasterTelegramParser:
         if not inaccessible_chat_ids:
             return
         
+        # Аккаунт шарда может просто не состоять в чате - глобально чат не выключаем
+        if self.shard_name:
+            logger.warning(
+                f"⚠️ Shard '{self.shard_name}' has no access to {len(inaccessible_chat_ids)} chats, "
+                f"add the account to them; chats are left active"
+            )
+            return
+        
         @sync_to_async
         def deactivate_chats():
             # Деактивируем недоступные чаты
@@ -360,6 +823,10 @@ class MasterTelegramParser:
                 is_active=True
             ).update(is_active=False)
             
+            # update() не вызывает сигналы - сообщаем воркерам сами
+            if updated:
+                record_change('reload')
+            
             logger.info(f"🗑️ Автоматически деактивировано {updated} недоступных чатов в базе данных")
             
             return updated
@@ -367,18 +834,27 @@ class MasterTelegramParser:
         return await deactivate_chats()
     
     async def _heartbeat_loop(self):
-        """Цикл heartbeat для обновления статуса"""
-        heartbeat_counter = 0
+        """Цикл heartbeat: сброс счетчиков, логирование метрик, перезагрузка чатов"""
+        flush_interval = settings.PARSER_STATUS_FLUSH_INTERVAL
+        last_stats_log = last_reload = time.monotonic()
         while self.is_running:
             try:
-                await asyncio.sleep(60)  # Каждую минуту
-                heartbeat_counter += 1
+                await asyncio.sleep(flush_interval)
                 
-                await self._update_bot_status(last_heartbeat=timezone.now())
+                await self._flush_status()
+                await self._flush_high_water_marks()
                 logger.debug("💓 Heartbeat updated")
                 
+                now = time.monotonic()
+                
+                # Раз в минуту пишем метрики в лог
+                if now - last_stats_log >= 60:
+                    last_stats_log = now
+                    logger.info(f"📊 Parser metrics: {self._collect_metrics()}")
+                
                 # Каждые 5 минут перезагружаем список чатов
-                if heartbeat_counter % 5 == 0:
+                if now - last_reload >= 300:
+                    last_reload = now
                     await self.reload_monitored_chats()
                     
             except Exception as e:
@@ -387,12 +863,17 @@ class MasterTelegramParser:
     async def reload_monitored_chats(self):
         """Перезагрузка списка мониторимых чатов"""
         try:
+            # Пока идет стартовая проверка доступа, список чатов формирует она
+            if self._probe_task is not None and not self._probe_task.done():
+                logger.debug("⏩ Chat probe still running, skipping reload")
+                return
+            
             logger.info("🔄 Reloading monitored chats list...")
             new_chats = await self._get_all_monitored_chats()
             
             # Проверяем изменения
-            added = set(new_chats) - set(self.monitored_chats)
-            removed = set(self.monitored_chats) - set(new_chats)
+            added = set(new_chats) - self.monitored_chats
+            removed = self.monitored_chats - set(new_chats)
             
             if added:
                 logger.info(f"✅ Added new chats to monitoring: {added}")
@@ -400,24 +881,80 @@ class MasterTelegramParser:
                 logger.info(f"⚠️ Removed chats from monitoring: {removed}")
             
             if added or removed:
-                self.monitored_chats = new_chats
+                self.monitored_chats = frozenset(new_chats)
+                self._register_message_handler()
                 logger.info(f"📺 Now monitoring {len(self.monitored_chats)} chats")
             else:
                 logger.debug("✔️ No changes in monitored chats")
+            
+            await self._save_snapshot()
                 
         except Exception as e:
             logger.error(f"❌ Error reloading monitored chats: {e}")
     
     async def stop(self):
-        """Остановка парсера"""
+        """Остановка парсера
+        
+        Возвращает False, если часть сообщений не удалось дописать в БД или
+        отправить в Celery (подробности - в логе и в BotStatus.last_error).
+        """
         logger.info("🛑 Stopping master parser...")
         self.is_running = False
         
+        if self._probe_task is not None and not self._probe_task.done():
+            self._probe_task.cancel()
+        for task in self._catchup_tasks:
+            task.cancel()
+        
+        # Перестаем принимать новые сообщения и дорабатываем очередь
+        await self.pipeline.drain(settings.PARSER_DRAIN_TIMEOUT)
+        
+        # Дописываем в БД и отправляем в Celery всё, что осталось в буферах
+        lost = await self._close_buffers()
+        await self._flush_high_water_marks()
+        await self._flush_status()
+        await self._save_snapshot()
+        
         if self.client and self.client.is_connected():
             await self.client.disconnect()
         
         await self._update_bot_status(is_running=False)
+        if lost:
+            logger.error(f"⚠️ Master parser stopped, {lost} buffered messages lost")
+            return False
         logger.info("✅ Master parser stopped")
+        return True
+
+
+def create_shard_parsers(shard_names=None):
+    """Создать парсеры для активных авторизованных ParserAccount (все или перечисленные)"""
+    from .models import ParserAccount
+    
+    accounts = ParserAccount.objects.filter(is_active=True).exclude(session_string='')
+    if shard_names:
+        accounts = accounts.filter(name__in=shard_names)
+    
+    return [
+        MasterTelegramParser(
+            shard_name=account.name,
+            session_string=account.session_string,
+            api_id=account.api_id,
+            api_hash=account.api_hash,
+        )
+        for account in accounts
+    ]
+
+
+async def run_parsers(parsers):
+    """Запустить несколько парсеров (шардов) в одном процессе"""
+    results = await asyncio.gather(
+        *(parser.start_monitoring() for parser in parsers),
+        return_exceptions=True
+    )
+    for parser, result in zip(parsers, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ Parser {parser.status_name} failed: {result}")
+    return results
 
 
 # Глобальный экземпляр парсера
@@ -0,0 +1,126 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.telegram_parser import ai_cache
+from apps.telegram_parser.ai_cache import AIVerdictCache, verdict_key
+from apps.telegram_parser.message_processor import MessageProcessor
+
+from .test_keyword_matcher import make_group
+from .test_routing import DictCache
+
+
+class VerdictCacheStore(DictCache):
+    def set_many(self, values, timeout=None):
+        self.data.update(values)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@override_settings(AI_MODEL='grok-3-mini')
+class VerdictKeyTests(SimpleTestCase):
+    def test_key_uses_normalized_text(self):
+        self.assertEqual(verdict_key('Сдам КВАРТИРУ!!!', 'аренда'), verdict_key('сдам квартиру', ' аренда '))
+
+    def test_key_depends_on_prompt_and_model(self):
+        key = verdict_key('сдам квартиру', 'аренда')
+        self.assertNotEqual(key, verdict_key('сдам квартиру', 'продажа'))
+        with override_settings(AI_MODEL='grok-4'):
+            self.assertNotEqual(key, verdict_key('сдам квартиру', 'аренда'))
+
+
+@override_settings(AI_VERDICT_CACHE_TTL=60, AI_VERDICT_CACHE_MAX_ENTRIES=2)
+class AIVerdictCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.store = VerdictCacheStore()
+        patcher = mock.patch.object(ai_cache, 'cache', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = AIVerdictCache()
+
+    def test_set_and_get(self):
+        self.cache.set('a', (True, 'YES'))
+        self.assertEqual(self.cache.get('a'), (True, 'YES'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get_many(['a', 'b', 'a']), {'a': (True, 'YES')})
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores']), (3, 2, 1))
+
+    def test_oldest_entry_is_evicted(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, (False, 'NO'))
+        self.assertEqual(set(self.cache.get_many(['a', 'b', 'c'])), {'b', 'c'})
+        self.assertEqual(self.cache.get_stats()['evictions'], 1)
+
+    def test_rewriting_same_key_does_not_evict_it(self):
+        self.cache.set('a', (True, 'YES'))
+        self.cache.set('b', (True, 'YES'))
+        self.cache.set('b', (False, 'NO'))
+        self.assertEqual(self.cache.get_many(['a', 'b']), {'b': (False, 'NO')})
+        self.cache.set('b', (True, 'YES'))
+        self.assertEqual(self.cache.get('b'), (True, 'YES'))
+
+    @override_settings(AI_VERDICT_CACHE_TTL=0)
+    def test_disabled(self):
+        self.cache.set('a', (True, 'YES'))
+        self.assertEqual(self.store.data, {})
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_cache_errors_are_not_fatal(self):
+        with mock.patch.object(self.store, 'get_many', side_effect=ConnectionError('redis down')):
+            with self.assertLogs('telegram_parser', level='ERROR'):
+                self.assertEqual(self.cache.get_many(['a']), {})
+        with mock.patch.object(self.store, 'incr', side_effect=ConnectionError('redis down')):
+            with self.assertLogs('telegram_parser', level='ERROR'):
+                self.cache.set('a', (True, 'YES'))
+        self.assertEqual(self.cache.get_stats()['errors'], 2)
+
+
+@override_settings(AI_VERDICT_CACHE_TTL=60, AI_VERDICT_CACHE_MAX_ENTRIES=100)
+class AIFilterCacheTests(SimpleTestCase):
+    """Кэш в AI фильтре процессора: повторный текст не идет в API, ошибки не кэшируются"""
+
+    def setUp(self):
+        self.store = VerdictCacheStore()
+        self.verdict_cache = AIVerdictCache()
+        self.ai_client = mock.Mock()
+        self.classifiers = mock.Mock()
+        self.classifiers.predict.return_value = None
+        self.classifiers.decide.return_value = None
+        for target, value in (
+            ('apps.telegram_parser.ai_cache.cache', self.store),
+            ('apps.telegram_parser.message_processor.ai_verdict_cache', self.verdict_cache),
+            ('apps.telegram_parser.message_processor.ai_client', self.ai_client),
+            ('apps.telegram_parser.message_processor.lead_classifiers', self.classifiers),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.processor = MessageProcessor()
+        self.group = make_group(1, 10, ['квартир'], use_ai_filter=True, ai_prompt='Только аренда')
+
+    def test_repeated_text_uses_cache(self):
+        self.ai_client.check_many.return_value = [(True, 'YES')]
+        first = self.processor._check_ai_filter('Сдам квартиру', self.group)
+        self.assertEqual((first['ai_approved'], first['ai_cached']), (True, False))
+
+        second = self.processor._check_ai_filter('СДАМ квартиру!', self.group)
+        self.assertEqual((second['ai_approved'], second['ai_result'], second['ai_cached']), (True, 'YES', True))
+        self.assertEqual(
+            [call.args[0] for call in self.ai_client.check_many.call_args_list if call.args[0]],
+            [[('Сдам квартиру', 'Только аренда')]],
+        )
+
+    def test_duplicates_in_one_call_go_to_api_once(self):
+        self.ai_client.check_many.return_value = [(False, 'NO')]
+        verdicts = self.processor._check_ai_filters([('Сдам квартиру', self.group), ('сдам квартиру', self.group)])
+        self.assertEqual([verdict['ai_approved'] for verdict in verdicts], [False, False])
+        self.assertEqual(len(self.ai_client.check_many.call_args.args[0]), 1)
+
+    def test_errors_are_not_cached(self):
+        self.ai_client.check_many.return_value = [ConnectionError('api down')]
+        verdict = self.processor._check_ai_filter('Сдам квартиру', self.group)
+        # При ошибке AI сообщение пропускается
+        self.assertTrue(verdict['ai_approved'])
+        self.assertEqual(self.verdict_cache.get_many([verdict_key('Сдам квартиру', 'Только аренда')]), {})
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import re
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.telegram_parser.ai_client import AIClient, build_batch_messages, parse_batch_verdicts, parse_verdict
+
+
+class FakeCompletions:
+    """chat.completions.create: YES для сообщений со словом "квартир", иначе NO"""
+
+    def __init__(self, fail_on=None, batch_answer=None):
+        self.calls = []
+        self.fail_on = fail_on
+        self.batch_answer = batch_answer
+
+    async def create(self, model, messages, max_tokens, temperature):
+        self.calls.append(messages)
+        await asyncio.sleep(0)
+        content = messages[-1]['content']
+        if self.fail_on and self.fail_on in content:
+            raise ConnectionError('api down')
+
+        numbered = re.findall(r'\[(\d+)\] ([^\n]*)', content)
+        if numbered:
+            if self.batch_answer is not None:
+                answer = self.batch_answer
+            else:
+                answer = json.dumps({number: 'YES' if 'квартир' in text else 'NO' for number, text in numbered})
+        else:
+            answer = 'YES' if 'квартир' in content else 'NO'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+
+
+class AIClientTestCase(SimpleTestCase):
+    def make_client(self, **completions):
+        client = AIClient()
+        self.completions = FakeCompletions(**completions)
+
+        async def create_client():
+            client._client = SimpleNamespace(chat=SimpleNamespace(completions=self.completions))
+            client._semaphore = asyncio.Semaphore(2)
+
+        client._create_client = create_client
+        self.addCleanup(self.stop_client, client)
+        return client
+
+    def stop_client(self, client):
+        if client._loop is not None:
+            client._loop.call_soon_threadsafe(client._loop.stop)
+
+
+@override_settings(AI_BATCH_MAX_SIZE=1)
+class AIClientPoolTests(AIClientTestCase):
+    def test_check_many_keeps_order(self):
+        client = self.make_client()
+        verdicts = client.check_many([('Сдам квартиру', 'аренда'), ('Продам гараж', 'аренда'), ('квартира', 'аренда')])
+        self.assertEqual(verdicts, [(True, 'YES'), (False, 'NO'), (True, 'YES')])
+        self.assertEqual(len(self.completions.calls), 3)
+
+    def test_errors_are_returned_in_place(self):
+        client = self.make_client(fail_on='гараж')
+        verdicts = client.check_many([('Сдам квартиру', 'аренда'), ('Продам гараж', 'аренда')])
+        self.assertEqual(verdicts[0], (True, 'YES'))
+        self.assertIsInstance(verdicts[1], ConnectionError)
+        stats = client.get_stats()
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['checks'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_empty(self):
+        client = self.make_client()
+        self.assertEqual(client.check_many([]), [])
+        self.assertIsNone(client._loop)
+
+    def test_loop_is_started_once_per_process(self):
+        client = self.make_client()
+        client.check_many([('квартира', 'аренда')])
+        loop = client._loop
+        client.check_many([('квартира', 'аренда')])
+        self.assertIs(client._loop, loop)
+
+        # После fork loop родителя недоступен - клиент создается заново
+        with mock.patch('apps.telegram_parser.ai_client.os.getpid', return_value=os.getpid() + 1):
+            client.check_many([('квартира', 'аренда')])
+            self.assertIsNot(client._loop, loop)
+        loop.call_soon_threadsafe(loop.stop)
+
+    def test_concurrency_is_limited_by_pool(self):
+        client = self.make_client()
+        client.check_many([(f'квартира {index}', 'аренда') for index in range(10)])
+        stats = client.get_stats()
+        self.assertEqual(stats['requests'], 10)
+        self.assertLessEqual(stats['max_in_flight'], 2)
+        self.assertIsNotNone(stats['latency_p95_ms'])
+
+
+class ParseBatchVerdictsTests(SimpleTestCase):
+    def test_parses_answers_in_order(self):
+        self.assertEqual(
+            parse_batch_verdicts('{"2": "no", "1": "YES", "3": "да"}', 3),
+            [(True, 'YES'), (False, 'NO'), (True, 'ДА')],
+        )
+
+    def test_code_fence(self):
+        self.assertEqual(parse_batch_verdicts('```json\n{"1": "YES"}\n```', 1), [(True, 'YES')])
+
+    def test_unparsed_answers(self):
+        for answer in ('', 'YES', '["YES"]', '{"1": "YES"}', '{"1": "YES", "2": true}', '{"1": "YES", "2": "NO"'):
+            with self.subTest(answer=answer):
+                self.assertIsNone(parse_batch_verdicts(answer, 2))
+
+    def test_single_verdict(self):
+        self.assertEqual(parse_verdict(' yes\n'), (True, 'YES'))
+        self.assertEqual(parse_verdict('Нет'), (False, 'НЕТ'))
+        self.assertEqual(parse_verdict(None), (False, ''))
+
+    def test_batch_prompt_numbers_messages(self):
+        messages = build_batch_messages(['первое', 'второе'], 'Только аренда')
+        self.assertIn('Только аренда', messages[0]['content'])
+        self.assertIn('2 сообщений', messages[0]['content'])
+        self.assertIn('[1] первое\n\n[2] второе', messages[1]['content'])
+
+
+@override_settings(AI_BATCH_MAX_SIZE=3, AI_BATCH_WAIT=0.05)
+class AIClientBatchTests(AIClientTestCase):
+    def test_same_prompt_is_batched(self):
+        client = self.make_client()
+        verdicts = client.check_many([('Сдам квартиру', 'аренда'), ('Продам гараж', 'аренда'), ('квартира', 'аренда')])
+        self.assertEqual(verdicts, [(True, 'YES'), (False, 'NO'), (True, 'YES')])
+        self.assertEqual(len(self.completions.calls), 1)
+        stats = client.get_stats()
+        self.assertEqual((stats['batch_requests'], stats['avg_batch_size'], stats['checks']), (1, 3.0, 3))
+
+    def test_batches_are_split_by_size_and_prompt(self):
+        client = self.make_client()
+        items = [(f'квартира {index}', 'аренда') for index in range(4)] + [('квартира', 'продажа')]
+        verdicts = client.check_many(items)
+        self.assertEqual(verdicts, [(True, 'YES')] * 5)
+        # 3 + 1 по промпту "аренда" и 1 по промпту "продажа" (одиночные - обычным запросом)
+        self.assertEqual(len(self.completions.calls), 3)
+        self.assertEqual(client.get_stats()['batch_requests'], 1)
+
+    def test_unparsed_batch_falls_back_to_single_checks(self):
+        client = self.make_client(batch_answer='YES')
+        with self.assertLogs('telegram_parser', level='WARNING'):
+            verdicts = client.check_many([('Сдам квартиру', 'аренда'), ('Продам гараж', 'аренда')])
+        self.assertEqual(verdicts, [(True, 'YES'), (False, 'NO')])
+        self.assertEqual(len(self.completions.calls), 3)
+        self.assertEqual(client.get_stats()['batch_fallbacks'], 1)
+
+    def test_failed_batch_fails_every_check(self):
+        client = self.make_client(fail_on='[1]')
+        verdicts = client.check_many([('Сдам квартиру', 'аренда'), ('Продам гараж', 'аренда')])
+        self.assertTrue(all(isinstance(verdict, ConnectionError) for verdict in verdicts))
+        self.assertEqual(client.get_stats()['checks'], 0)
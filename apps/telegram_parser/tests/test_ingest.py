@@ -0,0 +1,510 @@
+import asyncio
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.telegram_parser.ingest import (
+    BatchBuffer, EntityCache, HighWaterTracker, IngestPipeline, MessageBatchDispatcher, ParserSnapshot,
+    StatusCounters, assign_shard
+)
+
+
+class ListBuffer(BatchBuffer):
+    """Буфер, который пишет в список; первые fail_times записей падают"""
+
+    RETRY_BASE_DELAY = 0.0
+    RETRY_MAX_DELAY = 0.0
+
+    def __init__(self, fail_times=0, reject=(), **kwargs):
+        super().__init__(**kwargs)
+        self.written = []
+        self.fail_times = fail_times
+        self.reject = set(reject)
+
+    async def _write(self, items):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError('broker is down')
+        self.written.append([item for item in items if item not in self.reject])
+        return [item for item in items if item in self.reject]
+
+
+class BatchBufferTests(SimpleTestCase):
+
+    async def test_flushes_when_full(self):
+        buffer = ListBuffer(max_size=3)
+        for item in range(7):
+            await buffer.add(item)
+
+        self.assertEqual(buffer.written, [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(buffer.depth, 1)
+
+    async def test_failed_batch_is_requeued_in_order(self):
+        buffer = ListBuffer(fail_times=1, max_size=10)
+        for item in range(3):
+            await buffer.add(item)
+
+        self.assertEqual(await buffer.flush(), 0)
+        await buffer.add(3)
+        self.assertEqual(buffer.depth, 4)
+        self.assertEqual(buffer.failed_count, 3)
+
+        self.assertEqual(await buffer.flush(), 4)
+        self.assertEqual(buffer.written, [[0, 1, 2, 3]])
+        self.assertEqual(buffer.get_stats()['consecutive_failures'], 0)
+
+    async def test_backoff_blocks_automatic_flush(self):
+        buffer = ListBuffer(fail_times=1, max_size=2, max_age=0.0)
+        buffer.RETRY_BASE_DELAY = buffer.RETRY_MAX_DELAY = 60.0
+        await buffer.add(1)
+        await buffer.add(2)
+
+        self.assertTrue(buffer.is_backing_off)
+        self.assertFalse(buffer.is_stale)
+        self.assertEqual(await buffer.flush(force=False), 0)
+        # Явный сброс пауза не останавливает
+        self.assertEqual(await buffer.flush(), 2)
+        self.assertFalse(buffer.is_backing_off)
+
+    async def test_partial_write_requeues_only_failed_items(self):
+        buffer = ListBuffer(reject={2}, max_size=10)
+        for item in range(4):
+            await buffer.add(item)
+
+        self.assertEqual(await buffer.flush(), 3)
+        self.assertEqual(buffer.written, [[0, 1, 3]])
+        self.assertEqual(buffer.depth, 1)
+
+    async def test_oldest_items_dropped_over_max_pending(self):
+        buffer = ListBuffer(fail_times=100, max_size=2, max_pending=5)
+        for item in range(10):
+            await buffer.add(item)
+
+        self.assertEqual(buffer.depth, 5)
+        self.assertEqual(buffer.dropped, 5)
+        buffer.fail_times = 0
+        await buffer.flush()
+        self.assertEqual(buffer.written, [[5, 6, 7, 8, 9]])
+
+    async def test_close_retries_and_reports_leftovers(self):
+        buffer = ListBuffer(fail_times=2, max_size=10)
+        await buffer.add(1)
+        self.assertEqual(await buffer.close(attempts=3), 0)
+        self.assertEqual(buffer.written, [[1]])
+
+        buffer = ListBuffer(fail_times=5, max_size=10)
+        await buffer.add(1)
+        await buffer.add(2)
+        self.assertEqual(await buffer.close(attempts=3), 2)
+        self.assertEqual(buffer.written, [])
+
+
+@mock.patch.object(MessageBatchDispatcher, 'RETRY_BASE_DELAY', 0.0)
+class MessageBatchDispatcherTests(SimpleTestCase):
+
+    def messages(self, count):
+        return [{'chat_id': -100, 'message_id': message_id, 'text': 'x'} for message_id in range(count)]
+
+    async def test_sends_one_batch_task(self):
+        dispatcher = MessageBatchDispatcher(max_size=10)
+        with mock.patch('apps.telegram_parser.ingest.process_message_batch_task') as batch_task:
+            for message in self.messages(3):
+                await dispatcher.add(message)
+            self.assertEqual(await dispatcher.flush(), 3)
+
+        batch_task.delay.assert_called_once_with(self.messages(3))
+
+    async def test_falls_back_to_single_messages(self):
+        dispatcher = MessageBatchDispatcher(max_size=10)
+        with mock.patch('apps.telegram_parser.ingest.process_message_batch_task') as batch_task, \
+                mock.patch('apps.telegram_parser.ingest.process_message_task') as single_task:
+            batch_task.delay.side_effect = ValueError('message too large')
+            for message in self.messages(3):
+                await dispatcher.add(message)
+            self.assertEqual(await dispatcher.flush(), 3)
+
+        self.assertEqual(single_task.delay.call_count, 3)
+        self.assertEqual(dispatcher.get_stats()['single_fallbacks'], 1)
+        self.assertEqual(dispatcher.depth, 0)
+
+    async def test_keeps_messages_while_broker_is_down(self):
+        dispatcher = MessageBatchDispatcher(max_size=10)
+        with mock.patch('apps.telegram_parser.ingest.process_message_batch_task') as batch_task, \
+                mock.patch('apps.telegram_parser.ingest.process_message_task') as single_task:
+            batch_task.delay.side_effect = ConnectionError('broker is down')
+            single_task.delay.side_effect = [None, ConnectionError('broker is down')]
+            for message in self.messages(3):
+                await dispatcher.add(message)
+            self.assertEqual(await dispatcher.flush(), 1)
+            self.assertEqual(dispatcher.depth, 2)
+
+            batch_task.delay.side_effect = None
+            self.assertEqual(await dispatcher.flush(), 2)
+
+        batch_task.delay.assert_called_with(self.messages(3)[1:])
+        self.assertEqual(dispatcher.dropped, 0)
+
+
+class HighWaterTrackerTests(SimpleTestCase):
+
+    def test_mark_advances_over_contiguous_delivered_messages(self):
+        tracker = HighWaterTracker()
+        tracker.load({1: 10})
+        for message_id in (11, 12, 13):
+            tracker.start(1, message_id)
+
+        # Воркеры доставили 12 и 13 раньше 11
+        tracker.done(1, 12)
+        tracker.done(1, 13)
+        self.assertEqual(tracker.advance(), {})
+        self.assertEqual(tracker.mark(1), 10)
+
+        tracker.done(1, 11)
+        self.assertEqual(tracker.advance(), {1: 13})
+        self.assertEqual(tracker.get_stats()['pending'], 0)
+
+    def test_lost_message_holds_mark(self):
+        tracker = HighWaterTracker()
+        for message_id in (5, 6, 7):
+            tracker.start(1, message_id)
+        tracker.done(1, 5)
+        tracker.done(1, 7)
+
+        self.assertEqual(tracker.advance(), {1: 5})
+        self.assertEqual(tracker.mark(1), 5)
+
+    def test_repeated_message_needs_every_done(self):
+        tracker = HighWaterTracker()
+        tracker.start(1, 5)
+        tracker.start(1, 5)
+        tracker.done(1, 5)
+        self.assertEqual(tracker.advance(), {})
+
+        tracker.done(1, 5)
+        self.assertEqual(tracker.advance(), {1: 5})
+
+    def test_catch_up_barrier(self):
+        tracker = HighWaterTracker()
+        tracker.load({1: 100})
+        tracker.start(1, 101)
+        # Живое сообщение доставлено, пока догрузка 101..199 еще идет
+        tracker.start(1, 200)
+        tracker.done(1, 200)
+        self.assertEqual(tracker.advance(), {})
+
+        tracker.done(1, 101)
+        self.assertEqual(tracker.advance(), {1: 200})
+
+    def test_ignores_messages_behind_mark(self):
+        tracker = HighWaterTracker()
+        tracker.load({1: 10})
+        tracker.start(1, 9)
+        tracker.done(1, 9)
+        self.assertEqual(tracker.advance(), {})
+        self.assertEqual(tracker.get_stats()['pending'], 0)
+
+    def test_chats_are_independent(self):
+        tracker = HighWaterTracker()
+        tracker.start(1, 5)
+        tracker.start(2, 7)
+        tracker.done(2, 7)
+        self.assertEqual(tracker.advance(), {2: 7})
+
+    def test_too_many_pending_abandons_oldest(self):
+        tracker = HighWaterTracker(max_pending=2)
+        with self.assertLogs('telegram_parser', level='WARNING') as logs:
+            for message_id in range(1, 6):
+                tracker.start(1, message_id)
+
+        # Каждое брошенное сообщение считается и логируется один раз
+        self.assertEqual(tracker.abandoned, 3)
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(tracker.get_stats()['pending'], 2)
+        # Отметка - сразу под самым старым еще ожидающим сообщением (4)
+        self.assertEqual(tracker.advance(), {1: 3})
+        self.assertEqual(tracker.advance(), {})
+
+        tracker.done(1, 4)
+        tracker.done(1, 5)
+        self.assertEqual(tracker.advance(), {1: 5})
+
+    def test_overflow_skips_delivered_messages(self):
+        tracker = HighWaterTracker(max_pending=2)
+        for message_id in (1, 2):
+            tracker.start(1, message_id)
+        tracker.done(1, 1)
+        # 1 уже доставлено - бросать нечего
+        with self.assertNoLogs('telegram_parser', level='WARNING'):
+            tracker.start(1, 3)
+        self.assertEqual(tracker.abandoned, 0)
+        self.assertEqual(tracker.advance(), {1: 1})
+
+
+@mock.patch.object(ListBuffer, 'RETRY_BASE_DELAY', 0.0)
+class FlushCallbackTests(SimpleTestCase):
+
+    async def test_on_flushed_receives_only_written_items(self):
+        flushed = []
+        buffer = ListBuffer(reject={2}, max_size=10, on_flushed=flushed.extend)
+        for item in range(4):
+            await buffer.add(item)
+        await buffer.flush()
+
+        self.assertEqual(flushed, [0, 1, 3])
+
+    async def test_on_flushed_not_called_on_failure(self):
+        flushed = []
+        buffer = ListBuffer(fail_times=1, max_size=10, on_flushed=flushed.extend)
+        await buffer.add(1)
+        await buffer.flush()
+        self.assertEqual(flushed, [])
+
+
+class EntityCacheTests(SimpleTestCase):
+
+    def test_stores_only_used_fields(self):
+        cache = EntityCache()
+        chat = SimpleNamespace(title='Барахолка', username='baraholka', broadcast=True, participants=[1, 2])
+
+        data = cache.put(-1001, chat)
+
+        self.assertEqual(data, {
+            'title': 'Барахолка', 'username': 'baraholka', 'first_name': '', 'last_name': '', 'broadcast': True,
+        })
+        self.assertEqual(cache.get(-1001), data)
+        self.assertEqual(cache.get(-1002), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        cache = EntityCache(max_size=2)
+        cache.put(1, SimpleNamespace(title='one'))
+        cache.put(2, SimpleNamespace(title='two'))
+        cache.get(1)
+        cache.put(3, SimpleNamespace(title='three'))
+
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_expired_entries_are_misses(self):
+        cache = EntityCache(ttl=10)
+        with mock.patch('apps.telegram_parser.ingest.time.monotonic', return_value=100.0):
+            cache.put(1, SimpleNamespace(title='one'))
+        with mock.patch('apps.telegram_parser.ingest.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get(1))
+            self.assertEqual(cache.export(), {})
+        self.assertEqual(len(cache), 0)
+
+    def test_none_peer_is_not_cached(self):
+        cache = EntityCache()
+        cache.put(None, SimpleNamespace(first_name='Аноним'))
+        self.assertEqual(len(cache), 0)
+
+    def test_export_and_load_round_trip(self):
+        cache = EntityCache()
+        cache.put(1, SimpleNamespace(first_name='Иван', last_name='Петров'))
+
+        restored = EntityCache(max_size=10)
+        restored.load(cache.export())
+
+        self.assertEqual(restored.get(1)['first_name'], 'Иван')
+
+
+class StatusCountersTests(SimpleTestCase):
+
+    def test_take_resets_pending_values(self):
+        counters = StatusCounters()
+        counters.message_processed(5)
+        counters.error('boom')
+
+        snapshot = counters.take()
+
+        self.assertEqual((snapshot['processed'], snapshot['errors'], snapshot['last_error']), (5, 1, 'boom'))
+        self.assertEqual((counters.pending_processed, counters.pending_errors, counters.last_error), (0, 0, ''))
+        self.assertEqual(len(counters.rates), 1)
+
+    def test_restore_after_failed_flush(self):
+        counters = StatusCounters()
+        counters.message_processed(3)
+        counters.error('old error')
+        snapshot = counters.take()
+        counters.message_processed(2)
+        counters.error('new error')
+
+        counters.restore(snapshot)
+
+        self.assertEqual(counters.pending_processed, 5)
+        self.assertEqual(counters.pending_errors, 2)
+        # Более свежая ошибка не затирается старой
+        self.assertEqual(counters.last_error, 'new error')
+
+    def test_error_text_is_truncated(self):
+        counters = StatusCounters()
+        counters.error('x' * 5000)
+        self.assertEqual(len(counters.last_error), 1000)
+
+    def test_rates_history(self):
+        counters = StatusCounters(history_size=2)
+        self.assertEqual(counters.get_stats()['messages_per_sec'], 0.0)
+        with mock.patch('apps.telegram_parser.ingest.time.monotonic', side_effect=[10.0, 20.0]):
+            counters._interval_started = 0.0
+            counters.message_processed(100)
+            counters.take()
+            counters.message_processed(50)
+            counters.take()
+
+        stats = counters.get_stats()
+        self.assertEqual(stats['messages_per_sec'], 5.0)
+        self.assertEqual(stats['peak_messages_per_sec'], 10.0)
+        self.assertEqual(stats['avg_messages_per_sec'], 7.5)
+
+
+class ParserSnapshotTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'parser_state.json')
+
+    def test_round_trip_restores_integer_keys(self):
+        snapshot = ParserSnapshot(self.path)
+        snapshot.save({-1001: {'title': 'Чат'}}, {-1001: {'accessible': True, 'verified_at': 123.0}})
+
+        state = snapshot.load()
+
+        self.assertEqual(state['entities'], {-1001: {'title': 'Чат'}})
+        self.assertEqual(state['chats'], {-1001: {'accessible': True, 'verified_at': 123.0}})
+        self.assertFalse(os.path.exists(f'{self.path}.tmp'))
+
+    def test_missing_file_is_empty(self):
+        self.assertEqual(ParserSnapshot(self.path).load(), {'entities': {}, 'chats': {}})
+
+    def test_corrupt_file_is_empty(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{"version": 1, "entities": ')
+        self.assertEqual(ParserSnapshot(self.path).load(), {'entities': {}, 'chats': {}})
+
+    def test_other_version_is_ignored(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': ParserSnapshot.VERSION + 1, 'entities': {'1': {}}, 'chats': {}}, f)
+        self.assertEqual(ParserSnapshot(self.path).load(), {'entities': {}, 'chats': {}})
+
+
+class AssignShardTests(SimpleTestCase):
+
+    def test_no_shards(self):
+        self.assertIsNone(assign_shard(-1001, []))
+
+    def test_is_deterministic_and_order_independent(self):
+        for chat_id in range(-1000, -900):
+            self.assertEqual(assign_shard(chat_id, ['a', 'b', 'c']), assign_shard(chat_id, ['c', 'a', 'b']))
+
+    def test_spreads_chats_over_shards(self):
+        counts = {}
+        for chat_id in range(3000):
+            shard = assign_shard(chat_id, ['a', 'b', 'c'])
+            counts[shard] = counts.get(shard, 0) + 1
+        self.assertEqual(set(counts), {'a', 'b', 'c'})
+        self.assertTrue(all(count > 800 for count in counts.values()))
+
+    def test_adding_shard_moves_chats_only_to_it(self):
+        for chat_id in range(1000):
+            before = assign_shard(chat_id, ['a', 'b', 'c'])
+            after = assign_shard(chat_id, ['a', 'b', 'c', 'd'])
+            self.assertIn(after, (before, 'd'))
+
+
+class IngestPipelineTests(SimpleTestCase):
+
+    def make_pipeline(self, overflow, max_size=2, workers=1):
+        self.handled = []
+        self.release = asyncio.Event()
+
+        async def handler(item):
+            await self.release.wait()
+            if item == 'bad':
+                raise ValueError('bad message')
+            self.handled.append(item)
+
+        return IngestPipeline(handler, max_size=max_size, workers=workers, overflow=overflow)
+
+    async def fill(self, pipeline, items):
+        pipeline.start()
+        # Первый элемент забирает воркер, остальные ждут в очереди
+        await pipeline.put(items[0])
+        await asyncio.sleep(0)
+        return [await pipeline.put(item) for item in items[1:]]
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            IngestPipeline(lambda item: None, overflow='drop_random')
+
+    async def test_drop_newest(self):
+        pipeline = self.make_pipeline('drop_newest')
+        accepted = await self.fill(pipeline, [1, 2, 3, 4])
+        self.release.set()
+        await pipeline.drain(timeout=1)
+
+        self.assertEqual(accepted, [True, True, False])
+        self.assertEqual(self.handled, [1, 2, 3])
+        self.assertEqual(pipeline.dropped, 1)
+
+    async def test_drop_oldest(self):
+        pipeline = self.make_pipeline('drop_oldest')
+        accepted = await self.fill(pipeline, [1, 2, 3, 4])
+        self.release.set()
+        await pipeline.drain(timeout=1)
+
+        self.assertEqual(accepted, [True, True, True])
+        self.assertEqual(self.handled, [1, 3, 4])
+        self.assertEqual(pipeline.dropped, 1)
+
+    async def test_block_waits_for_space(self):
+        pipeline = self.make_pipeline('block')
+        await self.fill(pipeline, [1, 2, 3])
+        blocked = asyncio.ensure_future(pipeline.put(4))
+        await asyncio.sleep(0.01)
+        self.assertFalse(blocked.done())
+
+        self.release.set()
+        self.assertTrue(await blocked)
+        await pipeline.drain(timeout=1)
+        self.assertEqual(self.handled, [1, 2, 3, 4])
+        self.assertEqual(pipeline.dropped, 0)
+
+    async def test_worker_survives_handler_errors(self):
+        pipeline = self.make_pipeline('block', max_size=10)
+        self.release.set()
+        pipeline.start()
+        for item in ('bad', 1, 2):
+            await pipeline.put(item)
+        await pipeline.drain(timeout=1)
+
+        self.assertEqual(self.handled, [1, 2])
+        self.assertEqual(pipeline.processed, 3)
+
+    async def test_wait_overrides_drop_policy(self):
+        pipeline = self.make_pipeline('drop_newest')
+        await self.fill(pipeline, [1, 2, 3])
+        waiting = asyncio.ensure_future(pipeline.put(4, wait=True))
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiting.done())
+
+        self.release.set()
+        self.assertTrue(await waiting)
+        await pipeline.drain(timeout=1)
+        self.assertEqual(self.handled, [1, 2, 3, 4])
+        self.assertEqual(pipeline.dropped, 0)
+
+    async def test_rejects_after_drain(self):
+        pipeline = self.make_pipeline('block')
+        self.release.set()
+        pipeline.start()
+        await pipeline.drain(timeout=1)
+
+        self.assertFalse(await pipeline.put(1))
+        self.assertEqual(pipeline.rejected, 1)
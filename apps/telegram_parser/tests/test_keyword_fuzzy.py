@@ -0,0 +1,111 @@
+import itertools
+import random
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.telegram_parser.keyword_fuzzy import FuzzyIndex, fuzzy_distance_for, levenshtein_within, trigrams
+from apps.telegram_parser.keyword_matcher import KeywordMatcher
+
+from .test_keyword_matcher import FakeRoutingTable, make_group
+
+
+def levenshtein(a, b):
+    """Эталон: полная матрица расстояний"""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+class LevenshteinWithinTests(SimpleTestCase):
+    def test_examples(self):
+        self.assertTrue(levenshtein_within('доставка', 'доставка', 0))
+        self.assertTrue(levenshtein_within('доставка', 'дастовка', 2))
+        self.assertFalse(levenshtein_within('доставка', 'дастовка', 1))
+        self.assertTrue(levenshtein_within('доставка', 'доставк', 1))
+        self.assertFalse(levenshtein_within('дом', 'доставка', 2))
+        self.assertTrue(levenshtein_within('', 'аб', 2))
+
+    def test_matches_full_matrix(self):
+        rng = random.Random(42)
+        for _ in range(500):
+            a = ''.join(rng.choice('абв') for _ in range(rng.randint(0, 7)))
+            b = ''.join(rng.choice('абв') for _ in range(rng.randint(0, 7)))
+            distance = levenshtein(a, b)
+            for max_distance in range(3):
+                with self.subTest(a=a, b=b, max_distance=max_distance):
+                    self.assertEqual(levenshtein_within(a, b, max_distance), distance <= max_distance)
+
+
+@override_settings(KEYWORD_FUZZY_MIN_LENGTH=5)
+class FuzzyDistanceForTests(SimpleTestCase):
+    def test_short_phrases_are_exact(self):
+        self.assertEqual(fuzzy_distance_for('дом', 2), 0)
+        self.assertEqual(fuzzy_distance_for('д о м', 2), 0)
+
+    def test_distance_keeps_a_shared_trigram(self):
+        self.assertEqual(fuzzy_distance_for('доставка', 1), 1)
+        self.assertEqual(fuzzy_distance_for('доставка', 2), 2)
+        # 6 триграмм: после двух правок общих могло бы не остаться
+        self.assertEqual(fuzzy_distance_for('книга', 2), 1)
+        for text, max_distance in itertools.product(('книга', 'доставка', 'ремонт кухни'), (1, 2)):
+            distance = fuzzy_distance_for(text, max_distance)
+            self.assertGreater(len(trigrams(text)) - 3 * distance, 0)
+
+
+class FuzzyIndexTests(SimpleTestCase):
+    def test_finds_typos(self):
+        index = FuzzyIndex([('доставка', 1, 0), ('ремонт кухни', 2, 1)])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search('нужна даставка мебели'), {0})
+        self.assertEqual(index.search('делаем ремонт кухнн и ванной'), {1})
+        self.assertEqual(index.search('дастовка'), set())
+
+    def test_window_has_same_word_count(self):
+        index = FuzzyIndex([('ремонт кухни', 1, 0)])
+        self.assertEqual(index.search('ремонткухни'), set())
+        self.assertEqual(index.search('ремонт кухни'), {0})
+
+    def test_empty(self):
+        self.assertEqual(FuzzyIndex([]).search('доставка'), set())
+        self.assertEqual(FuzzyIndex([('доставка', 1, 0)]).search(''), set())
+
+    def test_stats(self):
+        index = FuzzyIndex([('доставка', 1, 0)])
+        index.search('даставка и доставка')
+        self.assertEqual(index.get_stats(), {'terms': 1, 'candidates_checked': 1, 'matches': 1})
+
+
+@override_settings(KEYWORD_FUZZY_MIN_LENGTH=5)
+class FuzzyMatchingTests(SimpleTestCase):
+    def setUp(self):
+        self.routing = FakeRoutingTable([])
+        patcher = mock.patch('apps.telegram_parser.keyword_matcher.routing_table', self.routing)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.matcher = KeywordMatcher()
+
+    def match(self, text):
+        return {
+            user_id: [(group.id, keywords) for group, keywords in matches]
+            for user_id, matches in self.matcher.match({'text': text}).items()
+        }
+
+    def test_group_with_typos(self):
+        self.routing.replace([make_group(1, 10, ['доставка', 'дом'], fuzzy_max_distance=1)])
+        self.assertEqual(self.match('Нужна даставка'), {10: [(1, ['доставка'])]})
+        # Короткие слова ищутся точно
+        self.assertEqual(self.match('дым'), {})
+        # Точное вхождение внутри слова находится, как в обычной группе
+        self.assertEqual(self.match('автодоставка'), {10: [(1, ['доставка'])]})
+
+    def test_exact_group_ignores_typos(self):
+        self.routing.replace([
+            make_group(1, 10, ['доставка'], fuzzy_max_distance=1),
+            make_group(2, 20, ['доставка']),
+        ])
+        self.assertEqual(self.match('даставка'), {10: [(1, ['доставка'])]})
@@ -0,0 +1,166 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.telegram_parser.keyword_matcher import AhoCorasick, KeywordMatcher
+
+
+def make_group(group_id, user_id, keywords, **fields):
+    values = {
+        'use_stemming': False, 'use_query_syntax': False, 'fuzzy_max_distance': 0,
+        'use_ai_filter': False, 'ai_prompt': '', 'name': f'group{group_id}',
+    }
+    values.update(fields)
+    return SimpleNamespace(id=group_id, user_id=user_id, keywords=keywords, **values)
+
+
+class FakeRoutingTable:
+    def __init__(self, groups):
+        self._groups = groups
+        self.groups_revision = 1
+
+    def refresh(self):
+        pass
+
+    def groups(self):
+        return self._groups
+
+    def replace(self, groups):
+        self._groups = groups
+        self.groups_revision += 1
+
+
+class AhoCorasickTests(SimpleTestCase):
+    def test_finds_overlapping_patterns(self):
+        automaton = AhoCorasick(['he', 'she', 'his', 'hers'])
+        found = automaton.search('ushers')
+        self.assertEqual({automaton.patterns[index] for index in found}, {'he', 'she', 'hers'})
+
+    def test_finds_patterns_inside_words(self):
+        automaton = AhoCorasick(['квартир', 'ремонт'])
+        self.assertEqual(automaton.search('сдам квартиру после ремонта'), {0, 1})
+
+    def test_no_match(self):
+        automaton = AhoCorasick(['аренда'])
+        self.assertEqual(automaton.search('продам гараж'), set())
+        self.assertEqual(automaton.search(''), set())
+
+    def test_empty_automaton(self):
+        automaton = AhoCorasick([])
+        self.assertEqual(automaton.search('любой текст'), set())
+        self.assertEqual(automaton.size, 1)
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.routing = FakeRoutingTable([])
+        patcher = mock.patch('apps.telegram_parser.keyword_matcher.routing_table', self.routing)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.matcher = KeywordMatcher()
+
+    def match(self, text):
+        return {
+            user_id: [(group.id, keywords) for group, keywords in matches]
+            for user_id, matches in self.matcher.match({'text': text}).items()
+        }
+
+    def test_matches_groups_of_all_users_in_one_pass(self):
+        self.routing.replace([
+            make_group(1, 10, ['квартир', 'дом']),
+            make_group(2, 10, ['гараж']),
+            make_group(3, 20, ['квартир']),
+        ])
+        self.assertEqual(
+            self.match('Сдам квартиру и гараж'),
+            {10: [(1, ['квартир']), (2, ['гараж'])], 20: [(3, ['квартир'])]},
+        )
+
+    def test_keywords_are_normalized_like_text(self):
+        self.routing.replace([make_group(1, 10, ['Ремонт  Квартир'])])
+        self.assertEqual(self.match('РЕМОНТ, квартир под ключ'), {10: [(1, ['Ремонт  Квартир'])]})
+
+    def test_keyword_order_follows_group(self):
+        self.routing.replace([make_group(1, 10, ['ремонт', 'квартир', 'дом'])])
+        self.assertEqual(self.match('дом и квартира, ремонт'), {10: [(1, ['ремонт', 'квартир', 'дом'])]})
+
+    def test_no_match_and_empty_text(self):
+        self.routing.replace([make_group(1, 10, ['квартир'])])
+        self.assertEqual(self.match('продам гараж'), {})
+        self.assertEqual(self.match('   '), {})
+
+    def test_legacy_keywords_match_as_phrases(self):
+        self.routing.replace([make_group(1, 10, ['Москва (центр)', 'rock&roll', '-20%'])])
+        self.assertEqual(self.match('Москва центр'), {10: [(1, ['Москва (центр)'])]})
+        self.assertEqual(self.match('rock roll'), {10: [(1, ['rock&roll'])]})
+        self.assertEqual(self.match('Москва'), {})
+        self.assertEqual(self.match('скидка -20%'), {10: [(1, ['-20%'])]})
+
+    def test_query_syntax_group(self):
+        self.routing.replace([
+            make_group(1, 10, ['квартир AND (купить OR сниму)', '-аренда'], use_query_syntax=True),
+        ])
+        self.assertEqual(self.match('Куплю квартиру'), {})
+        self.assertEqual(self.match('Сниму квартиру'), {10: [(1, ['квартир AND (купить OR сниму)'])]})
+        # "-аренда" - фильтр всей группы
+        self.assertEqual(self.match('Сниму квартиру, аренда на год'), {})
+
+    def test_invalid_query_matches_as_plain_text(self):
+        self.routing.replace([make_group(1, 10, ['ремонт (кухни'], use_query_syntax=True)])
+        with self.assertLogs('telegram_parser', level='WARNING'):
+            self.assertEqual(self.match('ремонт кухни'), {10: [(1, ['ремонт (кухни'])]})
+
+    def test_ignores_non_string_keywords(self):
+        self.routing.replace([make_group(1, 10, [None, 42, 'гараж'])])
+        self.assertEqual(self.match('гараж'), {10: [(1, ['гараж'])]})
+
+    def test_rebuilds_when_revision_changes(self):
+        self.routing.replace([make_group(1, 10, ['квартир'])])
+        self.assertEqual(self.match('гараж'), {})
+        self.assertEqual(self.matcher.rebuild_count, 1)
+
+        self.match('гараж')
+        self.assertEqual(self.matcher.rebuild_count, 1)
+
+        self.routing.replace([make_group(1, 10, ['гараж'])])
+        self.assertEqual(self.match('гараж'), {10: [(1, ['гараж'])]})
+        self.assertEqual(self.matcher.rebuild_count, 2)
+
+    def test_stemming_group_falls_back_to_substring(self):
+        self.routing.replace([make_group(1, 10, ['квартир'], use_stemming=True)])
+        with mock.patch('apps.telegram_parser.keyword_matcher.stemming.is_available', return_value=False):
+            self.assertEqual(self.match('сдам квартиру'), {10: [(1, ['квартир'])]})
+
+    def test_match_batch_keeps_order(self):
+        self.routing.replace([make_group(1, 10, ['квартир']), make_group(2, 20, ['гараж'])])
+        results = self.matcher.match_batch([{'text': 'гараж'}, {'text': ''}, {'text': None}, {'text': 'квартира'}])
+        self.assertEqual(
+            [{user_id: [group.id for group, _ in matches] for user_id, matches in result.items()} for result in results],
+            [{20: [2]}, {}, {}, {10: [1]}],
+        )
+
+    def test_match_batch_searches_same_text_once(self):
+        self.routing.replace([make_group(1, 10, ['квартир'])])
+        batch = [{'text': 'Сдам квартиру', 'chat_id': chat_id} for chat_id in (1, 2, 3)]
+        compiled = self.matcher.refresh()
+        with mock.patch.object(compiled, 'find_terms', wraps=compiled.find_terms) as find_terms:
+            results = self.matcher.match_batch(batch)
+        self.assertEqual(find_terms.call_count, 1)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result == results[0] and result for result in results))
+
+    def test_match_batch_uses_one_snapshot(self):
+        self.routing.replace([make_group(1, 10, ['квартир'])])
+        with mock.patch.object(self.matcher, 'refresh', wraps=self.matcher.refresh) as refresh:
+            self.matcher.match_batch([{'text': 'квартира'}, {'text': 'дом'}])
+        self.assertEqual(refresh.call_count, 1)
+
+    def test_get_stats(self):
+        self.assertEqual(self.matcher.get_stats(), {'rebuild_count': 0})
+        self.routing.replace([make_group(1, 10, ['квартир', 'дом']), make_group(2, 20, ['дом'])])
+        self.matcher.refresh()
+        stats = self.matcher.get_stats()
+        self.assertEqual(stats['terms'], 2)
+        self.assertEqual(stats['groups'], 2)
+        self.assertEqual(stats['rebuild_count'], 1)
@@ -0,0 +1,114 @@
+from django.test import SimpleTestCase
+
+from apps.telegram_parser.keyword_query import (
+    KeywordQueryError, compile_keyword, fuzzy_keyword, keyword_terms, parse_keyword, stem_keyword, validate_keyword
+)
+
+
+def evaluate(entry, found_terms):
+    """Вычислить строку группы над множеством найденных термов (по их тексту)"""
+    term_ids = {}
+    evaluator = compile_keyword(parse_keyword(entry), term_ids)
+    return evaluator(frozenset(term_ids[term] for term in found_terms if term in term_ids))
+
+
+class PlainKeywordTests(SimpleTestCase):
+    """Группы без языка запросов: строка - одна фраза, как до появления операторов"""
+
+    def test_operators_are_plain_text(self):
+        self.assertEqual(parse_keyword('Москва (центр)', query_syntax=False), ('term', 'москва центр'))
+        self.assertEqual(parse_keyword('rock&roll', query_syntax=False), ('term', 'rock roll'))
+        self.assertEqual(parse_keyword('a|b', query_syntax=False), ('term', 'a b'))
+        self.assertEqual(parse_keyword('-20% скидка', query_syntax=False), ('term', '20 скидка'))
+        self.assertEqual(parse_keyword('"под ключ"', query_syntax=False), ('term', 'под ключ'))
+        self.assertEqual(parse_keyword('ремонт AND NOT OR', query_syntax=False), ('term', 'ремонт and not or'))
+
+    def test_broken_syntax_is_valid(self):
+        validate_keyword('ремонт (кухни', query_syntax=False)
+        validate_keyword('"незакрытая', query_syntax=False)
+
+    def test_empty_phrase(self):
+        with self.assertRaises(KeywordQueryError):
+            validate_keyword('!!!', query_syntax=False)
+
+    def test_regex_keeps_prefix(self):
+        self.assertEqual(parse_keyword('re:\\d+ руб', query_syntax=False), ('regex', '\\d+ руб'))
+
+
+class ParseKeywordTests(SimpleTestCase):
+    def test_adjacent_words_are_one_phrase(self):
+        self.assertEqual(parse_keyword('Купить  квартиру'), ('term', 'купить квартиру'))
+
+    def test_quoted_phrase(self):
+        self.assertEqual(parse_keyword('"ремонт под ключ"'), ('term', 'ремонт под ключ'))
+
+    def test_operators(self):
+        self.assertEqual(
+            parse_keyword('ремонт AND (ванная OR кухня)'),
+            ('and', [('term', 'ремонт'), ('or', [('term', 'ванная'), ('term', 'кухня')])]),
+        )
+        self.assertEqual(parse_keyword('дом&сад'), ('and', [('term', 'дом'), ('term', 'сад')]))
+        self.assertEqual(parse_keyword('дом | дача'), ('or', [('term', 'дом'), ('term', 'дача')]))
+
+    def test_and_binds_tighter_than_or(self):
+        self.assertEqual(
+            parse_keyword('дом AND сад OR дача'),
+            ('or', [('and', [('term', 'дом'), ('term', 'сад')]), ('term', 'дача')]),
+        )
+
+    def test_negation(self):
+        self.assertEqual(
+            parse_keyword('купить квартиру -аренда'),
+            ('and', [('term', 'купить квартиру'), ('not', ('term', 'аренда'))]),
+        )
+        self.assertEqual(parse_keyword('NOT аренда'), ('not', ('term', 'аренда')))
+
+    def test_lowercase_operators_are_words(self):
+        self.assertEqual(parse_keyword('дом and сад'), ('term', 'дом and сад'))
+
+    def test_regex(self):
+        self.assertEqual(parse_keyword('re:ищу .{0,20} поставщик'), ('regex', 'ищу .{0,20} поставщик'))
+
+    def test_errors(self):
+        for entry in ('', '(дом', 'дом)', '"дом', 'дом AND', 'OR дом', '!!!', 're:(', 'дом AND ()'):
+            with self.subTest(entry=entry):
+                with self.assertRaises(KeywordQueryError):
+                    validate_keyword(entry)
+
+
+class CompileKeywordTests(SimpleTestCase):
+    def test_phrase(self):
+        self.assertTrue(evaluate('купить квартиру', ['купить квартиру']))
+        self.assertFalse(evaluate('купить квартиру', []))
+
+    def test_and_or_not(self):
+        entry = 'ремонт AND (ванная OR кухня) -аренда'
+        self.assertTrue(evaluate(entry, ['ремонт', 'кухня']))
+        self.assertFalse(evaluate(entry, ['ремонт']))
+        self.assertFalse(evaluate(entry, ['ремонт', 'ванная', 'аренда']))
+
+    def test_pure_negation_is_true_without_terms(self):
+        self.assertTrue(evaluate('-аренда', []))
+        self.assertFalse(evaluate('-аренда', ['аренда']))
+
+    def test_term_ids_are_shared(self):
+        term_ids = {}
+        compile_keyword(parse_keyword('дом OR сад'), term_ids)
+        compile_keyword(parse_keyword('сад AND дача'), term_ids)
+        self.assertEqual(term_ids, {'дом': 0, 'сад': 1, 'дача': 2})
+
+    def test_keyword_terms(self):
+        node = parse_keyword('(дом OR сад) AND NOT дача')
+        self.assertEqual(keyword_terms(node), ['дом', 'сад', 'дача'])
+        self.assertEqual(keyword_terms(parse_keyword('re:\\d+')), [('regex', '\\d+')])
+
+
+class TransformKeywordTests(SimpleTestCase):
+    def test_stem_keyword(self):
+        node = stem_keyword(parse_keyword('доставка -бесплатно OR курьер'), lambda phrase: phrase[:4])
+        self.assertEqual(node, ('or', [('and', [('stem', 'дост'), ('not', ('stem', 'бесп'))]), ('stem', 'курь')]))
+        self.assertEqual(stem_keyword(parse_keyword('re:\\d+'), lambda phrase: phrase[:4]), ('regex', '\\d+'))
+
+    def test_fuzzy_keyword_skips_short_terms(self):
+        node = fuzzy_keyword(parse_keyword('доставка OR дом'), 1)
+        self.assertEqual(node, ('or', [('fuzzy', 'доставка', 1), ('term', 'дом')]))
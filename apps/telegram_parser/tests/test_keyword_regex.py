@@ -0,0 +1,55 @@
+from django.test import SimpleTestCase, override_settings
+
+from apps.telegram_parser.keyword_regex import RegexSet, validate_regex
+
+
+class ValidateRegexTests(SimpleTestCase):
+    def test_valid(self):
+        validate_regex(r'\d{3,} ?руб')
+        validate_regex(r'(ищу|нужен) поставщик')
+
+    def test_invalid(self):
+        for pattern in ('', '(', '[a-', r'(\w+) \1', '(?P<price>\\d+)', '(?P=price)'):
+            with self.subTest(pattern=pattern):
+                with self.assertRaises(ValueError):
+                    validate_regex(pattern)
+
+
+@override_settings(KEYWORD_REGEX_TIME_BUDGET=1.0)
+class RegexSetTests(SimpleTestCase):
+    def test_empty_set_and_text(self):
+        self.assertEqual(RegexSet([]).search('текст'), set())
+        self.assertEqual(RegexSet([(r'\d+', 0)]).search(''), set())
+
+    def test_finds_all_matching_patterns(self):
+        regexes = RegexSet([(r'\d+ ?руб', 0), (r'ищу .{0,20}поставщик', 1), (r'аренд', 2)])
+        self.assertEqual(len(regexes), 3)
+        self.assertEqual(regexes.search('Ищу надежного поставщика, бюджет 5000 руб'), {0, 1})
+
+    def test_overlapping_matches(self):
+        # Обе регулярки совпадают с одной позиции - находятся обе
+        regexes = RegexSet([(r'цена', 0), (r'цена \d+', 1), (r'\d+', 2)])
+        self.assertEqual(regexes.search('цена 100'), {0, 1, 2})
+
+    def test_case_insensitive_on_raw_text(self):
+        regexes = RegexSet([(r'ООО «\w+»', 0)])
+        self.assertEqual(regexes.search('компания ооо «Вектор»'), {0})
+
+    def test_shared_term_id(self):
+        regexes = RegexSet([(r'дом', 5), (r'дача', 5)])
+        self.assertEqual(regexes.search('дача'), {5})
+
+    @override_settings(KEYWORD_REGEX_TIME_BUDGET=0)
+    def test_time_budget(self):
+        regexes = RegexSet([(r'\d+', 0)])
+        with self.assertLogs('telegram_parser', level='WARNING'):
+            self.assertEqual(regexes.search('123', context='(test)'), set())
+        self.assertEqual(regexes.get_stats()['timeouts'], 1)
+
+    def test_get_stats(self):
+        regexes = RegexSet([(r'\d+', 0)])
+        regexes.search('123')
+        stats = regexes.get_stats()
+        self.assertEqual(stats['patterns'], 1)
+        self.assertEqual(stats['timeouts'], 0)
+        self.assertIn(stats['engine'], ('regex', 're'))
@@ -0,0 +1,144 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.telegram_parser.lead_classifier import (
+    HOLDOUT_EVERY, LeadClassifiers, NaiveBayesModel, count_features, decide, extract_features, train
+)
+
+from .test_routing import FakeQuerySet
+
+POSITIVE_TEXTS = ['Куплю квартиру в центре', 'Ищу квартиру, куплю срочно', 'Куплю квартиру у собственника']
+NEGATIVE_TEXTS = ['Продам гараж недорого', 'Реклама: лучшие гаражи', 'Подписывайтесь на канал про гаражи']
+
+
+def make_samples(count):
+    """Размеченные примеры [(id, текст, квал?)] поровну по классам"""
+    samples = []
+    for index in range(count):
+        samples.append((2 * index + 1, POSITIVE_TEXTS[index % len(POSITIVE_TEXTS)], True))
+        samples.append((2 * index + 2, NEGATIVE_TEXTS[index % len(NEGATIVE_TEXTS)], False))
+    return samples
+
+
+class ExtractFeaturesTests(SimpleTestCase):
+    def test_words_and_pairs(self):
+        self.assertEqual(len(extract_features('Куплю квартиру срочно')), 5)
+        self.assertEqual(extract_features(''), set())
+
+    def test_normalized_text(self):
+        self.assertEqual(extract_features('КУПЛЮ, квартиру!'), extract_features('куплю квартиру'))
+
+    def test_count_features(self):
+        feature_counts, positive, negative = count_features([({'a', 'b'}, True), ({'a'}, False), ({'a'}, True)])
+        self.assertEqual(feature_counts, {'a': [2, 1], 'b': [1, 0]})
+        self.assertEqual((positive, negative), (2, 1))
+
+
+@override_settings(AI_CLASSIFIER_APPROVE_THRESHOLD=0.9, AI_CLASSIFIER_REJECT_THRESHOLD=0.1)
+class NaiveBayesModelTests(SimpleTestCase):
+    def setUp(self):
+        samples = [(extract_features(text), label) for _, text, label in make_samples(10)]
+        self.model = NaiveBayesModel(*count_features(samples))
+
+    def test_separates_classes(self):
+        self.assertGreater(self.model.probability('Куплю квартиру'), 0.9)
+        self.assertLess(self.model.probability('Продам гараж'), 0.1)
+
+    def test_unknown_text_stays_near_prior(self):
+        self.assertAlmostEqual(self.model.probability(''), 0.5)
+        self.assertIsNone(decide(self.model.probability('')))
+
+    def test_decide(self):
+        self.assertIs(decide(0.95), True)
+        self.assertIs(decide(0.05), False)
+        self.assertIsNone(decide(0.5))
+        self.assertIsNone(decide(None))
+
+
+@override_settings(
+    AI_CLASSIFIER_APPROVE_THRESHOLD=0.9,
+    AI_CLASSIFIER_REJECT_THRESHOLD=0.1,
+    AI_CLASSIFIER_MIN_SAMPLES=5,
+    AI_CLASSIFIER_MIN_ACCURACY=0.9,
+)
+class TrainTests(SimpleTestCase):
+    def test_accurate_model_is_active(self):
+        fields = train(make_samples(10))
+        self.assertTrue(fields['is_active'])
+        self.assertEqual(fields['holdout_accuracy'], 1.0)
+        self.assertEqual((fields['positive_samples'], fields['negative_samples']), (10, 10))
+
+    def test_holdout_is_every_nth_message(self):
+        with mock.patch('apps.telegram_parser.lead_classifier.NaiveBayesModel', wraps=NaiveBayesModel) as model:
+            train(make_samples(10))
+        # Первая модель - без отложенной выборки
+        feature_counts, positive, negative = model.call_args_list[0].args
+        self.assertEqual(positive + negative, 20 - 20 // HOLDOUT_EVERY)
+
+    def test_too_few_samples_is_inactive(self):
+        fields = train(make_samples(4))
+        self.assertFalse(fields['is_active'])
+
+    def test_inaccurate_model_is_inactive(self):
+        # Одинаковые тексты с противоположной разметкой
+        samples = [(index, 'Куплю квартиру', bool(index % 2)) for index in range(1, 41)]
+        fields = train(samples)
+        self.assertFalse(fields['is_active'])
+
+    def test_single_features_are_dropped(self):
+        fields = train([(1, 'Куплю квартиру', True), (2, 'Продам гараж', False)])
+        self.assertEqual(fields['feature_counts'], {})
+        self.assertIsNone(fields['holdout_accuracy'])
+
+
+@override_settings(
+    AI_CLASSIFIER_ENABLED=True,
+    AI_CLASSIFIER_APPROVE_THRESHOLD=0.9,
+    AI_CLASSIFIER_REJECT_THRESHOLD=0.1,
+    AI_CLASSIFIER_RELOAD_INTERVAL=300,
+)
+class LeadClassifiersTests(SimpleTestCase):
+    def setUp(self):
+        samples = [(extract_features(text), label) for _, text, label in make_samples(10)]
+        feature_counts, positive, negative = count_features(samples)
+        self.rows = [{
+            'keyword_group_id': 1, 'is_active': True, 'feature_counts': feature_counts,
+            'positive_samples': positive, 'negative_samples': negative,
+        }]
+        lead_classifier = SimpleNamespace(objects=SimpleNamespace(filter=lambda **kw: FakeQuerySet(self.rows).filter(**kw)))
+        patcher = mock.patch('apps.telegram_parser.models.LeadClassifier', lead_classifier)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.classifiers = LeadClassifiers()
+
+    def test_predict(self):
+        self.assertGreater(self.classifiers.predict(1, 'Куплю квартиру'), 0.9)
+        self.assertIsNone(self.classifiers.predict(2, 'Куплю квартиру'))
+
+    @override_settings(AI_CLASSIFIER_ENABLED=False)
+    def test_disabled(self):
+        self.assertIsNone(self.classifiers.predict(1, 'Куплю квартиру'))
+
+    def test_models_are_reloaded_after_interval(self):
+        self.classifiers.predict(1, 'Куплю квартиру')
+        self.rows.clear()
+        self.assertIsNotNone(self.classifiers.predict(1, 'Куплю квартиру'))
+
+        self.classifiers._loaded_at -= 300
+        self.assertIsNone(self.classifiers.predict(1, 'Куплю квартиру'))
+
+    def test_load_failure_keeps_models(self):
+        self.classifiers.predict(1, 'Куплю квартиру')
+        self.classifiers._loaded_at -= 300
+        with mock.patch('apps.telegram_parser.models.LeadClassifier.objects.filter', side_effect=ConnectionError('db down')):
+            with self.assertLogs('telegram_parser', level='ERROR'):
+                self.assertIsNotNone(self.classifiers.predict(1, 'Куплю квартиру'))
+
+    def test_decide_counts_stats(self):
+        for score in (0.95, 0.05, 0.5, None):
+            self.classifiers.decide(score)
+        self.assertEqual(self.classifiers.get_stats(), {
+            'models': 0, 'predictions': 3, 'approved': 1, 'rejected': 1, 'skip_rate': 0.667,
+        })
@@ -0,0 +1,183 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.telegram_parser.keyword_matcher import KeywordMatcher
+from apps.telegram_parser.message_processor import MessageProcessor
+
+from .test_keyword_matcher import FakeRoutingTable, make_group
+
+
+def make_user(user_id, chat_id, global_chat_id=1):
+    return {
+        'user__id': user_id,
+        'user__username': f'user{user_id}',
+        'user__notification_chat_id': None,
+        'global_chat__id': global_chat_id,
+        'global_chat__name': f'chat{chat_id}',
+        'global_chat__chat_id': chat_id,
+    }
+
+
+class FakeChatRouting(FakeRoutingTable):
+    def __init__(self, groups, users_by_chat):
+        super().__init__(groups)
+        self._users_by_chat = users_by_chat
+
+    def users_for_chat(self, chat_id):
+        return self._users_by_chat.get(chat_id, [])
+
+
+class MessageProcessorTestCase(SimpleTestCase):
+    def setUp(self):
+        self.groups = [
+            make_group(1, 10, ['квартир']),
+            make_group(2, 20, ['квартир', 'гараж']),
+        ]
+        self.routing = FakeChatRouting(self.groups, {
+            -1001: [make_user(10, -1001), make_user(20, -1001)],
+            -1002: [make_user(20, -1002, global_chat_id=2)],
+        })
+        self.matcher = KeywordMatcher()
+        for target, value in (
+            ('apps.telegram_parser.keyword_matcher.routing_table', self.routing),
+            ('apps.telegram_parser.message_processor.routing_table', self.routing),
+            ('apps.telegram_parser.message_processor.keyword_matcher', self.matcher),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.processor = MessageProcessor()
+
+
+class ProcessMessagesTests(MessageProcessorTestCase):
+    def test_matches_only_users_of_the_chat(self):
+        results = self.processor.process_messages([
+            {'chat_id': -1001, 'message_id': 1, 'text': 'Сдам квартиру'},
+            {'chat_id': -1002, 'message_id': 2, 'text': 'Сдам квартиру и гараж'},
+            {'chat_id': -1002, 'message_id': 3, 'text': 'Продам велосипед'},
+            {'chat_id': -1003, 'message_id': 4, 'text': 'Сдам квартиру'},
+        ])
+
+        self.assertEqual(
+            {key: [(user_data['user__id'], group.id, keywords) for user_data, group, keywords in matches]
+             for key, matches in results.items()},
+            {
+                (-1001, 1): [(10, 1, ['квартир']), (20, 2, ['квартир'])],
+                (-1002, 2): [(20, 2, ['квартир', 'гараж'])],
+            },
+        )
+
+    def test_batch_stats(self):
+        self.processor.process_messages([
+            {'chat_id': -1001, 'message_id': 1, 'text': 'Сдам квартиру'},
+            {'chat_id': -1001, 'message_id': 2, 'text': ''},
+        ])
+        stats = self.processor.last_batch_stats
+        self.assertEqual(stats['messages'], 2)
+        self.assertEqual(stats['matched_messages'], 1)
+        self.assertEqual(stats['matches'], 2)
+
+    def test_empty_batch(self):
+        self.assertEqual(self.processor.process_messages([]), {})
+        self.assertEqual(self.processor.last_batch_stats['messages'], 0)
+
+
+class DispatchBatchTests(MessageProcessorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.saved_rows = []
+        patcher = mock.patch.object(self.processor, '_save_processed_messages', side_effect=self.save_rows)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ai_check_task = self.patch_task('ai_check_task')
+        self.send_notification_task = self.patch_task('send_notification_task')
+
+    def patch_task(self, name):
+        patcher = mock.patch(f'apps.telegram_parser.tasks.{name}')
+        task = patcher.start()
+        self.addCleanup(patcher.stop)
+        return task
+
+    def save_rows(self, rows):
+        self.saved_rows.extend(rows)
+        return {
+            (row['user_data']['user__id'], row['message_data']['message_id'], row['message_data']['chat_id']): 100 + index
+            for index, row in enumerate(rows)
+        }
+
+    def test_saves_plain_matches_and_queues_notifications(self):
+        queued = self.processor.dispatch_batch([{'chat_id': -1001, 'message_id': 1, 'text': 'Сдам квартиру'}])
+
+        self.assertEqual(queued, 2)
+        self.assertEqual([row['user_data']['user__id'] for row in self.saved_rows], [10, 20])
+        self.assertEqual(
+            sorted((call.args[0], call.args[1], call.args[2]['user__id']) for call in self.send_notification_task.delay.call_args_list),
+            [(100, 1, 10), (101, 2, 20)],
+        )
+        self.ai_check_task.delay.assert_not_called()
+
+    def test_ai_groups_go_to_ai_stage(self):
+        self.groups[1].use_ai_filter = True
+        self.groups[1].ai_prompt = 'Только аренда'
+
+        queued = self.processor.dispatch_batch([{'chat_id': -1001, 'message_id': 1, 'text': 'Сдам квартиру'}])
+
+        self.assertEqual(queued, 2)
+        self.assertEqual([row['user_data']['user__id'] for row in self.saved_rows], [10])
+        self.ai_check_task.delay.assert_called_once()
+        message_data, user_data, group_id, keywords = self.ai_check_task.delay.call_args.args
+        self.assertEqual(message_data, {'chat_id': -1001, 'message_id': 1, 'text': 'Сдам квартиру'})
+        self.assertEqual((user_data['user__id'], group_id, keywords), (20, 2, ['квартир']))
+
+    def test_near_duplicate_reuses_original_verdict(self):
+        self.groups[1].use_ai_filter = True
+        self.groups[1].ai_prompt = 'Только аренда'
+        original = {'chat_id': -1002, 'message_id': 7}
+        verdict = {'ai_approved': False, 'ai_result': 'NO', 'ai_cached': False, 'ai_score': None, 'duplicate_of_id': 55}
+
+        with mock.patch.object(self.processor, '_find_originals', return_value={(20, 1, -1001): verdict}) as find_originals:
+            queued = self.processor.dispatch_batch([
+                {'chat_id': -1001, 'message_id': 1, 'text': 'Сдам квартиру', 'duplicate_of': original},
+            ])
+
+        find_originals.assert_called_once()
+        self.ai_check_task.delay.assert_not_called()
+        duplicate_row = [row for row in self.saved_rows if row['user_data']['user__id'] == 20][0]
+        self.assertEqual(duplicate_row['duplicate_of_id'], 55)
+        # Уведомление только пользователю без записи оригинала
+        self.assertEqual([call.args[2]['user__id'] for call in self.send_notification_task.delay.call_args_list], [10])
+        self.assertEqual(queued, 1)
+
+    def test_duplicates_are_marked_among_matched_messages(self):
+        matched = {'chat_id': -1001, 'message_id': 1, 'text': 'Сдам квартиру'}
+        unmatched = {'chat_id': -1001, 'message_id': 2, 'text': 'Продам велосипед'}
+
+        def mark_duplicates(messages):
+            messages[0]['duplicate_of'] = {'chat_id': -1002, 'message_id': 7}
+            return 1
+
+        with mock.patch('apps.telegram_parser.message_processor.near_duplicates.mark_duplicates',
+                        side_effect=mark_duplicates) as mark, \
+                mock.patch.object(self.processor, '_find_originals', return_value={}) as find_originals:
+            self.processor.dispatch_batch([matched, unmatched])
+
+        mark.assert_called_once_with([matched])
+        # Дубликат без записи оригинала обрабатывается отдельной фазой как обычное сообщение
+        self.assertEqual(find_originals.call_args_list[-1].args[0], [matched])
+        self.assertEqual(len(self.saved_rows), 2)
+
+    def test_failed_save_queues_nothing(self):
+        self.processor._save_processed_messages.side_effect = RuntimeError('db down')
+        self.groups[1].use_ai_filter = True
+        self.groups[1].ai_prompt = 'Только аренда'
+
+        with self.assertRaises(RuntimeError):
+            self.processor.dispatch_batch([{'chat_id': -1001, 'message_id': 1, 'text': 'Сдам квартиру'}])
+
+        self.ai_check_task.delay.assert_not_called()
+        self.send_notification_task.delay.assert_not_called()
+
+    def test_no_matches(self):
+        self.assertEqual(self.processor.dispatch_batch([{'chat_id': -1001, 'message_id': 1, 'text': 'Продам велосипед'}]), 0)
+        self.assertEqual(self.saved_rows, [])
@@ -0,0 +1,115 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.telegram_parser import near_duplicates
+from apps.telegram_parser.near_duplicates import BANDS, NearDuplicateIndex, band_keys, minhash, similarity
+from apps.telegram_parser.text_normalization import normalize_text
+
+from .test_routing import DictCache
+
+TEXT = 'Сдам однокомнатную квартиру в центре города на длительный срок без посредников'
+
+
+class BucketCache(DictCache):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def set_many(self, data, timeout=None):
+        self.writes += 1
+        self.data.update(data)
+
+
+def message(chat_id, message_id, text=TEXT):
+    return {'chat_id': chat_id, 'message_id': message_id, 'text': text}
+
+
+class MinHashTests(SimpleTestCase):
+    def test_similar_texts_share_hashes(self):
+        base = minhash(normalize_text(TEXT))
+        edited = minhash(normalize_text(TEXT + ', звоните'))
+        self.assertEqual(similarity(base, base), 1.0)
+        self.assertGreater(similarity(base, edited), 0.6)
+        self.assertLess(similarity(base, minhash('продам гараж в кирпичном кооперативе недорого')), 0.2)
+
+    def test_band_keys_are_stable(self):
+        signature = minhash('сдам квартиру')
+        self.assertEqual(band_keys(signature), band_keys(minhash('сдам квартиру')))
+        self.assertEqual(len(set(band_keys(signature))), BANDS)
+
+
+@override_settings(
+    PARSER_DUPLICATE_WINDOW=3600,
+    PARSER_DUPLICATE_BUCKET_SIZE=50,
+    PARSER_DUPLICATE_MIN_SIMILARITY=0.7,
+    PARSER_DUPLICATE_MIN_WORDS=8,
+)
+class NearDuplicateIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = BucketCache()
+        patcher = mock.patch.object(near_duplicates, 'cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = NearDuplicateIndex()
+
+    def test_copy_in_other_process_is_found(self):
+        self.assertEqual(self.index.mark_duplicates([message(-1001, 1)]), 0)
+        # Другой воркер видит подписи через общий кэш
+        copy = message(-1002, 5, TEXT + '!')
+        self.assertEqual(NearDuplicateIndex().mark_duplicates([copy]), 1)
+        self.assertEqual(copy['duplicate_of'], {'chat_id': -1001, 'message_id': 1})
+
+    def test_copy_in_same_batch_is_found(self):
+        original, copy = message(-1001, 1), message(-1002, 5)
+        self.index.mark_duplicates([original, copy])
+        self.assertNotIn('duplicate_of', original)
+        self.assertEqual(copy['duplicate_of'], {'chat_id': -1001, 'message_id': 1})
+        self.assertEqual(self.cache.writes, 1)
+
+    def test_copies_point_to_first_message(self):
+        self.index.mark_duplicates([message(-1001, 1)])
+        self.index.mark_duplicates([message(-1002, 2)])
+        third = message(-1003, 3)
+        self.index.mark_duplicates([third])
+        self.assertEqual(third['duplicate_of'], {'chat_id': -1001, 'message_id': 1})
+
+    def test_retry_does_not_match_itself(self):
+        original, copy = message(-1001, 1), message(-1002, 5)
+        self.index.mark_duplicates([original, copy])
+        retried = message(-1001, 1)
+        self.assertEqual(self.index.mark_duplicates([retried]), 0)
+        self.assertNotIn('duplicate_of', retried)
+        # Запись сообщения не дублируется в корзинах
+        self.assertTrue(all(len(bucket) == 2 for bucket in self.cache.data.values()))
+
+    def test_different_and_short_texts(self):
+        self.index.mark_duplicates([message(-1001, 1)])
+        other = message(-1002, 2, 'Продам гараж в кирпичном кооперативе недорого, есть погреб и свет')
+        short = message(-1002, 3, 'Сдам квартиру')
+        self.assertEqual(self.index.mark_duplicates([other, short]), 0)
+        self.assertEqual(self.index.get_stats()['skipped_short'], 1)
+
+    @override_settings(PARSER_DUPLICATE_WINDOW=0)
+    def test_expired_entries_are_ignored(self):
+        self.index.mark_duplicates([message(-1001, 1)])
+        with mock.patch('apps.telegram_parser.near_duplicates.time.time', return_value=10 ** 10):
+            self.assertEqual(self.index.mark_duplicates([message(-1002, 2)]), 0)
+
+    @override_settings(PARSER_DUPLICATE_BUCKET_SIZE=2)
+    def test_buckets_keep_newest_entries(self):
+        self.index.mark_duplicates([message(-1001, message_id) for message_id in range(1, 5)])
+        for bucket in self.cache.data.values():
+            self.assertEqual([entry[1] for entry in bucket], [(-1001, 3), (-1001, 4)])
+
+    def test_cache_failure_skips_detection(self):
+        with mock.patch.object(self.cache, 'get_many', side_effect=ConnectionError('redis down')):
+            with self.assertLogs('telegram_parser', level='ERROR'):
+                self.assertEqual(self.index.mark_duplicates([message(-1001, 1)]), 0)
+        self.assertEqual(self.index.get_stats()['errors'], 1)
+
+    def test_get_stats(self):
+        self.index.mark_duplicates([message(-1001, 1), message(-1002, 2)])
+        stats = self.index.get_stats()
+        self.assertEqual((stats['checked'], stats['duplicates'], stats['duplicate_ratio']), (2, 1, 0.5))
+        self.assertEqual(stats['avg_candidates'], 0.5)
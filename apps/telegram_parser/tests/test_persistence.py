@@ -0,0 +1,89 @@
+from django.test import TestCase
+
+from apps.telegram_parser.message_processor import MessageProcessor, make_verdict
+from apps.telegram_parser.models import GlobalChat, KeywordGroup, ProcessedMessage
+from apps.users.models import User
+
+
+class PersistDecisionsTests(TestCase):
+    """Сохранение совпадений одним upsert (на PostgreSQL) или по одной записи"""
+
+    def setUp(self):
+        self.processor = MessageProcessor()
+        self.chat = GlobalChat.objects.create(chat_id=-1001, name='Недвижимость')
+        self.users = [User.objects.create_user(username=f'user{index}', password='secret') for index in range(2)]
+        self.groups = [
+            KeywordGroup.objects.create(user=user, name='Квартиры', keywords=['квартир', 'сдам'])
+            for user in self.users
+        ]
+
+    def user_data(self, user):
+        return {
+            'user__id': user.id,
+            'user__username': user.username,
+            'user__notification_chat_id': None,
+            'global_chat__id': self.chat.id,
+            'global_chat__name': self.chat.name,
+            'global_chat__chat_id': self.chat.chat_id,
+        }
+
+    def message(self, message_id, text='Сдам квартиру'):
+        return {'chat_id': self.chat.chat_id, 'message_id': message_id, 'text': text, 'sender_id': 5, 'sender_name': 'Иван'}
+
+    def test_saves_all_matches_in_one_call(self):
+        message = self.message(1)
+        pending = [
+            (self.user_data(user), message, [(group, ['квартир'], make_verdict())])
+            for user, group in zip(self.users, self.groups)
+        ]
+
+        saved_ids, approved = self.processor._persist_decisions(pending)
+
+        self.assertEqual(len(saved_ids), 2)
+        self.assertEqual(set(approved), set(saved_ids))
+        for (user_id, message_id, chat_id), processed_id in saved_ids.items():
+            processed = ProcessedMessage.objects.get(id=processed_id)
+            self.assertEqual((processed.user_id, processed.message_id, processed.chat_id), (user_id, 1, -1001))
+            self.assertEqual(processed.global_chat_id, self.chat.id)
+            self.assertEqual(processed.matched_keywords, ['квартир'])
+            self.assertEqual(processed.message_link, 'https://t.me/c/1/1')
+            self.assertFalse(processed.notification_sent)
+
+    def test_merges_keywords_of_existing_record(self):
+        user, group = self.users[0], self.groups[0]
+        message = self.message(2)
+        first, _ = self.processor._persist_decisions([(self.user_data(user), message, [(group, ['квартир'], make_verdict())])])
+        second, _ = self.processor._persist_decisions([(self.user_data(user), message, [(group, ['квартир', 'сдам'], make_verdict())])])
+
+        self.assertEqual(first, second)
+        self.assertEqual(ProcessedMessage.objects.count(), 1)
+        self.assertCountEqual(ProcessedMessage.objects.get().matched_keywords, ['квартир', 'сдам'])
+
+    def test_one_record_per_user_and_message(self):
+        user, group = self.users[0], self.groups[0]
+        other_group = KeywordGroup.objects.create(user=user, name='Аренда', keywords=['сдам'])
+        message = self.message(3)
+        saved_ids, approved = self.processor._persist_decisions([(self.user_data(user), message, [
+            (group, ['квартир'], make_verdict(False, 'NO')),
+            (other_group, ['сдам'], make_verdict()),
+        ])])
+
+        processed = ProcessedMessage.objects.get(id=saved_ids[(user.id, 3, -1001)])
+        # Группа и ответ AI - от первой группы, ключевые слова объединены
+        self.assertEqual(processed.keyword_group_id, group.id)
+        self.assertFalse(processed.ai_approved)
+        self.assertEqual(processed.matched_keywords, ['квартир', 'сдам'])
+        # Уведомление - по первой одобренной группе
+        self.assertEqual(approved[(user.id, 3, -1001)][1], other_group)
+
+    def test_near_duplicates_are_not_approved(self):
+        user, group = self.users[0], self.groups[0]
+        original_ids, _ = self.processor._persist_decisions([(self.user_data(user), self.message(4), [(group, ['квартир'], make_verdict())])])
+        original_id = original_ids[(user.id, 4, -1001)]
+
+        saved_ids, approved = self.processor._persist_decisions([(self.user_data(user), self.message(5), [
+            (group, ['квартир'], make_verdict(duplicate_of_id=original_id)),
+        ])])
+
+        self.assertEqual(approved, {})
+        self.assertEqual(ProcessedMessage.objects.get(id=saved_ids[(user.id, 5, -1001)]).duplicate_of_id, original_id)
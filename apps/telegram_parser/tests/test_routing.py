@@ -0,0 +1,289 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.telegram_parser import routing
+from apps.telegram_parser.routing import CHANGE_KEY, VERSION_KEY, RoutingTable, record_change
+
+
+class DictCache:
+    """Кэш в словаре с интерфейсом django.core.cache (без TTL)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def get_many(self, keys):
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+    def add(self, key, value, timeout=None):
+        if key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    def incr(self, key, delta=1):
+        if key not in self.data:
+            raise ValueError(key)
+        self.data[key] += delta
+        return self.data[key]
+
+
+class FakeQuerySet:
+    """Минимальный QuerySet над списком строк: filter (точное и __in), order_by, values"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    @staticmethod
+    def _field(row, name):
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    def filter(self, **lookups):
+        rows = self.rows
+        for lookup, value in lookups.items():
+            if lookup.endswith('__in'):
+                name = lookup[:-4]
+                rows = [row for row in rows if self._field(row, name) in value]
+            else:
+                rows = [row for row in rows if self._field(row, lookup) == value]
+        return FakeQuerySet(rows)
+
+    def order_by(self, *fields):
+        return self
+
+    def values(self, *fields):
+        return [{field: row[field] for field in fields} for row in self.rows]
+
+    def values_list(self, field, flat=False):
+        return [row[field] for row in self.rows]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+def make_settings_row(settings_id, user_id, global_chat_id, chat_id, **flags):
+    row = {
+        'id': settings_id,
+        'user_id': user_id,
+        'global_chat_id': global_chat_id,
+        'global_chat__is_active': True,
+        'is_enabled': True,
+        'user__is_active': True,
+        'user__id': user_id,
+        'user__username': f'user{user_id}',
+        'user__notification_chat_id': user_id * 100,
+        'global_chat__id': global_chat_id,
+        'global_chat__name': f'chat{global_chat_id}',
+        'global_chat__chat_id': chat_id,
+    }
+    row.update(flags)
+    return row
+
+
+def make_group(group_id, user_id, is_active=True):
+    return SimpleNamespace(id=group_id, user_id=user_id, is_active=is_active)
+
+
+@override_settings(
+    ROUTING_CHECK_INTERVAL=0,
+    ROUTING_MAX_INCREMENTAL=200,
+    ROUTING_CHANGE_LOG_TTL=3600,
+    ROUTING_FULL_RELOAD_INTERVAL=3600,
+)
+class RoutingTableTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = DictCache()
+        self.settings_rows = [
+            make_settings_row(1, 10, 100, -1001),
+            make_settings_row(2, 20, 100, -1001),
+            make_settings_row(3, 20, 200, -1002),
+        ]
+        self.groups = [make_group(1, 10), make_group(2, 20), make_group(3, 20, is_active=False)]
+
+        user_settings = SimpleNamespace(objects=SimpleNamespace(filter=lambda **kw: FakeQuerySet(self.settings_rows).filter(**kw)))
+        keyword_group = SimpleNamespace(objects=SimpleNamespace(filter=lambda **kw: FakeQuerySet(self.groups).filter(**kw)))
+        for name, value in (('cache', self.cache), ('UserChatSettings', user_settings), ('KeywordGroup', keyword_group)):
+            patcher = mock.patch.object(routing, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.table = RoutingTable()
+
+    def user_ids(self, chat_id):
+        return [user_data['user__id'] for user_data in self.table.users_for_chat(chat_id)]
+
+    def group_ids(self):
+        return [group.id for group in self.table.groups()]
+
+    def test_first_refresh_loads_everything(self):
+        self.table.refresh()
+        self.assertEqual(self.user_ids(-1001), [10, 20])
+        self.assertEqual(self.user_ids(-1002), [20])
+        self.assertEqual(self.user_ids(-1003), [])
+        self.assertEqual(self.group_ids(), [1, 2])
+        self.assertEqual(self.table.full_reloads, 1)
+        self.assertEqual(self.table.version, 0)
+
+    def test_disabled_settings_are_not_routed(self):
+        self.settings_rows[1]['is_enabled'] = False
+        self.settings_rows[2]['user__is_active'] = False
+        self.table.refresh()
+        self.assertEqual(self.user_ids(-1001), [10])
+        self.assertEqual(self.user_ids(-1002), [])
+
+    def test_no_changes_keep_table(self):
+        self.table.refresh()
+        revision = self.table.groups_revision
+        self.table.refresh()
+        self.assertEqual(self.table.full_reloads, 1)
+        self.assertEqual(self.table.incremental_updates, 0)
+        self.assertEqual(self.table.groups_revision, revision)
+
+    @override_settings(ROUTING_CHECK_INTERVAL=60)
+    def test_check_interval_skips_version_read(self):
+        self.table.refresh()
+        record_change('reload')
+        self.table.refresh()
+        self.assertEqual(self.table.full_reloads, 1)
+
+    def test_groups_change_reloads_one_user(self):
+        self.table.refresh()
+        revision = self.table.groups_revision
+
+        self.groups.append(make_group(4, 10))
+        self.groups[1].is_active = False
+        record_change('groups', user_id=10)
+        record_change('groups', user_id=20)
+        self.table.refresh()
+
+        self.assertEqual(self.group_ids(), [1, 4])
+        self.assertEqual(self.table.groups_revision, revision + 1)
+        self.assertEqual(self.table.incremental_updates, 1)
+        self.assertEqual(self.table.full_reloads, 1)
+        self.assertEqual(self.table.version, 2)
+
+    def test_chat_change_reloads_one_chat(self):
+        self.table.refresh()
+        revision = self.table.groups_revision
+
+        self.settings_rows[0]['global_chat__is_active'] = False
+        self.settings_rows[1]['global_chat__is_active'] = False
+        record_change('chat', global_chat_id=100)
+        self.table.refresh()
+
+        self.assertEqual(self.user_ids(-1001), [])
+        self.assertEqual(self.user_ids(-1002), [20])
+        # Группы не менялись - автомат матчера перестраивать не нужно
+        self.assertEqual(self.table.groups_revision, revision)
+
+    def test_chat_id_change_moves_users(self):
+        self.table.refresh()
+        for row in self.settings_rows[:2]:
+            row['global_chat__chat_id'] = -1009
+        record_change('chat', global_chat_id=100)
+        self.table.refresh()
+
+        self.assertEqual(self.user_ids(-1001), [])
+        self.assertEqual(self.user_ids(-1009), [10, 20])
+
+    def test_user_change_reloads_chats_and_groups(self):
+        self.table.refresh()
+        for row in self.settings_rows[1:]:
+            row['user__is_active'] = False
+        self.groups[1].is_active = False
+        record_change('user', user_id=20)
+        self.table.refresh()
+
+        self.assertEqual(self.user_ids(-1001), [10])
+        self.assertEqual(self.user_ids(-1002), [])
+        self.assertEqual(self.group_ids(), [1])
+
+    def test_reload_change_rebuilds_table(self):
+        self.table.refresh()
+        record_change('groups', user_id=10)
+        record_change('reload')
+        self.table.refresh()
+        self.assertEqual(self.table.full_reloads, 2)
+        self.assertEqual(self.table.version, 2)
+
+    def test_expired_change_log_rebuilds_table(self):
+        self.table.refresh()
+        record_change('groups', user_id=10)
+        record_change('groups', user_id=20)
+        del self.cache.data[CHANGE_KEY.format(1)]
+        self.table.refresh()
+        self.assertEqual(self.table.full_reloads, 2)
+        self.assertEqual(self.table.incremental_updates, 0)
+
+    @override_settings(ROUTING_MAX_INCREMENTAL=2)
+    def test_too_many_changes_rebuild_table(self):
+        self.table.refresh()
+        for _ in range(3):
+            record_change('groups', user_id=10)
+        self.table.refresh()
+        self.assertEqual(self.table.full_reloads, 2)
+        self.assertEqual(self.table.version, 3)
+
+    def test_reset_counter_rebuilds_table(self):
+        for _ in range(3):
+            record_change('groups', user_id=10)
+        self.table.refresh()
+        self.assertEqual(self.table.version, 3)
+
+        self.cache.data.clear()
+        record_change('groups', user_id=10)
+        self.table.refresh()
+        self.assertEqual(self.table.full_reloads, 2)
+        self.assertEqual(self.table.version, 1)
+
+    @override_settings(ROUTING_FULL_RELOAD_INTERVAL=0)
+    def test_full_reload_interval(self):
+        self.table.refresh()
+        self.table.refresh()
+        self.assertEqual(self.table.full_reloads, 2)
+
+    def test_cache_failure_keeps_loaded_table(self):
+        self.table.refresh()
+        with mock.patch.object(self.cache, 'get', side_effect=ConnectionError('redis down')):
+            with self.assertLogs('telegram_parser', level='ERROR'):
+                self.table.refresh()
+        self.assertEqual(self.table.full_reloads, 1)
+        self.assertEqual(self.user_ids(-1001), [10, 20])
+
+    def test_get_stats(self):
+        self.table.refresh()
+        self.assertEqual(self.table.get_stats(), {
+            'version': 0,
+            'chats': 2,
+            'users_with_groups': 2,
+            'full_reloads': 1,
+            'incremental_updates': 0,
+        })
+
+
+class RecordChangeTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = DictCache()
+        patcher = mock.patch.object(routing, 'cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_creates_counter_and_logs_changes(self):
+        record_change('groups', user_id=10)
+        record_change('chat', global_chat_id=100)
+        self.assertEqual(self.cache.get(VERSION_KEY), 2)
+        self.assertEqual(self.cache.get(CHANGE_KEY.format(1)), {'kind': 'groups', 'user_id': 10})
+        self.assertEqual(self.cache.get(CHANGE_KEY.format(2)), {'kind': 'chat', 'global_chat_id': 100})
+
+    def test_cache_failure_is_logged(self):
+        with mock.patch.object(self.cache, 'incr', side_effect=ConnectionError('redis down')):
+            with self.assertLogs('telegram_parser', level='ERROR'):
+                record_change('reload')
+        self.assertIsNone(self.cache.get(VERSION_KEY))
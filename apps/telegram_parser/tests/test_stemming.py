@@ -0,0 +1,100 @@
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase
+
+from apps.telegram_parser import stemming
+from apps.telegram_parser.keyword_matcher import KeywordMatcher
+
+from .test_keyword_matcher import FakeRoutingTable, make_group
+
+
+class PrefixStemmer:
+    """Стеммер для тестов: основа - первые пять букв слова"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def stemWord(self, word):
+        self.calls += 1
+        return word[:5]
+
+
+class FakeStemmerMixin:
+    def setUp(self):
+        super().setUp()
+        self.stemmer = PrefixStemmer()
+        patcher = mock.patch.object(stemming, '_get_stemmer', return_value=self.stemmer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        stemming.stem_word.cache_clear()
+        self.addCleanup(stemming.stem_word.cache_clear)
+
+
+class StemmingTests(FakeStemmerMixin, SimpleTestCase):
+    def test_stem_phrase(self):
+        self.assertEqual(stemming.stem_phrase('доставка грузов'), 'доста грузо')
+        self.assertEqual(stemming.stem_phrase(''), '')
+
+    def test_words_are_memoized(self):
+        stemming.stem_phrase('доставка доставка доставка')
+        self.assertEqual(self.stemmer.calls, 1)
+        self.assertEqual(stemming.get_stats(), {'cache_size': 1, 'hit_rate': 0.667})
+
+    def test_text_stems_are_cached_in_message_data(self):
+        message_data = {'text': 'Доставка ГРУЗОВ!'}
+        self.assertEqual(stemming.get_text_stems(message_data), ['доста', 'грузо'])
+        self.assertEqual(message_data['text_normalized'], 'доставка грузов')
+
+        message_data['text_stems'] = ['кэш']
+        self.assertEqual(stemming.get_text_stems(message_data), ['кэш'])
+
+
+class StemMatchingTests(FakeStemmerMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.routing = FakeRoutingTable([])
+        patcher = mock.patch('apps.telegram_parser.keyword_matcher.routing_table', self.routing)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.matcher = KeywordMatcher()
+
+    def match(self, text):
+        return {
+            user_id: [(group.id, keywords) for group, keywords in matches]
+            for user_id, matches in self.matcher.match({'text': text}).items()
+        }
+
+    def test_phrase_matches_any_word_form(self):
+        self.routing.replace([make_group(1, 10, ['доставка грузов'], use_stemming=True)])
+        self.assertEqual(self.match('Нужна доставку грузовика'), {10: [(1, ['доставка грузов'])]})
+        self.assertEqual(self.match('грузов доставка'), {})
+
+    def test_stems_match_whole_words_only(self):
+        self.routing.replace([make_group(1, 10, ['кот'], use_stemming=True)])
+        self.assertEqual(self.match('котлета'), {})
+        self.assertEqual(self.match('кот'), {10: [(1, ['кот'])]})
+
+    def test_plain_and_stem_groups_share_text(self):
+        self.routing.replace([
+            make_group(1, 10, ['доставка'], use_stemming=True),
+            make_group(2, 20, ['доставка']),
+        ])
+        self.assertEqual(self.match('доставку'), {10: [(1, ['доставка'])]})
+        self.assertEqual(self.match('доставка'), {10: [(1, ['доставка'])], 20: [(2, ['доставка'])]})
+
+    def test_stemming_wins_over_fuzzy(self):
+        self.routing.replace([make_group(1, 10, ['доставка'], use_stemming=True, fuzzy_max_distance=1)])
+        self.assertEqual(self.match('дастовка'), {})
+        self.assertEqual(len(self.matcher.refresh().fuzzy_index), 0)
+
+    def test_get_stats(self):
+        self.routing.replace([make_group(1, 10, ['доставка', 'доставка грузов'], use_stemming=True)])
+        self.matcher.refresh()
+        self.assertEqual(self.matcher.get_stats()['stem_phrases'], 2)
+
+
+@skipUnless(stemming.is_available(), 'snowballstemmer не установлен')
+class SnowballStemmerTests(SimpleTestCase):
+    def test_word_forms_share_stem(self):
+        stems = {stemming.stem_phrase(word) for word in ('доставка', 'доставку', 'доставки', 'доставкой')}
+        self.assertEqual(len(stems), 1)
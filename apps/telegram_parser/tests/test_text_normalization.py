@@ -0,0 +1,66 @@
+from django.test import SimpleTestCase
+
+from apps.telegram_parser.text_normalization import get_normalized_text, normalize_text
+
+
+class NormalizeTextTests(SimpleTestCase):
+    def test_empty(self):
+        self.assertEqual(normalize_text(''), '')
+        self.assertEqual(normalize_text(None), '')
+        self.assertEqual(normalize_text(' \u200b '), '')
+
+    def test_case_yo_and_punctuation(self):
+        self.assertEqual(normalize_text('Ёлка, ЁЖИК!!! — и   всё...'), 'елка ежик и все')
+
+    def test_invisible_characters(self):
+        self.assertEqual(normalize_text('ку\u200bп\u00adлю\ufeff'), 'куплю')
+
+    def test_nfkc(self):
+        self.assertEqual(normalize_text('ｋｖａｒｔｉｒａ ²'), 'kvartira 2')
+
+    def test_latin_lookalikes_in_mixed_words(self):
+        # "куплю" с латинскими "к" и "у"
+        self.assertEqual(normalize_text('kyплю'), 'куплю')
+        # Чисто латинские слова не трогаем
+        self.assertEqual(normalize_text('Toyota Camry'), 'toyota camry')
+
+    def test_emoji_between_letters(self):
+        self.assertEqual(normalize_text('ку🔥плю'), 'ку плю')
+
+    def test_stretched_letters(self):
+        self.assertEqual(normalize_text('оооочень срочнооооо'), 'очень срочно')
+
+    def test_triple_letters_are_kept(self):
+        self.assertEqual(normalize_text('ООО «Вектор»'), 'ооо вектор')
+        self.assertEqual(normalize_text('ИИИ'), 'иии')
+        self.assertEqual(normalize_text('длинношеее'), 'длинношеее')
+
+    def test_spaced_letters_are_joined(self):
+        self.assertEqual(normalize_text('К У П Л Ю квартиру'), 'куплю квартиру')
+        self.assertEqual(normalize_text('с к и д к а'), 'скидка')
+
+    def test_short_spaced_runs_are_kept(self):
+        self.assertEqual(normalize_text('т е с'), 'т е с')
+        self.assertEqual(normalize_text('а и б'), 'а и б')
+
+    def test_one_letter_words_are_kept(self):
+        self.assertEqual(normalize_text('я и в с тобой'), 'я и в с тобой')
+        self.assertEqual(normalize_text('к у о я'), 'к у о я')
+
+    def test_spaced_letters_next_to_words_are_kept(self):
+        self.assertEqual(normalize_text('привет а б в г'), 'привет абвг')
+        self.assertEqual(normalize_text('ab c d e'), 'ab c d e')
+
+
+class GetNormalizedTextTests(SimpleTestCase):
+    def test_caches_in_message_data(self):
+        message_data = {'text': 'Куплю КВАРТИРУ'}
+        self.assertEqual(get_normalized_text(message_data), 'куплю квартиру')
+        self.assertEqual(message_data['text_normalized'], 'куплю квартиру')
+
+        message_data['text_normalized'] = 'кэш'
+        self.assertEqual(get_normalized_text(message_data), 'кэш')
+
+    def test_missing_text(self):
+        self.assertEqual(get_normalized_text({'text': None}), '')
+        self.assertEqual(get_normalized_text({}), '')
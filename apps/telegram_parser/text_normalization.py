@@ -0,0 +1,95 @@
+"""
+Нормализация текста перед поиском ключевых слов
+
+Спам и реклама обходят подстрочный поиск латинскими буквами-двойниками
+внутри русских слов, заменой ё/е, невидимыми символами, растянутыми
+буквами и эмодзи между буквами. Текст сообщения и ключевые слова
+приводятся к одной форме одной и той же функцией normalize_text().
+"""
+import re
+import unicodedata
+from typing import Any, Dict
+
+# Невидимые символы: zero-width, управление направлением текста, мягкий перенос,
+# вариационные селекторы и "пустые" буквы хангыля, которыми заполняют промежутки
+_INVISIBLE = dict.fromkeys(
+    [0x00AD, 0x034F, 0x061C, 0x115F, 0x1160, 0x17B4, 0x17B5, 0x180E, 0x3164, 0xFEFF, 0xFFA0]
+    + list(range(0x200B, 0x2010))
+    + list(range(0x202A, 0x202F))
+    + list(range(0x2060, 0x2070))
+    + list(range(0xFE00, 0xFE10))
+)
+
+# Латинские двойники кириллических букв (после casefold)
+_LATIN_TO_CYRILLIC = str.maketrans({
+    'a': 'а',
+    'b': 'в',
+    'c': 'с',
+    'e': 'е',
+    'h': 'н',
+    'k': 'к',
+    'm': 'м',
+    'n': 'п',
+    'o': 'о',
+    'p': 'р',
+    'r': 'г',
+    't': 'т',
+    'x': 'х',
+    'y': 'у',
+})
+
+_NON_WORD_RE = re.compile(r'[\W_]+')
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'[а-я]')
+_LATIN_RE = re.compile(r'[a-z]')
+# Буква, повторенная 4+ раз подряд ("оооочень"). Тройные буквы встречаются
+# в обычном тексте ("ООО", "длинношеее"), поэтому их не трогаем
+_STRETCHED_RE = re.compile(r'([^\W\d_])\1{3,}')
+# Слово, написанное по буквам через пробел, от 4 букв ("к у п л ю")
+_SPACED_RE = re.compile(r'(?<!\w)(?:[^\W\d_] ){3,}[^\W\d_](?!\w)')
+# Однобуквенные слова: цепочка только из них - обычная речь ("я и в с тобой")
+_ONE_LETTER_WORDS = frozenset('вскиуоя')
+
+
+def _fold_mixed_word(match: re.Match) -> str:
+    """Латинские двойники меняются на кириллицу только в словах со смешанным алфавитом"""
+    word = match.group(0)
+    if _CYRILLIC_RE.search(word) and _LATIN_RE.search(word):
+        return word.translate(_LATIN_TO_CYRILLIC)
+    return word
+
+
+def _join_spaced_word(match: re.Match) -> str:
+    letters = match.group(0).split(' ')
+    if all(letter in _ONE_LETTER_WORDS for letter in letters):
+        return match.group(0)
+    return ''.join(letters)
+
+
+def normalize_text(text: str) -> str:
+    """Нормализованная форма текста для поиска ключевых слов
+
+    NFKC, удаление невидимых символов, casefold, ё -> е, пунктуация и
+    эмодзи -> пробел, латинские двойники в смешанных словах -> кириллица,
+    растянутые буквы (4+ подряд) -> одна, слова "по буквам" (от 4 букв, не
+    только из однобуквенных слов) склеиваются, пробелы схлопываются.
+    """
+    if not text:
+        return ''
+
+    text = unicodedata.normalize('NFKC', text)
+    text = text.translate(_INVISIBLE)
+    text = text.casefold().replace('ё', 'е')
+    text = _NON_WORD_RE.sub(' ', text)
+    text = _WORD_RE.sub(_fold_mixed_word, text)
+    text = _STRETCHED_RE.sub(r'\1', text)
+    text = ' '.join(text.split())
+    return _SPACED_RE.sub(_join_spaced_word, text)
+
+
+def get_normalized_text(message_data: Dict[str, Any]) -> str:
+    """Нормализованный текст сообщения (считается один раз и хранится в message_data)"""
+    normalized = message_data.get('text_normalized')
+    if normalized is None:
+        normalized = message_data['text_normalized'] = normalize_text(message_data.get('text') or '')
+    return normalized
@@ -74,6 +74,15 @@ DATABASES = {
     }
 }
 
+# Cache (Redis): общие счетчики и журналы для всех процессов
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default='redis://localhost:6379/1'),
+        'KEY_PREFIX': 'telegram_parser',
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -128,6 +137,85 @@ TELEGRAM_NOTIFICATION_BOT_TOKEN = '7193620780:AAEM_QlyHeGMFbppRp2Uw7ObBrL73lEjkL
 # Grok AI settings (использует OpenAI-совместимый API)
 OPENAI_API_KEY = config('OPENAI_API_KEY')
 OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='https://api.x.ai/v1')
+AI_MODEL = config('AI_MODEL', default='grok-3-mini')
+# Пул соединений AI клиента (одновременных запросов на процесс) и время жизни простаивающего соединения (секунды)
+AI_MAX_CONNECTIONS = config('AI_MAX_CONNECTIONS', default=20, cast=int)
+AI_KEEPALIVE_EXPIRY = config('AI_KEEPALIVE_EXPIRY', default=60.0, cast=float)
+# Таймаут запроса к AI (секунды) и число повторов SDK при сетевых ошибках и 429/5xx
+AI_TIMEOUT = config('AI_TIMEOUT', default=30.0, cast=float)
+AI_MAX_RETRIES = config('AI_MAX_RETRIES', default=2, cast=int)
+# Пакетные AI проверки: максимум сообщений с одним промптом в запросе (1 - без пачек) и окно накопления (секунды)
+AI_BATCH_MAX_SIZE = config('AI_BATCH_MAX_SIZE', default=10, cast=int)
+AI_BATCH_WAIT = config('AI_BATCH_WAIT', default=0.2, cast=float)
+# Общий кэш ответов AI по (модель, промпт, нормализованный текст): время жизни (секунды, 0 - выключен) и максимум записей
+AI_VERDICT_CACHE_TTL = config('AI_VERDICT_CACHE_TTL', default=86400, cast=int)
+AI_VERDICT_CACHE_MAX_ENTRIES = config('AI_VERDICT_CACHE_MAX_ENTRIES', default=100000, cast=int)
+# Локальный классификатор лидов: уверенные оценки решают без AI, середина идет в Grok
+AI_CLASSIFIER_ENABLED = config('AI_CLASSIFIER_ENABLED', default=True, cast=bool)
+AI_CLASSIFIER_APPROVE_THRESHOLD = config('AI_CLASSIFIER_APPROVE_THRESHOLD', default=0.97, cast=float)
+AI_CLASSIFIER_REJECT_THRESHOLD = config('AI_CLASSIFIER_REJECT_THRESHOLD', default=0.03, cast=float)
+# Минимум оценок каждого класса и точность уверенных ответов на отложенной выборке для включения модели
+AI_CLASSIFIER_MIN_SAMPLES = config('AI_CLASSIFIER_MIN_SAMPLES', default=30, cast=int)
+AI_CLASSIFIER_MIN_ACCURACY = config('AI_CLASSIFIER_MIN_ACCURACY', default=0.95, cast=float)
+# Как часто воркеры перечитывают обученные модели (секунды)
+AI_CLASSIFIER_RELOAD_INTERVAL = config('AI_CLASSIFIER_RELOAD_INTERVAL', default=300, cast=float)
+
+# Master parser tuning
+# Буфер сырых сообщений: сброс в БД по размеру или по возрасту (секунды)
+PARSER_RAW_BUFFER_SIZE = config('PARSER_RAW_BUFFER_SIZE', default=200, cast=int)
+PARSER_RAW_BUFFER_MAX_AGE = config('PARSER_RAW_BUFFER_MAX_AGE', default=2.0, cast=float)
+# Сколько элементов буфер копит, пока запись не проходит (сверх - вытесняются самые старые)
+PARSER_BUFFER_MAX_PENDING = config('PARSER_BUFFER_MAX_PENDING', default=20000, cast=int)
+# Очередь ingest-пайплайна: емкость, число воркеров, политика переполнения
+# (block | drop_newest | drop_oldest) и таймаут дообработки очереди при остановке (секунды)
+PARSER_QUEUE_SIZE = config('PARSER_QUEUE_SIZE', default=5000, cast=int)
+PARSER_WORKERS = config('PARSER_WORKERS', default=4, cast=int)
+PARSER_QUEUE_OVERFLOW = config('PARSER_QUEUE_OVERFLOW', default='block')
+PARSER_DRAIN_TIMEOUT = config('PARSER_DRAIN_TIMEOUT', default=30.0, cast=float)
+# Пачки сообщений для Celery: размер и максимальное ожидание (секунды)
+PARSER_DISPATCH_BATCH_SIZE = config('PARSER_DISPATCH_BATCH_SIZE', default=50, cast=int)
+PARSER_DISPATCH_MAX_WAIT = config('PARSER_DISPATCH_MAX_WAIT', default=1.0, cast=float)
+# Интервал сброса счетчиков и heartbeat в BotStatus (секунды)
+PARSER_STATUS_FLUSH_INTERVAL = config('PARSER_STATUS_FLUSH_INTERVAL', default=5.0, cast=float)
+# Стартовая проверка доступности чатов: параллелизм, повторы при FloodWait, шаг прогресса
+PARSER_PROBE_CONCURRENCY = config('PARSER_PROBE_CONCURRENCY', default=10, cast=int)
+PARSER_PROBE_FLOOD_RETRIES = config('PARSER_PROBE_FLOOD_RETRIES', default=3, cast=int)
+PARSER_PROBE_PROGRESS_EVERY = config('PARSER_PROBE_PROGRESS_EVERY', default=50, cast=int)
+# Снапшот состояния парсера для быстрого перезапуска и срок доверия проверке доступа (секунды)
+PARSER_STATE_FILE = config('PARSER_STATE_FILE', default=str(BASE_DIR / 'parser_state.json'))
+PARSER_CHAT_VERIFY_TTL = config('PARSER_CHAT_VERIFY_TTL', default=6 * 3600, cast=int)
+# Догрузка пропущенных за простой сообщений: параллелизм и лимит сообщений на чат,
+# срок одного прохода с повторами и пауза перед проходом по недогруженным чатам (секунды),
+# размер окна дедупликации недавно обработанных сообщений
+PARSER_CATCHUP_CONCURRENCY = config('PARSER_CATCHUP_CONCURRENCY', default=5, cast=int)
+PARSER_CATCHUP_LIMIT = config('PARSER_CATCHUP_LIMIT', default=500, cast=int)
+PARSER_CATCHUP_DEADLINE = config('PARSER_CATCHUP_DEADLINE', default=600, cast=float)
+PARSER_CATCHUP_RETRY_DELAY = config('PARSER_CATCHUP_RETRY_DELAY', default=60, cast=float)
+PARSER_SEEN_CACHE_SIZE = config('PARSER_SEEN_CACHE_SIZE', default=20000, cast=int)
+# Кэш сущностей чатов/отправителей: размер и TTL (секунды)
+PARSER_ENTITY_CACHE_SIZE = config('PARSER_ENTITY_CACHE_SIZE', default=10000, cast=int)
+PARSER_ENTITY_CACHE_TTL = config('PARSER_ENTITY_CACHE_TTL', default=3600, cast=float)
+# Поиск почти-дубликатов между чатами на стадии match (индекс LSH в общем кэше):
+# окно (секунды), подписей в одной корзине LSH, порог сходства (0..1)
+# и минимальная длина проверяемого текста (слов)
+PARSER_DUPLICATE_WINDOW = config('PARSER_DUPLICATE_WINDOW', default=3600, cast=float)
+PARSER_DUPLICATE_BUCKET_SIZE = config('PARSER_DUPLICATE_BUCKET_SIZE', default=50, cast=int)
+PARSER_DUPLICATE_MIN_SIMILARITY = config('PARSER_DUPLICATE_MIN_SIMILARITY', default=0.7, cast=float)
+PARSER_DUPLICATE_MIN_WORDS = config('PARSER_DUPLICATE_MIN_WORDS', default=8, cast=int)
+
+# Таблица маршрутизации в воркерах: как часто сверять версию с общей (секунды),
+# сколько изменений применять инкрементально, время жизни журнала изменений
+# и страховочная полная перезагрузка (секунды)
+ROUTING_CHECK_INTERVAL = config('ROUTING_CHECK_INTERVAL', default=1.0, cast=float)
+ROUTING_MAX_INCREMENTAL = config('ROUTING_MAX_INCREMENTAL', default=200, cast=int)
+ROUTING_CHANGE_LOG_TTL = config('ROUTING_CHANGE_LOG_TTL', default=3600, cast=int)
+ROUTING_FULL_RELOAD_INTERVAL = config('ROUTING_FULL_RELOAD_INTERVAL', default=3600, cast=float)
+# Размер кэша слово -> основа для групп с морфологическим поиском
+STEM_CACHE_SIZE = config('STEM_CACHE_SIZE', default=100000, cast=int)
+# Бюджет времени на поиск регулярок ключевых слов в одном сообщении (секунды)
+KEYWORD_REGEX_TIME_BUDGET = config('KEYWORD_REGEX_TIME_BUDGET', default=0.05, cast=float)
+# Фразы короче этого числа букв в нечетком поиске ищутся только точно
+KEYWORD_FUZZY_MIN_LENGTH = config('KEYWORD_FUZZY_MIN_LENGTH', default=5, cast=int)
 
 # Celery Configuration
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
@@ -136,6 +224,14 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Конвейер обработки сообщений: match (CPU), ai и notify (ожидание сети) -
+# отдельные очереди, чтобы у каждой стадии были свои воркеры и concurrency
+CELERY_TASK_ROUTES = {
+    'apps.telegram_parser.tasks.process_message_task': {'queue': 'match'},
+    'apps.telegram_parser.tasks.process_message_batch_task': {'queue': 'match'},
+    'apps.telegram_parser.tasks.ai_check_task': {'queue': 'ai'},
+    'apps.telegram_parser.tasks.send_notification_task': {'queue': 'notify'},
+}
 
 # Logging
 LOGGING = {
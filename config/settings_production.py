@@ -82,6 +82,11 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'apps.telegram_parser.tasks.reset_daily_message_counter',
         'schedule': crontab(hour=0, minute=0),
     },
+    # Обучение локальных классификаторов лидов каждые 6 часов
+    'train-lead-classifiers': {
+        'task': 'apps.telegram_parser.tasks.train_lead_classifiers',
+        'schedule': crontab(hour='*/6', minute=30),
+    },
 }
 
 # Настройки Celery
@@ -34,7 +34,7 @@ sudo systemctl restart telegram-parser
 
 # 7. Перезапускаем Celery worker
 echo "🔄 Restarting Celery..."
-sudo systemctl restart telegram-parser-celery
+sudo systemctl restart telegram-parser-celery telegram-parser-celery-ai telegram-parser-celery-notify
 
 # 8. Перезапускаем Celery beat (если используется)
 # sudo systemctl restart telegram-parser-celery-beat